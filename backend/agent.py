@@ -3,17 +3,45 @@ Ticket analysis using LangChain + Groq (Llama 3.1 70B).
 
 OPTIMISATION:  Analysis + draft reply are produced in a **single** LLM call
 so each email costs only 1 API request (Groq free tier = 30 req/min).
+
+aanalyze_and_draft() / aanalyze_ticket() are the async variants (chain
+``ainvoke`` over an httpx.AsyncClient) for the FastAPI handlers, which
+run them concurrently with urgency_classifier.aclassify_urgency().
+
+An email that is a near-duplicate of one already analysed (near_dup.py —
+same template, different greeting / reference / amount) reuses that
+analysis; only its entities are re-extracted, by rule (entity_rules.py).
+
+ANALYSIS_MODE=cascade: callers classify urgency first and use
+analyze_cascade(); confidently Low-urgency mail (thank-you notes,
+statement requests, ...) gets a small 8B extraction call plus the
+template draft of generate_draft_response() instead of the 70B call.
+
+DRAFT_MODE=lazy: ingestion stores the analysis only (analyze_for_ticket,
+far fewer output tokens); generate_draft() writes the reply when a
+ticket is first opened (see drafts.py).
 """
 
 import os
+import asyncio
+import re
 import hashlib
 from functools import lru_cache
 from dotenv import load_dotenv
 
 from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
-
-from schemas import TicketAnalysis, TicketAnalysisWithDraft
+from langchain_core.output_parsers import StrOutputParser
+
+from schemas import TicketAnalysis, TicketAnalysisWithDraft, Priority, Category
+from llm_scheduler import scheduler, estimate_tokens
+from email_trim import trim_for_llm
+from cache import BoundedCache
+from llm_cache import PersistentCache, prompt_version
+from near_dup import NearDupIndex
+from entity_rules import extract_entities
+from single_flight import SingleFlight
+from urgency_classifier import get_parent_category
 
 # ── Load env ──
 load_dotenv()
@@ -28,12 +56,26 @@ if not GROQ_API_KEY:
 
 # ────────────────────── LLM Setup ──────────────────────
 
+MODEL = "llama-3.3-70b-versatile"
+EXTRACTION_MODEL = "llama-3.1-8b-instant"   # cascade mode, Low-urgency mail
+
+# "combined" (70B analysis + draft for every email) or "cascade" (see
+# analyze_cascade: Low urgency with at least CASCADE_MIN_CONFIDENCE skips the 70B)
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "combined").strip().lower()
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.8"))
+
+# "eager" (ingestion drafts every reply) or "lazy" (draft on first view)
+DRAFT_MODE = os.getenv("DRAFT_MODE", "eager").strip().lower()
+
 llm = ChatGroq(
-    model="llama-3.3-70b-versatile",
+    model=MODEL,
     api_key=GROQ_API_KEY,
     temperature=0,            # deterministic for classification
     max_tokens=2048,          # enough for analysis + full draft
     request_timeout=60,
+    max_retries=0,            # llm_scheduler paces + retries 429s
+    http_client=scheduler.http_client(60),  # feeds x-ratelimit-* headers back
+    http_async_client=scheduler.async_http_client(60),
 )
 
 # Structured output — forces the LLM to return valid JSON matching
@@ -156,15 +198,263 @@ analysis_only_prompt = ChatPromptTemplate.from_messages([
 combined_chain = combined_prompt | structured_llm
 analysis_only_chain = analysis_only_prompt | structured_llm_analysis_only
 
-# ────────────────────── In-memory cache ──────────────────────
-# Prevents re-analysing the exact same email body within one server session.
-_cache: dict[str, TicketAnalysisWithDraft] = {}
+# ────────────────────── Draft-only Prompt (DRAFT_MODE=lazy) ──────────────────────
+# Same reply rules as PART B of the combined prompt, applied to a stored
+# analysis; returns plain text.
+
+DRAFT_SYSTEM_PROMPT = (
+    "You are a professional customer support writer for a finance support "
+    "desk. Write the reply to the customer email, using the triage analysis "
+    "provided.\n\n"
+    + COMBINED_SYSTEM_PROMPT.split("═══ PART B — DRAFT REPLY RULES ═══")[1].split("Return ALL fields")[0].strip()
+    + "\n\nReturn ONLY the reply text."
+)
+
+draft_prompt = ChatPromptTemplate.from_messages([
+    ("system", DRAFT_SYSTEM_PROMPT),
+    ("human",
+     "Triage analysis — category: {category}; priority: {priority}; sentiment: {sentiment}; "
+     "customer name: {customer_name}; intent: {intent}; summary: {summary}\n\n"
+     "Customer email:\n\n{email_body}"),
+])
+
+draft_chain = draft_prompt | llm | StrOutputParser()
+
+# ────────────────────── Extraction Prompt (cascade) ──────────────────────
+# Low-urgency mail only needs sentiment / intent / entities / summary; the
+# priority and category are already known from the urgency classifier and
+# the draft comes from the templates, so a small model and prompt suffice.
+
+extraction_llm = ChatGroq(
+    model=EXTRACTION_MODEL,
+    api_key=GROQ_API_KEY,
+    temperature=0,
+    max_tokens=400,
+    request_timeout=30,
+    max_retries=0,
+    http_client=scheduler.http_client(30),
+    http_async_client=scheduler.async_http_client(30),
+)
+
+EXTRACTION_SYSTEM_PROMPT = """You extract fields from a routine, low-urgency customer email for a \
+finance support desk. Return JSON only.
+
+SENTIMENT — Exactly one of: Positive, Negative, Neutral, Urgent
+INTENT — Short phrase (5-10 words) describing what the customer wants.
+ENTITIES — customer_name, transaction_id, amount (null if not found).
+PRIORITY — Low.
+CATEGORY — General.
+SUMMARY — Concise 1-2 sentence summary for the support agent.
+"""
+
+extraction_prompt = ChatPromptTemplate.from_messages([
+    ("system", EXTRACTION_SYSTEM_PROMPT),
+    ("human", "Email (pre-classified as {subcategory}):\n\n{email_body}"),
+])
+
+extraction_chain = extraction_prompt | extraction_llm.with_structured_output(TicketAnalysis)
+
+# Token budget per call (prompt + typical completion) for llm_scheduler
+_COMBINED_TOKENS = estimate_tokens(COMBINED_SYSTEM_PROMPT, 600)
+_ANALYSIS_ONLY_TOKENS = estimate_tokens(ANALYSIS_ONLY_SYSTEM_PROMPT, 250)
+_EXTRACTION_TOKENS = estimate_tokens(EXTRACTION_SYSTEM_PROMPT, 200)
+_DRAFT_TOKENS = estimate_tokens(DRAFT_SYSTEM_PROMPT, 300)
+
+# ────────────────────── Caches ──────────────────────
+# Prevents re-analysing the exact same email body: a bounded in-memory LRU
+# (ANALYSIS_CACHE_*) in front of the llm_cache table, which survives
+# restarts and is shared by every worker.  The version hash changes with
+# the prompt or schema, so edits invalidate stored analyses.
+_cache = BoundedCache("analysis")
+_store = PersistentCache(
+    "analysis", MODEL, prompt_version(COMBINED_SYSTEM_PROMPT, TicketAnalysisWithDraft.model_json_schema()),
+)
+# Template emails that differ only in names / references / amounts
+_near_duplicates = NearDupIndex("near_duplicate")
+# Concurrent misses for the same email share one LLM call
+_flight = SingleFlight("single_flight:analysis")
+# Analysis-only results (/analyze, DRAFT_MODE=lazy ingestion) are cached
+# separately, so a draft-less result never answers analyze_and_draft()
+_analysis_only_cache = BoundedCache("analysis_only")
+_analysis_only_store = PersistentCache(
+    "analysis_only", MODEL, prompt_version(ANALYSIS_ONLY_SYSTEM_PROMPT, TicketAnalysis.model_json_schema()),
+)
+_analysis_only_near_duplicates = NearDupIndex("near_duplicate:analysis_only")
+# Cascade extractions (8B, no draft) are cached separately
+_light_cache = BoundedCache("analysis_light")
+_light_store = PersistentCache(
+    "analysis_light", EXTRACTION_MODEL, prompt_version(EXTRACTION_SYSTEM_PROMPT, TicketAnalysis.model_json_schema()),
+)
+
+# Stand-ins when a reused analysis mentions an entity the new email lacks
+_ENTITY_PLACEHOLDERS = {"customer_name": "Customer", "transaction_id": "[transaction ID]", "amount": "[amount]"}
+_MIN_SWAP_CHARS = 3   # "Al", "$5": too likely to occur inside other words / amounts
+
+
+def _whole_word(value: str) -> re.Pattern:
+    """``value`` not preceded or followed by a word character ("$50" ≠ "$500", "Al" ≠ "Also")."""
+    return re.compile(rf"(?<!\w){re.escape(value)}(?!\w)")
 
 
 def _cache_key(text: str) -> str:
     return hashlib.sha256(text.encode()).hexdigest()
 
 
+def _prepare(email_body: str) -> tuple[str, str]:
+    """Validate and trim the email; returns (LLM input, cache key)."""
+    if not email_body or not email_body.strip():
+        raise ValueError("email_body cannot be empty.")
+    # Newest message only: quoted history / signatures cost tokens, not insight
+    clean = trim_for_llm(email_body.strip())
+    return clean, _cache_key(clean)
+
+
+def _stored(key: str) -> TicketAnalysisWithDraft | None:
+    """Analysis from the durable cache, promoted into the in-memory one."""
+    stored = _store.get(key)
+    if stored is None:
+        return None
+    try:
+        result = TicketAnalysisWithDraft.model_validate(stored)
+    except ValueError:
+        return None
+    _cache.set(key, result)
+    return result
+
+
+def _remember(key: str, result: TicketAnalysisWithDraft, clean: str):
+    _cache.set(key, result)
+    _store.set(key, result.model_dump(mode="json"))
+    _near_duplicates.add(clean, result)
+
+
+def _reuse(donor: TicketAnalysisWithDraft, clean: str) -> TicketAnalysisWithDraft | None:
+    """
+    ``donor``'s analysis with the entities of ``clean`` swapped in (text
+    fields included), matching whole words only.  None — analyse afresh —
+    when a swap would be ambiguous: an old value shorter than
+    _MIN_SWAP_CHARS, one contained in another old value, or one that also
+    occurs in ``clean`` itself.
+    """
+    entities = extract_entities(clean)
+    swaps = []
+    for field, placeholder in _ENTITY_PLACEHOLDERS.items():
+        old, new = getattr(donor.entities, field), getattr(entities, field)
+        if old and old != new:
+            if len(old) < _MIN_SWAP_CHARS or _whole_word(old).search(clean):
+                return None
+            swaps.append((old, new or placeholder))
+    olds = [old for old, _ in swaps]
+    if any(a != b and a in b for a in olds for b in olds):
+        return None
+
+    def _swap(text: str) -> str:
+        for old, new in swaps:
+            text = _whole_word(old).sub(lambda _: new, text)
+        return text
+
+    return donor.model_copy(update={
+        "entities": entities,
+        "intent": _swap(donor.intent),
+        "summary": _swap(donor.summary),
+        "draft_response": _swap(donor.draft_response),
+    })
+
+
+def _near_duplicate(clean: str, key: str) -> TicketAnalysisWithDraft | None:
+    """Analysis reused from a near-duplicate email, if one was seen (memory-cached only)."""
+    hit = _near_duplicates.find(clean)
+    if hit is None:
+        return None
+    result = _reuse(hit[0], clean)
+    if result is None:
+        return None
+    _cache.set(key, result)
+    return result
+
+
+def _analysis_only_stored(key: str) -> TicketAnalysis | None:
+    """Analysis-only result from the durable cache, promoted into the in-memory one."""
+    stored = _analysis_only_store.get(key)
+    if stored is None:
+        return None
+    try:
+        analysis = TicketAnalysis.model_validate(stored)
+    except ValueError:
+        return None
+    _analysis_only_cache.set(key, analysis)
+    return analysis
+
+
+def _analysis_only_remember(key: str, analysis: TicketAnalysis, clean: str):
+    _analysis_only_cache.set(key, analysis)
+    _analysis_only_store.set(key, analysis.model_dump(mode="json"))
+    _analysis_only_near_duplicates.add(clean, TicketAnalysisWithDraft(**analysis.model_dump(), draft_response=""))
+
+
+def _analysis_only_near_duplicate(clean: str, key: str) -> TicketAnalysis | None:
+    hit = _analysis_only_near_duplicates.find(clean)
+    if hit is None:
+        return None
+    result = _reuse(hit[0], clean)
+    if result is None:
+        return None
+    analysis = _analysis_only(result)
+    _analysis_only_cache.set(key, analysis)
+    return analysis
+
+
+def _analysis_only_call(clean: str, key: str) -> TicketAnalysis:
+    """One analysis-only LLM call per key at a time, remembered in the analysis-only caches."""
+    def _call() -> TicketAnalysis:
+        hit = _analysis_only_cache.get(key)
+        if hit is not None:
+            return hit
+        analysis: TicketAnalysis = scheduler.run(
+            MODEL,
+            lambda: analysis_only_chain.invoke({"email_body": clean}),
+            est_tokens=_ANALYSIS_ONLY_TOKENS + estimate_tokens(clean),
+        )
+        _analysis_only_remember(key, analysis, clean)
+        return analysis
+
+    return (
+        _analysis_only_cache.get(key) or _analysis_only_stored(key)
+        or _analysis_only_near_duplicate(clean, key) or _flight.do("analysis_only:" + key, _call)
+    )
+
+
+async def _aanalysis_only_call(clean: str, key: str) -> TicketAnalysis:
+    """Async _analysis_only_call()."""
+    async def _call() -> TicketAnalysis:
+        hit = _analysis_only_cache.get(key)
+        if hit is not None:
+            return hit
+        analysis: TicketAnalysis = await scheduler.arun(
+            MODEL,
+            lambda: analysis_only_chain.ainvoke({"email_body": clean}),
+            est_tokens=_ANALYSIS_ONLY_TOKENS + estimate_tokens(clean),
+        )
+        await asyncio.to_thread(_analysis_only_remember, key, analysis, clean)
+        return analysis
+
+    return (
+        _analysis_only_cache.get(key) or await asyncio.to_thread(_analysis_only_stored, key)
+        or _analysis_only_near_duplicate(clean, key) or await _flight.ado("analysis_only:" + key, _call)
+    )
+
+
+def _analysis_only(result: TicketAnalysisWithDraft) -> TicketAnalysis:
+    return TicketAnalysis(
+        sentiment=result.sentiment,
+        intent=result.intent,
+        entities=result.entities,
+        priority=result.priority,
+        category=result.category,
+        summary=result.summary,
+    )
+
+
 # ────────────────────── Public API ──────────────────────
 
 def analyze_and_draft(email_body: str) -> TicketAnalysisWithDraft:
@@ -174,18 +464,26 @@ def analyze_and_draft(email_body: str) -> TicketAnalysisWithDraft:
     Returns:
         TicketAnalysisWithDraft — contains all analysis fields + draft_response.
     """
-    if not email_body or not email_body.strip():
-        raise ValueError("email_body cannot be empty.")
-
-    clean = email_body.strip()
-    key = _cache_key(clean)
-
-    if key in _cache:
-        return _cache[key]
+    clean, key = _prepare(email_body)
+
+    cached = _cache.get(key) or _stored(key) or _near_duplicate(clean, key)
+    if cached is not None:
+        return cached
+
+    def _call() -> TicketAnalysisWithDraft:
+        # A call for this key may have finished since our cache check
+        hit = _cache.get(key)
+        if hit is not None:
+            return hit
+        result: TicketAnalysisWithDraft = scheduler.run(
+            MODEL,
+            lambda: combined_chain.invoke({"email_body": clean}),
+            est_tokens=_COMBINED_TOKENS + estimate_tokens(clean),
+        )
+        _remember(key, result, clean)
+        return result
 
-    result: TicketAnalysisWithDraft = combined_chain.invoke({"email_body": clean})
-    _cache[key] = result
-    return result
+    return _flight.do(key, _call)
 
 
 def analyze_ticket(email_body: str) -> TicketAnalysis:
@@ -195,25 +493,186 @@ def analyze_ticket(email_body: str) -> TicketAnalysis:
     For endpoints that also need a draft, prefer analyze_and_draft() to
     save an API call.
     """
-    if not email_body or not email_body.strip():
-        raise ValueError("email_body cannot be empty.")
-
-    clean = email_body.strip()
-    key = _cache_key(clean)
+    clean, key = _prepare(email_body)
 
     # If we already have a combined result cached, reuse the analysis part
-    if key in _cache:
-        cached = _cache[key]
-        return TicketAnalysis(
-            sentiment=cached.sentiment,
-            intent=cached.intent,
-            entities=cached.entities,
-            priority=cached.priority,
-            category=cached.category,
-            summary=cached.summary,
+    cached = _cache.get(key) or _stored(key) or _near_duplicate(clean, key)
+    if cached is not None:
+        return _analysis_only(cached)
+
+    return _analysis_only_call(clean, key)
+
+
+async def aanalyze_and_draft(email_body: str) -> TicketAnalysisWithDraft:
+    """Async analyze_and_draft(): same cache, prompt and rate-limit budget."""
+    clean, key = _prepare(email_body)
+
+    cached = _cache.get(key) or await asyncio.to_thread(_stored, key) or _near_duplicate(clean, key)
+    if cached is not None:
+        return cached
+
+    async def _call() -> TicketAnalysisWithDraft:
+        hit = _cache.get(key)
+        if hit is not None:
+            return hit
+        result: TicketAnalysisWithDraft = await scheduler.arun(
+            MODEL,
+            lambda: combined_chain.ainvoke({"email_body": clean}),
+            est_tokens=_COMBINED_TOKENS + estimate_tokens(clean),
         )
+        await asyncio.to_thread(_remember, key, result, clean)
+        return result
+
+    return await _flight.ado(key, _call)
+
+
+async def aanalyze_ticket(email_body: str) -> TicketAnalysis:
+    """Async analyze_ticket()."""
+    clean, key = _prepare(email_body)
+
+    cached = _cache.get(key) or await asyncio.to_thread(_stored, key) or _near_duplicate(clean, key)
+    if cached is not None:
+        return _analysis_only(cached)
+
+    return await _aanalysis_only_call(clean, key)
+
+
+# ────────────────────── Lazy drafts ──────────────────────
+
+def analyze_for_ticket(email_body: str) -> TicketAnalysisWithDraft:
+    """
+    What ingestion stores for an email: analyze_and_draft(), or with
+    DRAFT_MODE=lazy the analysis alone (``draft_response`` empty) from the
+    analysis-only chain; the draft is written later by generate_draft().
+    """
+    if DRAFT_MODE != "lazy":
+        return analyze_and_draft(email_body)
+    clean, key = _prepare(email_body)
+
+    # A combined result (draft included) is already paid for — keep it
+    cached = _cache.get(key) or _stored(key) or _near_duplicate(clean, key)
+    if cached is not None:
+        return cached
+
+    analysis = _analysis_only_call(clean, key)
+    return TicketAnalysisWithDraft(**analysis.model_dump(), draft_response="")
+
+
+def generate_draft(email_body: str, analysis: TicketAnalysis) -> str:
+    """Reply draft for an already analysed email (one 70B call, draft tokens only)."""
+    clean, _ = _prepare(email_body)
+    draft = scheduler.run(
+        MODEL,
+        lambda: draft_chain.invoke({
+            "email_body": clean,
+            "category": analysis.category.value,
+            "priority": analysis.priority.value,
+            "sentiment": analysis.sentiment.value,
+            "customer_name": analysis.entities.customer_name or "unknown",
+            "intent": analysis.intent,
+            "summary": analysis.summary,
+        }),
+        est_tokens=_DRAFT_TOKENS + estimate_tokens(clean),
+    )
+    return draft.strip()
+
+
+# ────────────────────── Cascade ──────────────────────
+
+def cascade_eligible(clf: dict | None) -> bool:
+    """
+    True when ANALYSIS_MODE=cascade and ``clf`` is a confident Low urgency
+    result with a sub-category (the light path takes its category from it).
+    """
+    return (
+        ANALYSIS_MODE == "cascade"
+        and clf is not None
+        and clf.get("urgency") == "Low"
+        and bool(clf.get("subcategory"))
+        and clf.get("confidence", 0.0) >= CASCADE_MIN_CONFIDENCE
+    )
+
+
+def _light_stored(key: str) -> TicketAnalysis | None:
+    stored = _light_store.get(key)
+    if stored is None:
+        return None
+    try:
+        extracted = TicketAnalysis.model_validate(stored)
+    except ValueError:
+        return None
+    _light_cache.set(key, extracted)
+    return extracted
+
+
+def _light_remember(key: str, extracted: TicketAnalysis):
+    _light_cache.set(key, extracted)
+    _light_store.set(key, extracted.model_dump(mode="json"))
+
+
+def _light_result(extracted: TicketAnalysis, clf: dict) -> TicketAnalysisWithDraft:
+    """Extraction + classifier labels + template draft, as a combined result."""
+    analysis = extracted.model_copy(update={
+        "priority": Priority.LOW,
+        "category": Category(get_parent_category(clf["subcategory"])),
+    })
+    return TicketAnalysisWithDraft(**analysis.model_dump(), draft_response=generate_draft_response(analysis))
+
+
+def analyze_light(email_body: str, clf: dict) -> TicketAnalysisWithDraft:
+    """Low-urgency analysis: 8B extraction call + template draft (no 70B call)."""
+    clean, key = _prepare(email_body)
+
+    def _call() -> TicketAnalysis:
+        hit = _light_cache.get(key) or _light_stored(key)
+        if hit is not None:
+            return hit
+        extracted: TicketAnalysis = scheduler.run(
+            EXTRACTION_MODEL,
+            lambda: extraction_chain.invoke({"email_body": clean, "subcategory": clf["subcategory"]}),
+            est_tokens=_EXTRACTION_TOKENS + estimate_tokens(clean),
+        )
+        _light_remember(key, extracted)
+        return extracted
+
+    return _light_result(_flight.do("light:" + key, _call), clf)
+
+
+async def aanalyze_light(email_body: str, clf: dict) -> TicketAnalysisWithDraft:
+    """Async analyze_light()."""
+    clean, key = _prepare(email_body)
+
+    async def _call() -> TicketAnalysis:
+        hit = _light_cache.get(key) or await asyncio.to_thread(_light_stored, key)
+        if hit is not None:
+            return hit
+        extracted: TicketAnalysis = await scheduler.arun(
+            EXTRACTION_MODEL,
+            lambda: extraction_chain.ainvoke({"email_body": clean, "subcategory": clf["subcategory"]}),
+            est_tokens=_EXTRACTION_TOKENS + estimate_tokens(clean),
+        )
+        await asyncio.to_thread(_light_remember, key, extracted)
+        return extracted
+
+    return _light_result(await _flight.ado("light:" + key, _call), clf)
+
+
+def analyze_cascade(email_body: str, clf: dict | None) -> TicketAnalysisWithDraft:
+    """
+    Cascade entry point: analyze_light() for confidently Low-urgency mail
+    (see cascade_eligible), analyze_for_ticket() for everything else.
+    ``clf`` is the classify_urgency() result (None if it failed).
+    """
+    if cascade_eligible(clf):
+        return analyze_light(email_body, clf)
+    return analyze_for_ticket(email_body)
+
 
-    return analysis_only_chain.invoke({"email_body": clean})
+async def aanalyze_cascade(email_body: str, clf: dict | None) -> TicketAnalysisWithDraft:
+    """Async analyze_cascade()."""
+    if cascade_eligible(clf):
+        return await aanalyze_light(email_body, clf)
+    return await aanalyze_and_draft(email_body)
 
 
 def generate_draft_response(analysis: TicketAnalysis) -> str:
@@ -0,0 +1,129 @@
+"""
+Bounded in-memory cache for LLM results.
+
+agent.py and urgency_classifier.py used to memoise results in plain dicts
+that lived as long as the process — on a long-running instance every
+distinct email stayed in memory forever, each entry a full Pydantic
+model including the draft reply.  BoundedCache keeps the "same email →
+no second LLM call" behaviour with a fixed footprint:
+
+  • at most ``max_entries`` entries and ``max_bytes`` of estimated value
+    size; the least recently used entries are evicted first;
+  • optional ``ttl`` (seconds) after which an entry counts as a miss;
+  • hit / miss / eviction / expiry counters, served by GET /cache_stats.
+
+Limits come from ANALYSIS_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_MAX_BYTES and
+ANALYSIS_CACHE_TTL_SECONDS (0 = no expiry) unless given explicitly.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "2000"))
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+ANALYSIS_CACHE_TTL_SECONDS = float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "0"))
+
+_ENTRY_OVERHEAD = 200  # dict slot, key string, bookkeeping tuple
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate bytes held by ``value`` (its JSON size plus overhead)."""
+    dump = getattr(value, "model_dump_json", None)
+    try:
+        text = dump() if dump is not None else json.dumps(value, default=str)
+    except (TypeError, ValueError):
+        text = repr(value)
+    return len(text) + _ENTRY_OVERHEAD
+
+
+class BoundedCache:
+    """Thread-safe LRU cache with entry / byte limits and an optional TTL."""
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES,
+        max_bytes: int = ANALYSIS_CACHE_MAX_BYTES,
+        ttl: float | None = ANALYSIS_CACHE_TTL_SECONDS,
+        sizer: Callable[[Any], int] = estimate_size,
+    ):
+        self.name = name
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self.ttl = ttl or None
+        self.sizer = sizer
+        self._data: OrderedDict[str, tuple[Any, int, float]] = OrderedDict()  # key → (value, size, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        register_stats(name, self.stats)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return default
+            value, size, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self._bytes -= size
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key: str, value: Any):
+        size = self.sizer(value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                return  # would evict everything else; not worth caching
+            self._data[key] = (value, size, time.monotonic())
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else None,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+            }
+
+
+_registry: dict[str, Callable[[], dict]] = {}
+
+
+def register_stats(name: str, stats: Callable[[], dict]):
+    """Add a cache's stats() to GET /cache_stats."""
+    _registry[name] = stats
+
+
+def cache_stats() -> dict[str, dict]:
+    """Counters of every registered cache in the process, by name."""
+    return {name: stats() for name, stats in _registry.items()}
@@ -8,7 +8,7 @@ Usage:
 from database import engine, Base
 
 # Import all models so Base.metadata is fully populated
-from models import Ticket  # noqa: F401
+from models import Ticket, MailboxSyncState, IngestionJob, FetchRun, LLMCacheEntry  # noqa: F401
 
 
 def create_tables():
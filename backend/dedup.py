@@ -0,0 +1,99 @@
+"""
+Ticket dedup by Message-ID and content hash.
+
+Comparing ``Ticket.email_body`` (unindexed TEXT) against every incoming
+email is a sequential scan that grows with the table.  Each ticket now
+carries two short, uniquely-indexed keys filled at ingest:
+
+  • message_id     — the RFC 5322 Message-ID header, when the email has one
+  • content_sha256 — SHA-256 of the normalised "From/Subject/body" text
+
+so a duplicate check is an index probe, and a whole batch of candidates
+can be checked with a single ``IN (...)`` query.
+"""
+
+import hashlib
+import logging
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from models import Ticket
+
+logger = logging.getLogger("dedup")
+
+_IN_CHUNK = 500  # keep IN (...) lists well below driver parameter limits
+DUPLICATE_MARKER = "dup:"  # content_sha256 of pre-dedup copies: "dup:<ticket id>", never a real digest
+
+
+def content_sha256(text: str) -> str:
+    """Hash of the ticket text, insensitive to line endings and outer whitespace."""
+    normalised = text.replace("\r\n", "\n").strip()
+    return hashlib.sha256(normalised.encode("utf-8")).hexdigest()
+
+
+def _known_values(db: Session, column, values) -> set[str]:
+    wanted = list({v for v in values if v})
+    known: set[str] = set()
+    for i in range(0, len(wanted), _IN_CHUNK):
+        rows = db.query(column).filter(column.in_(wanted[i:i + _IN_CHUNK])).all()
+        known.update(r[0] for r in rows)
+    return known
+
+
+def known_message_ids(db: Session, message_ids) -> set[str]:
+    """Subset of ``message_ids`` that already belong to a ticket (one query)."""
+    return _known_values(db, Ticket.message_id, message_ids)
+
+
+def known_hashes(db: Session, hashes) -> set[str]:
+    """Subset of ``hashes`` that already belong to a ticket (one query)."""
+    return _known_values(db, Ticket.content_sha256, hashes)
+
+
+def find_duplicate(db: Session, message_id: str | None, digest: str) -> Ticket | None:
+    """Existing ticket with the same Message-ID or content hash, if any."""
+    criteria = [Ticket.content_sha256 == digest]
+    if message_id:
+        criteria.append(Ticket.message_id == message_id)
+    return db.query(Ticket).filter(or_(*criteria)).first()
+
+
+def backfill_content_hashes(db: Session, batch_size: int = 500) -> int:
+    """
+    Fill ``content_sha256`` for tickets created before the column existed.
+
+    Older duplicates were never rejected, so only the oldest ticket of
+    each identical body gets the hash; later copies get the sentinel
+    ``dup:<ticket id>`` so the unique index can still be built and they
+    are not rescanned.  Every row is filled once, so after the first run
+    this is a single "any NULL left?" probe.  Returns the number of rows
+    given their hash.
+    """
+    if db.query(Ticket.id).filter(Ticket.content_sha256.is_(None)).first() is None:
+        return 0
+    updated = marked = 0
+    while True:
+        batch = (
+            db.query(Ticket)
+            .filter(Ticket.content_sha256.is_(None))
+            .order_by(Ticket.created_at)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+        digests = {ticket.id: content_sha256(ticket.email_body or "") for ticket in batch}
+        taken = known_hashes(db, digests.values())
+        for ticket in batch:
+            digest = digests[ticket.id]
+            if digest in taken:
+                ticket.content_sha256 = f"{DUPLICATE_MARKER}{ticket.id.hex}"
+                marked += 1
+            else:
+                ticket.content_sha256 = digest
+                taken.add(digest)
+                updated += 1
+        db.commit()
+    logger.info("Backfilled content_sha256 for %d ticket(s); %d older duplicate(s) marked.", updated, marked)
+    return updated
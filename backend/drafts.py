@@ -0,0 +1,97 @@
+"""
+On-demand reply drafts for DRAFT_MODE=lazy.
+
+Drafting every ingested email costs 80-150 words of 70B output per
+ticket, and output tokens dominate the call's latency — yet many tickets
+are closed through /tickets/{id}/reject without the draft ever being
+read.  In lazy mode ingestion stores the analysis only
+(agent.analyze_for_ticket) and the draft is written here:
+
+  • ensure_draft() — the first time GET /tickets/{id} (the dashboard's
+    detail panel) or /approve_ticket/{id} needs it; the result is saved
+    to ``tickets.draft_response`` so it is generated once;
+  • schedule_pregeneration() — in the background right after ingestion
+    for High-priority tickets (DRAFT_PREGENERATE_HIGH), so the urgent
+    ones are ready when an agent opens them.
+
+Concurrent requests for the same ticket share one LLM call, and a draft
+already present (e.g. edited by an agent) is never overwritten.
+"""
+
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Ticket
+from schemas import TicketAnalysis, ExtractedEntities, Sentiment
+from agent import DRAFT_MODE, generate_draft
+from single_flight import SingleFlight
+
+logger = logging.getLogger("drafts")
+
+DRAFT_PREGENERATE_HIGH = os.getenv("DRAFT_PREGENERATE_HIGH", "true").lower() == "true"
+DRAFT_PREGENERATE_WORKERS = int(os.getenv("DRAFT_PREGENERATE_WORKERS", "2"))
+
+_pool = ThreadPoolExecutor(max_workers=DRAFT_PREGENERATE_WORKERS, thread_name_prefix="draft")
+_flight = SingleFlight("single_flight:draft")
+
+
+def ticket_analysis(ticket: Ticket) -> TicketAnalysis:
+    """
+    The stored analysis of ``ticket`` as a TicketAnalysis — the one
+    converter from a Ticket row, used for drafting and for the duplicate
+    /process_ticket response.
+    """
+    try:
+        sentiment = Sentiment(ticket.sentiment)
+    except ValueError:
+        sentiment = Sentiment.NEUTRAL
+    name = ticket.customer_name if ticket.customer_name and ticket.customer_name != "Unknown" else None
+    return TicketAnalysis(
+        sentiment=sentiment,
+        intent=ticket.intent or "",
+        entities=ExtractedEntities(customer_name=name, transaction_id=ticket.transaction_id, amount=ticket.amount),
+        priority=ticket.priority.value if ticket.priority else "Medium",
+        category=ticket.category.value if ticket.category else "General",
+        summary=ticket.summary or "",
+    )
+
+
+def ensure_draft(db: Session, ticket: Ticket) -> str | None:
+    """
+    ``ticket.draft_response``, generating and saving it first if missing
+    in DRAFT_MODE=lazy.  Returns None (and leaves the ticket as is) if
+    generation fails; in eager mode a missing draft stays missing.
+    """
+    if ticket.draft_response or DRAFT_MODE != "lazy":
+        return ticket.draft_response
+    try:
+        draft = _flight.do(str(ticket.id), lambda: generate_draft(ticket.email_body, ticket_analysis(ticket)))
+    except Exception as exc:
+        logger.warning("Draft generation failed for ticket %s: %s", ticket.id, exc)
+        return None
+    (
+        db.query(Ticket)
+        .filter(Ticket.id == ticket.id, or_(Ticket.draft_response.is_(None), Ticket.draft_response == ""))
+        .update({Ticket.draft_response: draft}, synchronize_session=False)
+    )
+    db.commit()
+    db.refresh(ticket)
+    return ticket.draft_response
+
+
+def _pregenerate(ticket_id):
+    with SessionLocal() as db:
+        ticket = db.get(Ticket, ticket_id)
+        if ticket is not None and ensure_draft(db, ticket):
+            print(f"    ✍️  Draft pre-generated for ticket {str(ticket_id)[:8]}")
+
+
+def schedule_pregeneration(ticket_id, priority: str):
+    """In lazy mode, draft High-priority tickets in the background right away."""
+    if DRAFT_MODE == "lazy" and DRAFT_PREGENERATE_HIGH and priority == "High":
+        _pool.submit(_pregenerate, ticket_id)
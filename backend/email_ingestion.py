@@ -15,13 +15,19 @@ Prerequisites:
 import os
 import sys
 import time
-import email
+import uuid
+import random
+import asyncio
 import imaplib
 import logging
+import threading
 import requests
 from email.header import decode_header
 from dotenv import load_dotenv
 
+from imap_idle import IdleListener
+from mime_text import extract_message
+
 # -------------------- Configuration --------------------
 
 load_dotenv()
@@ -34,7 +40,24 @@ IMAP_PORT = 993
 MAILBOX = "INBOX"
 
 API_ENDPOINT = "http://127.0.0.1:8000/process_ticket"
-POLL_INTERVAL = 10  # seconds
+POLL_INTERVAL = 10  # seconds — used when the server does not support IDLE
+IDLE_SAFETY_POLL_INTERVAL = int(os.getenv("IDLE_SAFETY_POLL_INTERVAL", "300"))  # seconds
+ENABLE_IMAP_IDLE = os.getenv("ENABLE_IMAP_IDLE", "true").lower() == "true"
+
+# Async mode: one pooled httpx.AsyncClient keeps up to API_CONCURRENCY
+# /process_ticket requests in flight; failed requests (network, timeout,
+# 429, 5xx) are retried API_MAX_RETRIES times with jittered backoff.
+# INGESTION_ASYNC=false sends one request at a time.
+INGESTION_ASYNC = os.getenv("INGESTION_ASYNC", "true").lower() == "true"
+API_CONCURRENCY = int(os.getenv("API_CONCURRENCY", "4"))
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "60"))
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "3"))
+API_RETRY_BASE_SECONDS = float(os.getenv("API_RETRY_BASE_SECONDS", "1.0"))
+
+# "uid"    — fetch only UIDs above the cursor stored in mailbox_sync_state
+#            (needs DATABASE_URL; the first sync picks up UNSEEN mail)
+# "unseen" — search UNSEEN on every poll
+SYNC_MODE = os.getenv("EMAIL_SYNC_MODE", "uid").lower()
 
 # -------------------- Logging --------------------
 
@@ -84,55 +107,13 @@ def decode_mime_header(header_value: str) -> str:
     return " ".join(parts)
 
 
-def extract_body(msg: email.message.Message) -> str:
-    """
-    Extract the plain-text body from an email message.
-
-    Walks the MIME tree and returns the first text/plain part.
-    Falls back to text/html (stripped of tags) if no plain-text part exists.
-    """
-    body = ""
-
-    if msg.is_multipart():
-        for part in msg.walk():
-            content_type = part.get_content_type()
-            content_disposition = str(part.get("Content-Disposition", ""))
-
-            # Skip attachments
-            if "attachment" in content_disposition:
-                continue
-
-            if content_type == "text/plain":
-                payload = part.get_payload(decode=True)
-                if payload:
-                    charset = part.get_content_charset() or "utf-8"
-                    body = payload.decode(charset, errors="replace")
-                    break  # prefer plain text
-
-            elif content_type == "text/html" and not body:
-                payload = part.get_payload(decode=True)
-                if payload:
-                    charset = part.get_content_charset() or "utf-8"
-                    html = payload.decode(charset, errors="replace")
-                    # Basic HTML tag stripping (good enough for triage)
-                    import re
-                    body = re.sub(r"<[^>]+>", " ", html)
-                    body = re.sub(r"\s+", " ", body).strip()
-    else:
-        payload = msg.get_payload(decode=True)
-        if payload:
-            charset = msg.get_content_charset() or "utf-8"
-            body = payload.decode(charset, errors="replace")
-
-    return body.strip()
-
-
-def send_to_api(email_body: str, subject: str, sender: str) -> dict | None:
+def send_to_api(email_body: str, subject: str, sender: str, message_id: str | None = None) -> dict | None:
     """
     Send the email data to the /process_ticket API endpoint.
 
     The API expects {"email_body": "..."} — we prepend the subject and
-    sender to give the AI more context.
+    sender to give the AI more context.  The Message-ID lets the API
+    return the existing ticket instead of analysing a duplicate.
     """
     # Compose a rich text block for the AI to analyse
     full_text = (
@@ -145,7 +126,7 @@ def send_to_api(email_body: str, subject: str, sender: str) -> dict | None:
     try:
         resp = requests.post(
             API_ENDPOINT,
-            json={"email_body": full_text},
+            json={"email_body": full_text, "message_id": message_id},
             timeout=60,
         )
         resp.raise_for_status()
@@ -164,41 +145,241 @@ def send_to_api(email_body: str, subject: str, sender: str) -> dict | None:
         return None
 
 
-def mark_as_read(mail: imaplib.IMAP4_SSL, email_id: bytes):
+def mark_as_read(mail: imaplib.IMAP4_SSL, uid: int):
     """Flag an email as Seen so it won't be fetched again."""
-    mail.store(email_id, "+FLAGS", "\\Seen")
+    mail.uid("STORE", str(uid), "+FLAGS", "\\Seen")
 
 
-def process_unread_emails(mail: imaplib.IMAP4_SSL):
-    """Search for UNSEEN emails, extract data, and forward to the API."""
-    status, messages = mail.search(None, "UNSEEN")
+def mark_many_as_read(mail: imaplib.IMAP4_SSL, uids: list[int]):
+    """Flag many emails as Seen: one UID STORE per IMAP_FETCH_BATCH_SIZE UIDs."""
+    from imap_fetch import chunked, uid_set
+
+    for chunk in chunked(sorted(set(uids))):
+        mail.uid("STORE", uid_set(chunk), "+FLAGS", "\\Seen")
+    if uids:
+        logger.info(f"  ✔️  Marked {len(uids)} email(s) as read.")
+
+
+# -------------------- Async API client --------------------
+
+# One event loop for the life of the process, so the pooled client (and
+# its keep-alive connections) survive from one poll cycle to the next.
+_loop: asyncio.AbstractEventLoop | None = None
+_client = None
 
-    if status != "OK":
-        logger.warning("Could not search for emails.")
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    return _loop
+
+
+def _async_client():
+    """Shared httpx.AsyncClient, at most API_CONCURRENCY connections."""
+    global _client
+    if _client is None:
+        import httpx
+
+        _client = httpx.AsyncClient(
+            timeout=API_TIMEOUT,
+            limits=httpx.Limits(max_connections=API_CONCURRENCY, max_keepalive_connections=API_CONCURRENCY),
+        )
+    return _client
+
+
+def _retry_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff: uniform(0, base × 2^attempt)."""
+    return random.uniform(0, API_RETRY_BASE_SECONDS * (2 ** attempt))
+
+
+async def send_to_api_async(client, email_body: str, subject: str, sender: str,
+                            message_id: str | None = None) -> dict | None:
+    """
+    Async send_to_api(): same payload, retried with jittered backoff on
+    connection errors, timeouts, 429 and 5xx.  Other 4xx are not retried.
+    """
+    import httpx
+
+    full_text = f"From: {sender}\nSubject: {subject}\n\n{email_body}"
+    payload = {"email_body": full_text, "message_id": message_id}
+    for attempt in range(API_MAX_RETRIES + 1):
+        try:
+            resp = await client.post(API_ENDPOINT, json=payload)
+            if resp.status_code == 429 or resp.status_code >= 500:
+                problem = f"API returned {resp.status_code}"
+            else:
+                resp.raise_for_status()
+                return resp.json()
+        except httpx.HTTPStatusError as e:
+            logger.error(f"⚠️  API returned an error: {e.response.status_code} — {e.response.text[:200]}")
+            return None
+        except httpx.TimeoutException:
+            problem = "API request timed out"
+        except httpx.TransportError as e:
+            problem = f"Cannot connect to the API ({e.__class__.__name__})"
+        except Exception as e:
+            logger.error(f"⚠️  Unexpected error sending to API: {e}")
+            return None
+
+        if attempt == API_MAX_RETRIES:
+            logger.error(f"⚠️  {problem}; giving up after {attempt + 1} attempt(s).")
+            return None
+        delay = _retry_delay(attempt)
+        logger.warning(f"  ⏳ {problem}; retry {attempt + 1}/{API_MAX_RETRIES} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+    return None
+
+
+async def _send_jobs_async(jobs: list[dict]):
+    """
+    Post every job with at most API_CONCURRENCY requests in flight.
+    Yields (job, result) as responses arrive; ``jobs`` is already ordered
+    most urgent first, which is the order the semaphore admits them.
+    """
+    client = _async_client()
+    gate = asyncio.Semaphore(API_CONCURRENCY)
+
+    async def _one(job: dict):
+        async with gate:
+            result = await send_to_api_async(
+                client, job["body"] or "", job["subject"], job["sender"], job["message_id"],
+            )
+        return job, result
+
+    tasks = [asyncio.ensure_future(_one(job)) for job in jobs]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        for task in tasks:
+            task.cancel()  # no-op for finished ones; stops stragglers after an error
+
+
+def close_async_client():
+    """Close the pooled client and its event loop (on shutdown)."""
+    global _client, _loop
+    if _loop is None:
         return
+    if _client is not None:
+        _loop.run_until_complete(_client.aclose())
+        _client = None
+    _loop.close()
+    _loop = None
+
 
-    email_ids = messages[0].split()
+def _load_uid_cursor(mail: imaplib.IMAP4_SSL) -> dict:
+    """Read the stored UID high-water mark for this mailbox."""
+    from database import SessionLocal
+    from imap_sync import mailbox_key, get_uidvalidity, load_cursor
 
-    if not email_ids:
-        return  # no new emails — silent
+    key = mailbox_key(EMAIL_USER, MAILBOX)
+    uidvalidity = get_uidvalidity(mail, MAILBOX)
+    with SessionLocal() as session:
+        last_uid = load_cursor(session, key, uidvalidity)
+    return {"key": key, "uidvalidity": uidvalidity, "last_uid": last_uid}
 
-    logger.info(f"📬 Found {len(email_ids)} unread email(s). Processing...")
 
-    for email_id in email_ids:
+def _save_uid_cursor(cursor: dict, candidates: list[int], completed: set[int]):
+    """Advance the cursor past every message that is queued or handled."""
+    from database import SessionLocal
+    from imap_sync import save_cursor, high_water_mark
+
+    last_uid = high_water_mark(candidates, completed, cursor["last_uid"])
+    if last_uid == cursor["last_uid"]:
+        return
+    with SessionLocal() as session:
+        save_cursor(session, cursor["key"], cursor["uidvalidity"], last_uid)
+    logger.info(f"  🔖 UID cursor advanced to {last_uid}.")
+
+
+def _pre_triage_order(mail: imaplib.IMAP4_SSL, uids: list[int]) -> list[int]:
+    """
+    Order UIDs most-urgent first using a keyword guess on subject/sender
+    (one header-only UID FETCH per batch, no LLM call).
+    """
+    from imap_fetch import chunked, fetch_headers
+    from urgency_classifier import provisional_priority, urgency_rank
+
+    headers = {}
+    for chunk in chunked(uids):
+        headers.update(fetch_headers(mail, chunk))
+    ranks = {
+        uid: urgency_rank(provisional_priority(h["subject"], h["sender"]))
+        for uid, h in headers.items()
+    }
+    return sorted(uids, key=lambda uid: (ranks.get(uid, 1), uid))
+
+
+def process_unread_emails(mail: imaplib.IMAP4_SSL):
+    """
+    Search for new emails (UID cursor or UNSEEN), queue each one as an
+    ingestion job, then forward queued jobs to the API.
+
+    A message counts as handled once its job row exists, so the cursor
+    moves on; a failed API call is retried from the job table on the next
+    cycle (up to JOB_MAX_ATTEMPTS) and the message stays unread until its
+    ticket is saved.
+    """
+    from database import SessionLocal
+    from imap_sync import mailbox_key, get_uidvalidity
+    from job_queue import new_worker_id, known_uids, enqueue
+    from urgency_classifier import provisional_priority
+
+    cursor = None
+    if SYNC_MODE == "uid":
+        from imap_sync import search_new_uids
+
+        cursor = _load_uid_cursor(mail)
+        uidvalidity = cursor["uidvalidity"]
+        email_uids = search_new_uids(mail, cursor["last_uid"], "UNSEEN")
+    else:
+        uidvalidity = get_uidvalidity(mail, MAILBOX)
+        status, messages = mail.uid("SEARCH", None, "UNSEEN")
+
+        if status != "OK":
+            logger.warning("Could not search for emails.")
+            return
+
+        email_uids = [int(u) for u in messages[0].split()]
+
+    key = mailbox_key(EMAIL_USER, MAILBOX)
+    worker_id = new_worker_id()
+    completed: set[int] = set()
+
+    if email_uids:
+        with SessionLocal() as session:
+            queued = known_uids(session, key, uidvalidity, email_uids)
+        completed |= queued  # already in the job table (pending or done)
+        new_uids = [u for u in email_uids if u not in queued]
+    else:
+        new_uids = []
+
+    ordered = new_uids
+    if new_uids:
+        logger.info(f"📬 Found {len(new_uids)} new email(s). Queuing...")
+        try:
+            ordered = _pre_triage_order(mail, new_uids)
+        except Exception as e:
+            logger.warning(f"  Pre-triage skipped ({e}); processing in mailbox order.")
+
+    for email_uid in ordered:
         try:
             # Fetch the email
-            status, msg_data = mail.fetch(email_id, "(RFC822)")
+            status, msg_data = mail.uid("FETCH", str(email_uid), "(RFC822)")
             if status != "OK":
-                logger.warning(f"  Could not fetch email ID {email_id}")
+                logger.warning(f"  Could not fetch email UID {email_uid}")
+                continue
+            if not msg_data or not isinstance(msg_data[0], tuple):
+                completed.add(email_uid)  # expunged since the search
                 continue
 
-            raw_email = msg_data[0][1]
-            msg = email.message_from_bytes(raw_email)
+            # Stream the text out; attachments are skipped, never decoded
+            msg, body = extract_message(msg_data[0][1])
 
             # Extract fields
             subject = decode_mime_header(msg.get("Subject", "(No Subject)"))
             sender = decode_mime_header(msg.get("From", "(Unknown Sender)"))
-            body = extract_body(msg)
 
             logger.info(f"  ────────────────────────────────────────")
             logger.info(f"  📩 From:    {sender}")
@@ -207,29 +388,80 @@ def process_unread_emails(mail: imaplib.IMAP4_SSL):
 
             if not body or len(body.strip()) < 10:
                 logger.warning("  ⚠️  Email body too short, skipping.")
-                mark_as_read(mail, email_id)
+                mark_as_read(mail, email_uid)
+                completed.add(email_uid)
                 continue
 
-            # Send to API
-            result = send_to_api(body, subject, sender)
-
-            if result:
-                ticket_id = result.get("ticket_id", "N/A")
-                priority = result.get("analysis", {}).get("priority", "N/A")
-                category = result.get("analysis", {}).get("category", "N/A")
-                logger.info(f"  ✅ Ticket created: {ticket_id[:8]}... | Priority: {priority} | Category: {category}")
-            else:
-                logger.warning("  ⚠️  Failed to process via API (will retry next cycle).")
-                continue  # don't mark as read — retry next loop
-
-            # Mark as read only after successful processing
-            mark_as_read(mail, email_id)
-            logger.info(f"  ✔️  Marked as read.")
+            # Queue durably — the API call happens in _drain_jobs()
+            with SessionLocal() as session:
+                enqueue(session, worker_id, key, uidvalidity, [{
+                    "uid": email_uid,
+                    "message_id": (msg.get("Message-ID") or "").strip() or None,
+                    "subject": subject,
+                    "sender": sender,
+                    "body": body,
+                    "provisional": provisional_priority(subject, sender),
+                }])
+            completed.add(email_uid)
 
         except Exception as e:
-            logger.error(f"  ❌ Error processing email ID {email_id}: {e}")
+            logger.error(f"  ❌ Error processing email UID {email_uid}: {e}")
             continue  # don't crash — move to next email
 
+    if cursor is not None and email_uids:
+        _save_uid_cursor(cursor, email_uids, completed)
+
+    _drain_jobs(mail, worker_id, key, uidvalidity)
+
+
+def _drain_jobs(mail: imaplib.IMAP4_SSL, worker_id: str, key: str, uidvalidity: int):
+    """
+    Send queued jobs for this mailbox to the API, most urgent first, then
+    mark every acknowledged message as read in bulk.
+    """
+    from database import SessionLocal
+    from models import JobState
+    from job_queue import claim, advance, fail, release
+    from urgency_classifier import urgency_rank
+
+    acknowledged: list[int] = []
+
+    def _record(session, job: dict, result: dict | None):
+        if not result:
+            state = fail(session, job["job_id"], worker_id, "API call failed")
+            logger.warning(f"  ⚠️  Failed to process via API (job {state.value if state else '?'}, will retry).")
+            return
+
+        ticket_id = result.get("ticket_id", "N/A")
+        priority = result.get("analysis", {}).get("priority", "N/A")
+        category = result.get("analysis", {}).get("category", "N/A")
+        logger.info(f"  ✅ Ticket created: {ticket_id[:8]}... | Priority: {priority} | Category: {category}")
+        advance(session, job["job_id"], worker_id, JobState.SAVED,
+                ticket_id=uuid.UUID(ticket_id) if len(ticket_id) == 36 else None)
+
+        # Mark as read only after successful processing
+        if job["uidvalidity"] == uidvalidity:
+            acknowledged.append(job["uid"])
+
+    with SessionLocal() as session:
+        jobs = claim(session, worker_id, limit=50, states=(JobState.FETCHED,), mailbox=key)
+        jobs.sort(key=lambda j: urgency_rank(j["provisional"]))
+        try:
+            if INGESTION_ASYNC and jobs:
+                async def _drain():
+                    async for job, result in _send_jobs_async(jobs):
+                        _record(session, job, result)
+
+                _event_loop().run_until_complete(_drain())
+            else:
+                for job in jobs:
+                    _record(session, job, send_to_api(
+                        job["body"] or "", job["subject"], job["sender"], job["message_id"],
+                    ))
+        finally:
+            release(session, worker_id)
+            mark_many_as_read(mail, acknowledged)
+
 
 # -------------------- Main Loop --------------------
 
@@ -245,11 +477,26 @@ def main():
     logger.info(f"  IMAP Server:   {IMAP_SERVER}:{IMAP_PORT}")
     logger.info(f"  API Endpoint:  {API_ENDPOINT}")
     logger.info(f"  Poll Interval: {POLL_INTERVAL}s")
+    logger.info(f"  Sync Mode:     {SYNC_MODE}")
+    logger.info(f"  IMAP IDLE:     {'on' if ENABLE_IMAP_IDLE else 'off'}")
+    logger.info(f"  API Requests:  {f'async, {API_CONCURRENCY} in flight' if INGESTION_ASYNC else 'sequential'}")
     logger.info("=" * 60)
 
     mail = None
 
+    # IDLE runs on its own connection and only wakes the loop below;
+    # polling continues as a safety net (or alone if IDLE is unsupported).
+    wake = threading.Event()
+    listener = None
+    if ENABLE_IMAP_IDLE:
+        listener = IdleListener(
+            EMAIL_USER, EMAIL_PASSWORD, on_new_mail=wake.set,
+            folder=MAILBOX, host=IMAP_SERVER, port=IMAP_PORT,
+        )
+        listener.start()
+
     while True:
+        wake.clear()
         try:
             # (Re)connect if needed
             if mail is None:
@@ -275,6 +522,9 @@ def main():
 
         except KeyboardInterrupt:
             logger.info("\n👋 Shutting down gracefully...")
+            if listener:
+                listener.stop()
+            close_async_client()
             if mail:
                 try:
                     mail.close()
@@ -289,7 +539,15 @@ def main():
             time.sleep(15)
             continue
 
-        time.sleep(POLL_INTERVAL)
+        try:
+            interval = IDLE_SAFETY_POLL_INTERVAL if listener and listener.supported else POLL_INTERVAL
+            wake.wait(timeout=interval)
+        except KeyboardInterrupt:
+            logger.info("\n👋 Shutting down gracefully...")
+            if listener:
+                listener.stop()
+            close_async_client()
+            sys.exit(0)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,275 @@
+"""
+Quoted-reply, forwarded-header and signature stripping before LLM calls.
+
+A reply in a long thread carries every earlier message as quoted history
+("On Mon, ... wrote:" plus "> " lines, or Outlook's "-----Original
+Message-----" / From:-Sent:-To: block), usually followed by a signature
+and a legal disclaimer.  Sent whole, that text burns thousands of prompt
+tokens per email on content the model has already seen, and Groq's
+tokens-per-minute limit is what caps batch throughput.
+
+trim_email() keeps the newest message only:
+
+  • everything from the first reply-history marker onwards is dropped;
+  • "> " quoted lines are dropped;
+  • forwarded-message banners and their From/Date/Subject/To header
+    lines are dropped — the forwarded body itself is kept, since for a
+    forward it is usually the actual customer request.  An Outlook
+    From:/Sent:/To:/Subject: block without a banner counts as a forward
+    when its Subject starts with "FW:"/"Fwd:", or when only a short
+    cover note precedes it; with an "RE:" Subject, or below a longer
+    message, it is reply history;
+  • an underscore separator line only starts reply history when a
+    reply marker or header block follows it — otherwise it is text;
+  • an RFC 3676 "-- " signature is cut after its first line (typically
+    the name, which entity extraction still wants); a bare "--" typed as
+    a divider is kept;
+  • trailing disclaimers / confidentiality notices and "Sent from my
+    iPhone" lines are dropped.  A disclaimer must read as legalese and sit
+    in the last few lines before the end (or the quoted history), so a
+    customer writing "IMPORTANT NOTICE: my card was used ..." keeps it.
+
+The synthetic "From: / Subject:" header that ingestion puts in front of
+the body is preserved.  If trimming would leave almost nothing (e.g. an
+email that is only a quote), the original text is used.  Only the LLM
+input is trimmed; the ticket still stores the full email.
+"""
+
+import os
+import re
+import logging
+import threading
+
+from llm_scheduler import estimate_tokens
+
+logger = logging.getLogger("email_trim")
+
+TRIM_EMAIL_HISTORY = os.getenv("TRIM_EMAIL_HISTORY", "true").lower() == "true"
+_MIN_KEPT_CHARS = 20
+_COVER_NOTE_MAX_CHARS = 200   # text above a banner-less Outlook block still read as a forward's cover note
+
+# ─────────────────── Patterns ───────────────────
+
+# Start of quoted reply history: everything from here on is dropped
+_REPLY_MARKERS = [
+    re.compile(r"^\s*On\s.{0,200}\swrote:\s*$", re.IGNORECASE),                   # Gmail / Apple Mail
+    re.compile(r"^\s*Le\s.{0,200}\sa\sécrit\s?:\s*$", re.IGNORECASE),              # French clients
+    re.compile(r"^\s*Am\s.{0,200}\sschrieb\s.{0,100}:\s*$", re.IGNORECASE),        # German clients
+    re.compile(r"^\s*-{2,}\s*Original Message\s*-{2,}\s*$", re.IGNORECASE),      # Outlook
+]
+# Outlook web separator: only a boundary when a header block / reply marker follows
+_SEPARATOR = re.compile(r"^\s*_{10,}\s*$")
+# Outlook without a banner: "From:" followed within a few lines by "Sent:"/"Date:" and "To:"/"Subject:"
+_OUTLOOK_FROM = re.compile(r"^\s*\*?From:\*?\s", re.IGNORECASE)
+_OUTLOOK_FOLLOW = re.compile(r"^\s*\*?(Sent|Date|To|Cc|Subject):\*?\s", re.IGNORECASE)
+_OUTLOOK_SUBJECT = re.compile(r"^\s*\*?Subject:\*?\s*(.*)$", re.IGNORECASE)
+_FORWARD_SUBJECT = re.compile(r"^(FW|FWD)\s*:", re.IGNORECASE)
+_REPLY_SUBJECT = re.compile(r"^(RE|AW|SV)\s*:", re.IGNORECASE)
+
+_FORWARD_BANNER = re.compile(
+    r"^\s*-{2,}\s*(Forwarded message|Begin forwarded message|Weitergeleitete Nachricht)\s*-{0,}\s*:?\s*$"
+    r"|^\s*Begin forwarded message:\s*$",
+    re.IGNORECASE,
+)
+_HEADER_LINE = re.compile(r"^\s*\*?(From|Date|Sent|To|Cc|Subject|Reply-To):\*?\s", re.IGNORECASE)
+
+_QUOTED = re.compile(r"^\s*>")
+_SIG_DELIMITER = re.compile(r"^-- $")   # exactly RFC 3676; a bare "--" is often a typed divider
+_MOBILE_FOOTER = re.compile(
+    r"^\s*(Sent from my \w+|Sent from (Outlook|Mail) for \w+|Get Outlook for \w+)", re.IGNORECASE,
+)
+# Disclaimer: a legal sentence, or a heading whose text (or next line) is legalese
+_DISCLAIMER_SENTENCE = re.compile(
+    r"^\s*(This (e-?mail|message|communication)( and any (files|attachments)[^.]*)? "
+    r"(is|are|may contain) (confidential|intended (solely|only))"
+    r"|The information (contained )?in this (e-?mail|message))",
+    re.IGNORECASE,
+)
+_DISCLAIMER_HEADING = re.compile(
+    r"^\s*[*_]*(CONFIDENTIALITY NOTICE|DISCLAIMER|LEGAL NOTICE|IMPORTANT NOTICE)[*_]*\s*:?\s*(.*)$",
+    re.IGNORECASE,
+)
+_LEGALESE = re.compile(
+    r"\b(confidential|privileged|intended (solely |only )?for|intended recipient|unauthori[sz]ed)", re.IGNORECASE,
+)
+_DISCLAIMER_MAX_LINES = 20   # a footer this long or shorter, up to the end / quoted history
+_SYNTHETIC_HEADER = re.compile(r"\A(From: [^\n]*\nSubject: [^\n]*\n\n)")
+
+# ─────────────────── Stats ───────────────────
+
+_stats_lock = threading.Lock()
+trim_stats = {"emails": 0, "trimmed": 0, "tokens_before": 0, "tokens_after": 0}
+
+
+def _record(tokens_before: int, tokens_after: int):
+    with _stats_lock:
+        trim_stats["emails"] += 1
+        trim_stats["trimmed"] += int(tokens_after < tokens_before)
+        trim_stats["tokens_before"] += tokens_before
+        trim_stats["tokens_after"] += tokens_after
+
+
+# ─────────────────── Trimming ───────────────────
+
+def _is_outlook_block(lines: list[str], i: int) -> bool:
+    """A "From:" line followed by at least two more header lines."""
+    if not _OUTLOOK_FROM.match(lines[i]):
+        return False
+    follow = sum(1 for line in lines[i + 1:i + 5] if _OUTLOOK_FOLLOW.match(line))
+    return follow >= 2
+
+
+def _outlook_block_kind(lines: list[str], i: int, kept: list[str]) -> str | None:
+    """
+    "forward" or "history" for a banner-less Outlook header block at
+    ``lines[i]`` (None if there is none): FW:/Fwd: subjects and blocks
+    under no more than a short cover note are forwards, RE: subjects and
+    blocks under a real message are reply history.
+    """
+    if not _is_outlook_block(lines, i):
+        return None
+    subject = next((m.group(1) for m in map(_OUTLOOK_SUBJECT.match, lines[i + 1:i + 6]) if m), "")
+    if _FORWARD_SUBJECT.match(subject):
+        return "forward"
+    if _REPLY_SUBJECT.match(subject):
+        return "history"
+    return "forward" if len("\n".join(kept).strip()) <= _COVER_NOTE_MAX_CHARS else "history"
+
+
+def _next_text_line(lines: list[str], i: int) -> int | None:
+    """Index of the first non-blank line after ``lines[i]``."""
+    return next((j for j in range(i + 1, len(lines)) if lines[j].strip()), None)
+
+
+def _is_disclaimer(lines: list[str], i: int) -> bool:
+    """
+    ``lines[i]`` starts a legal footer: a disclaimer sentence or heading
+    whose wording is legalese, with at most _DISCLAIMER_MAX_LINES text
+    lines from it to the end of the message (or the start of its quoted
+    history) — never a phrase in the middle of the customer's text.
+    """
+    line = lines[i]
+    if not _DISCLAIMER_SENTENCE.match(line):
+        heading = _DISCLAIMER_HEADING.match(line)
+        if not heading:
+            return False
+        j = _next_text_line(lines, i)
+        wording = heading.group(2) or (lines[j] if j is not None else "")
+        if not (_DISCLAIMER_SENTENCE.match(wording) or _LEGALESE.search(wording)):
+            return False
+    footer = 0
+    for j in range(i, len(lines)):
+        if any(p.match(lines[j]) for p in _REPLY_MARKERS) or _is_outlook_block(lines, j):
+            break
+        if lines[j].strip() and not _QUOTED.match(lines[j]):
+            footer += 1
+            if footer > _DISCLAIMER_MAX_LINES:
+                return False
+    return True
+
+
+def _trim_body(body: str) -> tuple[str, list[str]]:
+    lines = body.replace("\r\n", "\n").split("\n")
+    kept: list[str] = []
+    removed: list[str] = []
+    in_forward_headers = False
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+
+        # Forwarded banner: drop it and the header lines right after it
+        if _FORWARD_BANNER.match(line):
+            removed.append("forward_headers")
+            in_forward_headers = True
+            i += 1
+            continue
+        if in_forward_headers:
+            if _HEADER_LINE.match(line) or not line.strip():
+                i += 1
+                continue
+            in_forward_headers = False
+
+        if _SEPARATOR.match(line):
+            j = _next_text_line(lines, i)
+            if j is not None and (_is_outlook_block(lines, j) or any(p.match(lines[j]) for p in _REPLY_MARKERS)):
+                i += 1   # the block below decides: forward headers or reply history
+                continue
+        if any(p.match(line) for p in _REPLY_MARKERS):
+            removed.append("quoted_history")
+            break
+        kind = _outlook_block_kind(lines, i, kept)
+        if kind == "history":
+            removed.append("quoted_history")
+            break
+        if kind == "forward":
+            removed.append("forward_headers")
+            in_forward_headers = True
+            i += 1
+            continue
+        if _QUOTED.match(line):
+            if "quoted_lines" not in removed:
+                removed.append("quoted_lines")
+            i += 1
+            continue
+        if _SIG_DELIMITER.match(line):
+            removed.append("signature")
+            j = _next_text_line(lines, i)
+            if j is not None and j <= i + 3 and not _is_disclaimer(lines, j):
+                kept.append(lines[j])
+            break
+        if _is_disclaimer(lines, i):
+            removed.append("disclaimer")
+            break
+        if _MOBILE_FOOTER.match(line):
+            removed.append("mobile_footer")
+            i += 1
+            continue
+        kept.append(line)
+        i += 1
+
+    text = "\n".join(kept)
+    return re.sub(r"\n{3,}", "\n\n", text).strip(), removed
+
+
+def _trim(text: str) -> tuple[str, list[str]]:
+    header = ""
+    body = text
+    match = _SYNTHETIC_HEADER.match(text)
+    if match:
+        header, body = match.group(1), text[match.end():]
+
+    trimmed, removed = _trim_body(body)
+    if len(trimmed) < _MIN_KEPT_CHARS:
+        trimmed, removed = body.strip(), []   # nothing left but the quote: keep it all
+    return header + trimmed, removed
+
+
+def trim_email(text: str) -> dict:
+    """
+    Newest-message-only version of ``text`` for the LLM.
+
+    Returns {"text", "tokens_before", "tokens_after", "removed"} where
+    ``removed`` lists what was stripped (quoted_history, quoted_lines,
+    forward_headers, signature, disclaimer, mobile_footer).
+    """
+    tokens_before = estimate_tokens(text)
+    result, removed = _trim(text)
+    tokens_after = estimate_tokens(result)
+    _record(tokens_before, tokens_after)
+    if removed:
+        logger.debug("Trimmed email %d → %d tokens (%s)", tokens_before, tokens_after, ", ".join(removed))
+    return {"text": result, "tokens_before": tokens_before, "tokens_after": tokens_after, "removed": removed}
+
+
+def trim_for_llm(text: str) -> str:
+    """trim_email(text)["text"], or ``text`` unchanged with TRIM_EMAIL_HISTORY=false."""
+    if not TRIM_EMAIL_HISTORY:
+        return text
+    return trim_email(text)["text"]
+
+
+def trim_text(text: str) -> str:
+    """trim_for_llm() without touching trim_stats — for offline use (model training)."""
+    if not TRIM_EMAIL_HISTORY:
+        return text
+    return _trim(text)[0]
@@ -0,0 +1,55 @@
+"""
+Rule-based entity extraction (customer name, transaction ID, amount).
+
+Used where an email's classification is reused from a near-duplicate
+(see near_dup.py): the triage fields carry over, but the entities belong
+to the new sender, so they are re-extracted here without an LLM call.
+The patterns cover the common shapes in finance support mail
+("TXN-98432", "$1,250.00", "500 USD", "my name is ...", a name under the
+sign-off); anything they miss is left as None rather than guessed.
+"""
+
+import re
+
+from schemas import ExtractedEntities
+
+_TRANSACTION_ID = [
+    re.compile(r"\b((?:TXN|TRX|TXID|REF|ORD|ORDER|INV|CASE|PAY)[-_#: ]?[A-Z0-9]*\d[A-Z0-9-]{2,})\b", re.IGNORECASE),
+    re.compile(
+        r"\b(?:transaction|reference|order|invoice|payment)\s*(?:id|ref|no\.?|number|#)\s*[:#]?\s*([A-Z0-9][A-Z0-9-]{3,})",
+        re.IGNORECASE,
+    ),
+]
+_AMOUNT = [
+    re.compile(r"([$€£₹]\s?\d[\d,]*(?:\.\d{1,2})?)"),
+    re.compile(r"\b(\d[\d,]*(?:\.\d{1,2})?\s?(?:USD|EUR|GBP|INR|dollars|euros|pounds|rupees|rs\.?))(?!\w)", re.IGNORECASE),
+    re.compile(r"\b((?:USD|EUR|GBP|INR|Rs\.?)\s?\d[\d,]*(?:\.\d{1,2})?)", re.IGNORECASE),
+]
+_NAME = r"([A-Z][a-z'’-]+(?:\s+[A-Z][a-z'’-]+){0,2})"
+_CUSTOMER_NAME = [
+    re.compile(r"(?i:\b(?:my name is|this is|i am|i'm)\s+)" + _NAME),
+    re.compile(
+        r"^\s*(?i:regards|best regards|kind regards|thanks|thank you|sincerely|cheers|best),?\s*\n\s*"
+        + _NAME + r"\s*$",
+        re.MULTILINE,
+    ),
+]
+_NOT_NAMES = {"Sorry", "Writing", "Not", "Very", "Still", "Really", "Unable", "Happy", "Contacting"}
+
+
+def _first(patterns: list[re.Pattern], text: str) -> str | None:
+    for pattern in patterns:
+        for match in pattern.finditer(text):
+            value = match.group(1).strip()
+            if value and value.split()[0] not in _NOT_NAMES:
+                return value
+    return None
+
+
+def extract_entities(text: str) -> ExtractedEntities:
+    """Entities found in ``text`` by pattern; fields not found are None."""
+    return ExtractedEntities(
+        customer_name=_first(_CUSTOMER_NAME, text),
+        transaction_id=_first(_TRANSACTION_ID, text),
+        amount=_first(_AMOUNT, text),
+    )
@@ -0,0 +1,234 @@
+"""
+Asynchronous /fetch_emails runs and their progress.
+
+A batch can spend minutes on LLM calls, and the dashboard used to block
+on one HTTP request for all of it.  POST /fetch_emails now records a
+``fetch_runs`` row, hands the batch to a background task and returns the
+run id at once; GET /jobs/{id} reads the row back.
+
+RunProgress is the bridge: the pipeline stages report each email's state
+(queued → parsed → analysed → saved / skipped / error) and the tickets
+created so far, and it writes them to the row — throttled to
+RUN_PROGRESS_FLUSH_SECONDS — so any API worker can answer a poll.
+
+Each run is leased to the process that runs it (``claimed_by`` /
+``claimed_until``, as in job_queue); a heartbeat thread renews the lease
+every RUN_LEASE_SECONDS / 3 while the batch is going.  A run whose lease
+has lapsed belonged to a process that died — fail_abandoned_runs() closes
+those on startup and GET /jobs/{id} on poll — while runs owned by other
+live workers or replicas are left alone.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import FetchRun, FetchRunStatus
+from job_queue import new_worker_id
+
+logger = logging.getLogger("fetch_runs")
+
+RUN_PROGRESS_FLUSH_SECONDS = float(os.getenv("RUN_PROGRESS_FLUSH_SECONDS", "1.0"))
+RUN_LEASE_SECONDS = int(os.getenv("RUN_LEASE_SECONDS", "90"))
+
+_OPEN_STATUSES = (FetchRunStatus.QUEUED, FetchRunStatus.RUNNING)
+
+# Owner of every run started by this process (BackgroundTasks run in-process)
+PROCESS_ID = new_worker_id()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _lease() -> datetime:
+    return _now() + timedelta(seconds=RUN_LEASE_SECONDS)
+
+
+# ─────────────────── Run rows ───────────────────
+
+def create_run(db: Session, include_read: bool, max_emails: int, sync_mode: str) -> FetchRun:
+    """Insert a queued run and return it."""
+    run = FetchRun(include_read=include_read, max_emails=max_emails, sync_mode=sync_mode,
+                   claimed_by=PROCESS_ID, claimed_until=_lease())
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+def finish_run(run_id, result: dict | None = None, error: str | None = None):
+    """Store the final summary (or the error) and close the run."""
+    with SessionLocal() as db:
+        run = db.get(FetchRun, run_id)
+        if run is None:
+            return
+        run.status = FetchRunStatus.FAILED if error else FetchRunStatus.COMPLETED
+        run.result_json = json.dumps(result) if result is not None else None
+        run.error = error
+        run.finished_at = _now()
+        run.claimed_until = None
+        db.commit()
+
+
+def renew_lease(run_id) -> bool:
+    """Extend this process's lease on an open run; False once the run is closed or not ours."""
+    with SessionLocal() as db:
+        updated = (
+            db.query(FetchRun)
+            .filter(FetchRun.id == run_id, FetchRun.claimed_by == PROCESS_ID,
+                    FetchRun.status.in_(_OPEN_STATUSES))
+            .update({"claimed_until": _lease()}, synchronize_session=False)
+        )
+        db.commit()
+    return bool(updated)
+
+
+def _abandoned():
+    """Open runs whose owner stopped renewing the lease (or that predate leases)."""
+    return and_(
+        FetchRun.status.in_(_OPEN_STATUSES),
+        or_(FetchRun.claimed_until.is_(None), FetchRun.claimed_until < _now()),
+    )
+
+
+def fail_abandoned_runs(db: Session, run_id=None) -> int:
+    """Fail open runs whose lease lapsed — their process is gone.  Optionally just ``run_id``."""
+    query = db.query(FetchRun).filter(_abandoned())
+    if run_id is not None:
+        query = query.filter(FetchRun.id == run_id)
+    updated = query.update(
+        {"status": FetchRunStatus.FAILED, "error": "Interrupted: the server running it stopped.",
+         "finished_at": _now(), "claimed_until": None},
+        synchronize_session=False,
+    )
+    db.commit()
+    if updated:
+        logger.info("Marked %d abandoned fetch run(s) as failed.", updated)
+    return updated
+
+
+def run_status(run: FetchRun) -> dict:
+    """GET /jobs/{id} payload."""
+    progress = json.loads(run.progress_json) if run.progress_json else {}
+    emails = progress.get("emails", [])
+    counts: dict[str, int] = {}
+    for email in emails:
+        counts[email["state"]] = counts.get(email["state"], 0) + 1
+    finished = sum(counts.get(s, 0) for s in ("saved", "skipped", "error"))
+    return {
+        "job_id": str(run.id),
+        "status": FetchRunStatus(run.status).value,
+        "include_read": run.include_read,
+        "max_emails": run.max_emails,
+        "sync_mode": run.sync_mode,
+        "total": run.total,
+        "processed": finished,
+        "counts": counts,
+        "emails": emails,
+        "tickets": progress.get("tickets", []),
+        "errors": progress.get("errors", []),
+        "result": json.loads(run.result_json) if run.result_json else None,
+        "error": run.error,
+        "created_at": run.created_at.isoformat() if run.created_at else None,
+        "started_at": run.started_at.isoformat() if run.started_at else None,
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+    }
+
+
+# ─────────────────── Progress ───────────────────
+
+class RunProgress:
+    """Thread-safe per-email progress for one run, persisted to its row."""
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()   # keeps row writes in snapshot order
+        self._emails: dict[str, dict] = {}   # key → {"uid", "subject", "state", ...}
+        self._tickets: list[dict] = []
+        self._errors: list[str] = []
+        self._total = None
+        self._last_flush = 0.0
+        self._stopped = threading.Event()
+
+    def start(self):
+        with SessionLocal() as db:
+            run = db.get(FetchRun, self.run_id)
+            if run is not None:
+                run.status = FetchRunStatus.RUNNING
+                run.started_at = _now()
+                run.claimed_by = PROCESS_ID
+                run.claimed_until = _lease()
+                db.commit()
+        threading.Thread(target=self._heartbeat, name=f"run-heartbeat-{self.run_id}", daemon=True).start()
+
+    def stop(self):
+        """End the heartbeat (the run is being closed)."""
+        self._stopped.set()
+
+    def _heartbeat(self):
+        while not self._stopped.wait(RUN_LEASE_SECONDS / 3):
+            try:
+                if not renew_lease(self.run_id):
+                    return
+            except Exception as exc:  # next beat retries; the lease has slack
+                logger.warning("Could not renew lease for run %s: %s", self.run_id, exc)
+
+    def set_total(self, total: int):
+        with self._lock:
+            self._total = total
+        self.flush(force=True)
+
+    def email(self, key: str, state: str, **fields):
+        """Record that email ``key`` reached ``state`` (plus any detail fields)."""
+        with self._lock:
+            entry = self._emails.setdefault(key, {})
+            entry.update(fields, state=state)
+        self.flush()
+
+    def ticket(self, key: str, row: dict):
+        """A ticket was saved: partial result, visible before the run ends."""
+        with self._lock:
+            self._tickets.append(row)
+            self._emails.setdefault(key, {}).update(state="saved", ticket_id=row.get("ticket_id"))
+        self.flush()
+
+    def error(self, key: str | None, message: str):
+        with self._lock:
+            self._errors.append(message)
+            if key is not None:
+                self._emails.setdefault(key, {}).update(state="error", error=message)
+        self.flush()
+
+    def flush(self, force: bool = False):
+        """Write the progress to the run row, at most every RUN_PROGRESS_FLUSH_SECONDS."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_flush < RUN_PROGRESS_FLUSH_SECONDS:
+                return
+            self._last_flush = now
+        with self._write_lock:
+            with self._lock:
+                payload = json.dumps({
+                    "emails": list(self._emails.values()),
+                    "tickets": list(self._tickets),
+                    "errors": list(self._errors),
+                })
+                total = self._total
+            try:
+                with SessionLocal() as db:
+                    run = db.get(FetchRun, self.run_id)
+                    if run is not None:
+                        run.progress_json = payload
+                        run.total = total
+                        db.commit()
+            except Exception as exc:  # progress is best effort; never break the batch
+                logger.warning("Could not store progress for run %s: %s", self.run_id, exc)
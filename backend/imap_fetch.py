@@ -0,0 +1,292 @@
+"""
+Batched, header-first IMAP fetching.
+
+Fetching ``(RFC822)`` one message at a time costs a round trip per email
+and downloads every attachment, even for messages that are then thrown
+away as duplicates.  This module fetches whole UID sets per command:
+
+  1. fetch_headers()   — ``UID FETCH <set> (RFC822.SIZE BODY.PEEK[HEADER.FIELDS
+                         (MESSAGE-ID FROM SUBJECT DATE)])``: a few hundred bytes
+                         per message, enough to drop already-known Message-IDs.
+  2. fetch_text_parts() — ``UID FETCH <set> (BODYSTRUCTURE)`` to locate the
+                         text/plain (or text/html) part of each survivor, then
+                         ``BODY.PEEK[<section>]<0.N>`` grouped by section, so
+                         attachments are never transferred.
+
+All fetches use BODY.PEEK, so nothing is flagged \\Seen implicitly.
+"""
+
+import os
+import re
+import imaplib
+import logging
+from email.header import decode_header
+from email.parser import BytesHeaderParser
+
+from mime_text import decode_text_payload
+
+logger = logging.getLogger("imap_fetch")
+
+IMAP_FETCH_BATCH_SIZE = int(os.getenv("IMAP_FETCH_BATCH_SIZE", "25"))
+IMAP_MAX_TEXT_BYTES = int(os.getenv("IMAP_MAX_TEXT_BYTES", str(256 * 1024)))
+
+_HEADER_FIELDS = "BODY.PEEK[HEADER.FIELDS (MESSAGE-ID FROM SUBJECT DATE)]"
+_UID_RE = re.compile(rb"UID (\d+)")
+_SIZE_RE = re.compile(rb"RFC822\.SIZE (\d+)")
+_SECTION_RE = re.compile(rb"BODY\[([\d.]*)\]")
+
+
+# ─────────────────── UID sets ───────────────────
+
+def uid_set(uids) -> str:
+    """Compress UIDs into an IMAP sequence set, e.g. [1, 2, 3, 7] → "1:3,7"."""
+    ordered = sorted(set(int(u) for u in uids))
+    if not ordered:
+        raise ValueError("uid_set needs at least one UID.")
+    ranges = []
+    start = prev = ordered[0]
+    for uid in ordered[1:]:
+        if uid == prev + 1:
+            prev = uid
+            continue
+        ranges.append(f"{start}:{prev}" if start != prev else str(start))
+        start = prev = uid
+    ranges.append(f"{start}:{prev}" if start != prev else str(start))
+    return ",".join(ranges)
+
+
+def chunked(items: list, size: int = IMAP_FETCH_BATCH_SIZE) -> list[list]:
+    """Split ``items`` into lists of at most ``size`` elements."""
+    size = max(1, size)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+# ─────────────────── Header decoding ───────────────────
+
+def decode_header_value(value: str | None) -> str:
+    """Decode a MIME-encoded header (Subject, From, etc.) into a plain string."""
+    if not value:
+        return ""
+    parts = []
+    for part, charset in decode_header(value):
+        if isinstance(part, bytes):
+            try:
+                parts.append(part.decode(charset or "utf-8", errors="replace"))
+            except LookupError:
+                parts.append(part.decode("utf-8", errors="replace"))
+        else:
+            parts.append(part)
+    return " ".join(parts)
+
+
+def _iter_literals(data):
+    """Yield (prefix, literal) for each ``* n FETCH (... {len}`` + literal pair."""
+    for entry in data or []:
+        if isinstance(entry, tuple) and len(entry) == 2:
+            yield entry[0], entry[1]
+
+
+# ─────────────────── Step 1: headers ───────────────────
+
+def fetch_headers(mail: imaplib.IMAP4, uids: list[int]) -> dict[int, dict]:
+    """
+    One round trip for the envelope of every UID in ``uids``.
+
+    Returns {uid: {"uid", "size", "message_id", "subject", "sender", "date"}}.
+    Messages expunged since the search are simply absent.
+    """
+    if not uids:
+        return {}
+    typ, data = mail.uid("FETCH", uid_set(uids), f"(UID RFC822.SIZE {_HEADER_FIELDS})")
+    if typ != "OK":
+        raise imaplib.IMAP4.error(f"UID FETCH headers failed: {typ}")
+
+    parser = BytesHeaderParser()
+    headers: dict[int, dict] = {}
+    for prefix, literal in _iter_literals(data):
+        uid_match = _UID_RE.search(prefix)
+        if not uid_match:
+            continue
+        size_match = _SIZE_RE.search(prefix)
+        hdr = parser.parsebytes(literal or b"")
+        uid = int(uid_match.group(1))
+        headers[uid] = {
+            "uid": uid,
+            "size": int(size_match.group(1)) if size_match else None,
+            "message_id": (hdr.get("Message-ID") or "").strip() or None,
+            "subject": decode_header_value(hdr.get("Subject", "(No Subject)")),
+            "sender": decode_header_value(hdr.get("From", "(Unknown)")),
+            "date": hdr.get("Date"),
+        }
+    return headers
+
+
+# ─────────────────── Step 2: BODYSTRUCTURE → text section ───────────────────
+
+_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\}|([^\s()"]+))')
+
+
+def _parse_sexp(raw: bytes, literals: list[bytes]):
+    """
+    Parse an IMAP parenthesised list into nested Python lists.
+
+    Strings come back as ``str``, NIL as None, atoms as ``str``.  ``{n}``
+    literal markers are replaced by the next entry of ``literals``.
+    """
+    stack: list[list] = [[]]
+    pos = 0
+    lit_iter = iter(literals)
+    while pos < len(raw):
+        match = _TOKEN_RE.match(raw, pos)
+        if not match or match.end() == pos:
+            break
+        pos = match.end()
+        opened, closed, quoted, literal_len, atom = match.groups()
+        if opened:
+            stack.append([])
+        elif closed:
+            if len(stack) == 1:
+                break
+            done = stack.pop()
+            stack[-1].append(done)
+        elif quoted is not None:
+            stack[-1].append(re.sub(rb"\\(.)", rb"\1", quoted).decode("utf-8", errors="replace"))
+        elif literal_len is not None:
+            stack[-1].append(next(lit_iter, b"").decode("utf-8", errors="replace"))
+        elif atom is not None:
+            text = atom.decode("ascii", errors="replace")
+            stack[-1].append(None if text.upper() == "NIL" else text)
+    while len(stack) > 1:  # tolerate a truncated response
+        done = stack.pop()
+        stack[-1].append(done)
+    return stack[0]
+
+
+def _params(value) -> dict:
+    """("CHARSET" "utf-8" "NAME" "x") → {"charset": "utf-8", "name": "x"}."""
+    if not isinstance(value, list):
+        return {}
+    return {
+        str(value[i]).lower(): value[i + 1]
+        for i in range(0, len(value) - 1, 2)
+        if value[i] is not None
+    }
+
+
+def _text_parts(body: list, section: str = ""):
+    """Yield text leaf parts of a BODYSTRUCTURE in MIME order."""
+    if not body:
+        return
+    if isinstance(body[0], list):  # multipart: children, then subtype
+        n = 0
+        for child in body:
+            if not isinstance(child, list):
+                break
+            n += 1
+            yield from _text_parts(child, f"{section}.{n}" if section else str(n))
+        return
+
+    ctype = (body[0] or "").lower()
+    subtype = (body[1] or "").lower() if len(body) > 1 else ""
+    if ctype != "text" or subtype not in ("plain", "html"):
+        return
+    # text/* extension fields: lines, md5, disposition
+    disposition = body[9] if len(body) > 9 else None
+    if isinstance(disposition, list) and disposition and str(disposition[0]).lower() == "attachment":
+        return
+    yield {
+        "section": section or "1",
+        "subtype": subtype,
+        "charset": _params(body[2] if len(body) > 2 else None).get("charset") or "utf-8",
+        "encoding": str(body[5] or "7bit").lower() if len(body) > 5 else "7bit",
+        "size": int(body[6]) if len(body) > 6 and str(body[6]).isdigit() else None,
+    }
+
+
+def pick_text_part(bodystructure: list) -> dict | None:
+    """First non-attachment text/plain part, else the first text/html part."""
+    parts = list(_text_parts(bodystructure))
+    for part in parts:
+        if part["subtype"] == "plain":
+            return part
+    return parts[0] if parts else None
+
+
+def fetch_bodystructures(mail: imaplib.IMAP4, uids: list[int]) -> dict[int, list]:
+    """One round trip for the BODYSTRUCTURE of every UID in ``uids``."""
+    if not uids:
+        return {}
+    typ, data = mail.uid("FETCH", uid_set(uids), "(UID BODYSTRUCTURE)")
+    if typ != "OK":
+        raise imaplib.IMAP4.error(f"UID FETCH BODYSTRUCTURE failed: {typ}")
+
+    # imaplib returns "n (UID .. BODYSTRUCTURE (..))" lines, split into
+    # (prefix, literal) tuples wherever the server sent a {len} literal.
+    # Stitch everything back into one stream: "n (..) n (..) ...".
+    raw_parts: list[bytes] = []
+    literals: list[bytes] = []
+    for entry in data or []:
+        if isinstance(entry, tuple):
+            raw_parts.append(entry[0])
+            literals.append(entry[1] or b"")
+        elif entry:
+            raw_parts.append(entry)
+
+    structures: dict[int, list] = {}
+    for items in _parse_sexp(b" ".join(raw_parts), literals):
+        if not isinstance(items, list):
+            continue  # the message sequence number
+        fields = {str(items[i]).upper(): items[i + 1] for i in range(0, len(items) - 1, 2)}
+        uid = fields.get("UID")
+        if uid is not None and isinstance(fields.get("BODYSTRUCTURE"), list):
+            structures[int(uid)] = fields["BODYSTRUCTURE"]
+    return structures
+
+
+# ─────────────────── Step 3: text sections ───────────────────
+
+def _decode_part(payload: bytes, part: dict, max_bytes: int = IMAP_MAX_TEXT_BYTES) -> str:
+    """Undo the Content-Transfer-Encoding and charset of a fetched section."""
+    # Partial fetches may end mid-quantum / mid-character; the incremental
+    # decoder drops the incomplete tail.
+    return decode_text_payload(
+        payload, part.get("encoding", "7bit"), part.get("charset"), part.get("subtype", "plain"), max_bytes,
+    )
+
+
+def fetch_text_parts(
+    mail: imaplib.IMAP4,
+    uids: list[int],
+    max_bytes: int = IMAP_MAX_TEXT_BYTES,
+) -> dict[int, str]:
+    """
+    Fetch only the readable text of each message in ``uids``.
+
+    One BODYSTRUCTURE round trip for the whole set, then one
+    ``BODY.PEEK[section]<0.max_bytes>`` round trip per distinct section
+    (almost always just "1" or "1.1").  Messages without a text part map
+    to an empty string.
+    """
+    structures = fetch_bodystructures(mail, uids)
+    picks = {uid: pick_text_part(bs) for uid, bs in structures.items()}
+
+    by_section: dict[str, list[int]] = {}
+    for uid, part in picks.items():
+        if part:
+            by_section.setdefault(part["section"], []).append(uid)
+
+    texts: dict[int, str] = {uid: "" for uid in structures}
+    partial = f"<0.{max_bytes}>" if max_bytes > 0 else ""
+    for section, section_uids in by_section.items():
+        typ, data = mail.uid("FETCH", uid_set(section_uids), f"(UID BODY.PEEK[{section}]{partial})")
+        if typ != "OK":
+            logger.warning("UID FETCH BODY[%s] failed: %s", section, typ)
+            continue
+        for prefix, literal in _iter_literals(data):
+            uid_match = _UID_RE.search(prefix)
+            if not uid_match or not _SECTION_RE.search(prefix):
+                continue
+            uid = int(uid_match.group(1))
+            if uid in picks and picks[uid]:
+                texts[uid] = _decode_part(literal or b"", picks[uid], max_bytes)
+    return texts
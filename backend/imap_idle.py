@@ -0,0 +1,174 @@
+"""
+IMAP IDLE (RFC 2177) push listener.
+
+Interval polling adds up to one poll interval of latency and spends an
+IMAP round trip on every empty poll.  IdleListener keeps one dedicated
+connection parked in IDLE; as soon as the server announces new mail
+(``* n EXISTS`` / ``* n RECENT``) it fires ``on_new_mail`` so ingestion
+runs within seconds.
+
+  • IDLE is re-issued every IMAP_IDLE_RENEW_SECONDS (default 25 min),
+    comfortably inside the 29-minute limit servers enforce.
+  • Dropped connections are re-established with exponential backoff.
+  • If the server does not advertise IDLE, the listener sets
+    ``supported = False`` and exits; callers keep interval polling.
+
+The callback runs on the listener thread, so it should only signal
+(set an event) rather than do the ingestion work itself.
+"""
+
+import os
+import re
+import ssl
+import time
+import select
+import imaplib
+import logging
+import threading
+from typing import Callable
+
+logger = logging.getLogger("imap_idle")
+
+IMAP_IDLE_RENEW_SECONDS = int(os.getenv("IMAP_IDLE_RENEW_SECONDS", str(25 * 60)))
+_MAX_BACKOFF_SECONDS = 300
+_NEW_MAIL_RE = re.compile(rb"^\* \d+ (EXISTS|RECENT)", re.IGNORECASE)
+
+
+class IdleListener(threading.Thread):
+    """Background thread that holds an IMAP IDLE session on one folder."""
+
+    def __init__(
+        self,
+        user: str,
+        password: str,
+        on_new_mail: Callable[[], None],
+        folder: str = "INBOX",
+        host: str = "imap.gmail.com",
+        port: int = 993,
+        renew_seconds: int = IMAP_IDLE_RENEW_SECONDS,
+    ):
+        super().__init__(name=f"imap-idle-{folder}", daemon=True)
+        self.user = user
+        self.password = password
+        self.on_new_mail = on_new_mail
+        self.folder = folder
+        self.host = host
+        self.port = port
+        self.renew_seconds = renew_seconds
+        self.supported: bool | None = None   # unknown until first connect
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """Ask the listener to leave IDLE and exit (returns within ~1 s)."""
+        self._stop_event.set()
+
+    # ── Thread body ──
+
+    def run(self):
+        backoff = 5
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                if "IDLE" not in conn.capabilities:
+                    self.supported = False
+                    logger.warning("📭 %s does not support IMAP IDLE — staying on interval polling.", self.host)
+                    return
+                self.supported = True
+                logger.info("📡 IMAP IDLE listener active on %s/%s", self.user, self.folder)
+                backoff = 5
+                while not self._stop_event.is_set():
+                    if self._idle_once(conn):
+                        logger.info("📨 IDLE: new mail in %s", self.folder)
+                        self.on_new_mail()
+            except (imaplib.IMAP4.error, OSError) as exc:
+                if self._stop_event.is_set():
+                    break
+                logger.warning("📡 IDLE connection lost (%s) — reconnecting in %ss", exc, backoff)
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, _MAX_BACKOFF_SECONDS)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.logout()
+                    except Exception:
+                        pass
+
+    # ── Helpers ──
+
+    def _connect(self) -> imaplib.IMAP4_SSL:
+        conn = imaplib.IMAP4_SSL(self.host, self.port)
+        conn.login(self.user, self.password)
+        conn.select(self.folder, readonly=True)
+        return conn
+
+    def _idle_once(self, conn: imaplib.IMAP4_SSL) -> bool:
+        """
+        Run one IDLE cycle. Returns True as soon as new mail is announced,
+        False when the renew deadline passes (or stop() is called).
+        """
+        # imaplib (< 3.14) has no idle(); drive the command by hand.
+        tag = conn._new_tag()
+        conn.send(tag + b" IDLE\r\n")
+        line = conn.readline()
+        if not line.startswith(b"+"):
+            raise imaplib.IMAP4.error(f"IDLE rejected: {line.strip()!r}")
+
+        new_mail = False
+        deadline = time.monotonic() + self.renew_seconds
+        try:
+            while not self._stop_event.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # Short slices so stop() is honoured promptly
+                if not _wait_readable(conn, min(remaining, 1.0)):
+                    continue
+                line = conn.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("connection closed during IDLE")
+                if line.startswith(b"* BYE"):
+                    raise imaplib.IMAP4.abort(f"server ended IDLE: {line.strip()!r}")
+                if _NEW_MAIL_RE.match(line):
+                    new_mail = True
+                    break
+        except Exception as exc:
+            # The connection is gone: writing DONE would only fail again and
+            # hide this error; run() logs out and reconnects.
+            logger.info("📡 IDLE on %s/%s failed: %r", self.user, self.folder, exc)
+            raise
+
+        conn.send(b"DONE\r\n")
+        # Drain until the tagged completion of the IDLE command
+        while True:
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("connection closed while ending IDLE")
+            if line.startswith(tag):
+                break
+            if _NEW_MAIL_RE.match(line):
+                new_mail = True
+        return new_mail
+
+
+def _wait_readable(conn: imaplib.IMAP4_SSL, timeout: float) -> bool:
+    """
+    True when a line can be read without blocking for long.
+
+    Checks data already decrypted by TLS or buffered by imaplib's file
+    object before falling back to select() on the raw socket.
+    """
+    sock = conn.sock
+    if isinstance(sock, ssl.SSLSocket) and sock.pending():
+        return True
+    prev_timeout = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        if conn.file.peek(1):
+            return True
+    except (BlockingIOError, ssl.SSLWantReadError):
+        pass
+    finally:
+        sock.settimeout(prev_timeout)
+    readable, _, _ = select.select([sock], [], [], timeout)
+    return bool(readable)
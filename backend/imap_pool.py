@@ -0,0 +1,175 @@
+"""
+Keep-alive IMAP sessions and batched flag updates for ingestion.
+
+Every fetch_emails() run used to open a fresh IMAP4_SSL connection (TLS
+handshake + LOGIN + SELECT) per mailbox and per fetch worker, and log
+them all out at the end — with the background poller that is several
+handshakes every few minutes for the same inbox.  Marking messages read
+cost one ``UID STORE`` round trip per message.
+
+ImapSessionPool keeps logged-in sessions between runs, one idle list per
+mailbox (configured_mailboxes() key, so the folder is already selected):
+
+  • acquire() hands out an idle session, checking it with NOOP first if
+    it sat idle longer than IMAP_POOL_NOOP_AFTER seconds; dead or stale
+    sessions are dropped and replaced by a fresh login;
+  • release() puts it back (up to IMAP_POOL_MAX_IDLE per mailbox), or
+    logs it out if the caller saw it fail;
+  • sessions older than IMAP_POOL_MAX_AGE are retired — Gmail drops idle
+    IMAP connections after about 30 minutes anyway.
+
+SeenFlags collects the UIDs to flag \\Seen while a run is in flight and
+applies them as one ``UID STORE <uid set> +FLAGS (\\Seen)`` per
+IMAP_FETCH_BATCH_SIZE UIDs.  A UID stays pending until its STORE
+succeeded, so a failed flush can be retried on another session.  The
+run's own session sat idle through the LLM stage by then; revalidate()
+NOOPs it (or replaces it) first.
+"""
+
+import os
+import time
+import imaplib
+import logging
+import threading
+from collections import defaultdict
+
+from imap_fetch import chunked, uid_set
+from mailboxes import connect
+
+logger = logging.getLogger("imap_pool")
+
+IMAP_POOL_MAX_IDLE = int(os.getenv("IMAP_POOL_MAX_IDLE", "4"))
+IMAP_POOL_MAX_AGE = int(os.getenv("IMAP_POOL_MAX_AGE", "1500"))
+IMAP_POOL_NOOP_AFTER = int(os.getenv("IMAP_POOL_NOOP_AFTER", "30"))
+
+
+def _logout(conn: imaplib.IMAP4):
+    try:
+        conn.logout()
+    except Exception:
+        pass
+
+
+class ImapSessionPool:
+    """Logged-in IMAP sessions per mailbox, reused across runs and threads."""
+
+    def __init__(self, max_idle: int = IMAP_POOL_MAX_IDLE, max_age: int = IMAP_POOL_MAX_AGE,
+                 noop_after: int = IMAP_POOL_NOOP_AFTER):
+        self.max_idle = max_idle
+        self.max_age = max_age
+        self.noop_after = noop_after
+        self._lock = threading.Lock()
+        self._idle: dict[str, list[tuple[imaplib.IMAP4, float, float]]] = defaultdict(list)
+        self._born: dict[int, float] = {}   # id(conn) → login time, for sessions handed out
+        self.stats = {"logins": 0, "reused": 0, "noop_failed": 0, "retired": 0}
+
+    def acquire(self, box: dict) -> imaplib.IMAP4:
+        """A healthy session with ``box``'s folder selected (reused or new)."""
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                idle = self._idle.get(box["key"])
+                entry = idle.pop() if idle else None
+            if entry is None:
+                break
+            conn, born, last_used = entry
+            if now - born > self.max_age:
+                self.stats["retired"] += 1
+                _logout(conn)
+                continue
+            if now - last_used > self.noop_after:
+                try:
+                    typ, _ = conn.noop()
+                    if typ != "OK":
+                        raise imaplib.IMAP4.error(f"NOOP returned {typ}")
+                except Exception as exc:
+                    logger.info("Dropping dead IMAP session for %s: %s", box["key"], exc)
+                    self.stats["noop_failed"] += 1
+                    _logout(conn)
+                    continue
+            with self._lock:
+                self._born[id(conn)] = born
+                self.stats["reused"] += 1
+            return conn
+
+        conn = connect(box)
+        with self._lock:
+            self._born[id(conn)] = time.monotonic()
+            self.stats["logins"] += 1
+        return conn
+
+    def revalidate(self, box: dict, conn: imaplib.IMAP4 | None) -> imaplib.IMAP4:
+        """
+        ``conn`` if it still answers NOOP, else (or if None) a fresh session
+        from acquire() — for a session held through a long idle stretch.
+        """
+        if conn is not None:
+            try:
+                typ, _ = conn.noop()
+                if typ == "OK":
+                    return conn
+                raise imaplib.IMAP4.error(f"NOOP returned {typ}")
+            except Exception as exc:
+                logger.info("Replacing dead IMAP session for %s: %s", box["key"], exc)
+                self.stats["noop_failed"] += 1
+                self.release(box, conn, broken=True)
+        return self.acquire(box)
+
+    def release(self, box: dict, conn: imaplib.IMAP4, broken: bool = False):
+        """Return ``conn`` for reuse; ``broken=True`` (or a full pool) logs it out."""
+        with self._lock:
+            born = self._born.pop(id(conn), time.monotonic())
+            idle = self._idle[box["key"]]
+            keep = not broken and len(idle) < self.max_idle
+            if keep:
+                idle.append((conn, born, time.monotonic()))
+        if not keep:
+            _logout(conn)
+
+    def close_all(self):
+        """Log out every idle session (on shutdown)."""
+        with self._lock:
+            entries = [entry for idle in self._idle.values() for entry in idle]
+            self._idle.clear()
+        for conn, _, _ in entries:
+            _logout(conn)
+
+
+class SeenFlags:
+    """UIDs to flag \\Seen, collected from many threads and stored in bulk."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._uids: set[int] = set()
+
+    def add(self, uid: int):
+        with self._lock:
+            self._uids.add(int(uid))
+
+    def __len__(self) -> int:
+        return len(self._uids)
+
+    def uids(self) -> set[int]:
+        with self._lock:
+            return set(self._uids)
+
+    def flush(self, conn: imaplib.IMAP4) -> int:
+        """
+        One UID STORE per IMAP_FETCH_BATCH_SIZE UIDs; returns how many were
+        flagged.  UIDs leave the pending set only once their STORE succeeded.
+        """
+        with self._lock:
+            pending = sorted(self._uids)
+        flagged = 0
+        for chunk in chunked(pending):
+            typ, data = conn.uid("STORE", uid_set(chunk), "+FLAGS", "(\\Seen)")
+            if typ != "OK":
+                raise imaplib.IMAP4.error(f"UID STORE \\Seen failed: {data}")
+            with self._lock:
+                self._uids.difference_update(chunk)
+            flagged += len(chunk)
+        return flagged
+
+
+# Shared by fetch_emails() runs in this process
+session_pool = ImapSessionPool()
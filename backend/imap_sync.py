@@ -0,0 +1,110 @@
+"""
+UID-based incremental IMAP sync with a persisted high-water mark.
+
+Searching ``SINCE <2 days ago>`` re-downloads the last two days of mail on
+every poll and leans on dedup to throw most of it away.  Instead, each
+mailbox keeps a cursor in the ``mailbox_sync_state`` table:
+
+  • UIDVALIDITY — identifies the mailbox "generation"; if the server
+    changes it, every stored UID is meaningless and the cursor resets.
+  • last_uid    — every message with a UID ≤ last_uid has been ingested.
+
+A poll then asks only for ``UID SEARCH UID <last_uid+1>:*`` and fetches
+those messages by UID, so its cost depends on new mail, not mailbox size.
+The very first sync (or one after a UIDVALIDITY change) falls back to the
+caller's bootstrap criteria, e.g. ``SINCE <2 days ago>``.
+"""
+
+import re
+import imaplib
+import logging
+
+from sqlalchemy.orm import Session
+
+from models import MailboxSyncState
+
+logger = logging.getLogger("imap_sync")
+
+
+def mailbox_key(account: str, folder: str = "INBOX") -> str:
+    """Stable cursor key for one folder of one account."""
+    return f"{account.lower()}/{folder}"
+
+
+def get_uidvalidity(mail: imaplib.IMAP4, folder: str = "INBOX") -> int:
+    """
+    UIDVALIDITY of the selected folder.
+
+    Read from the untagged response left by SELECT; falls back to a STATUS
+    query when it has already been consumed (long-lived connections).
+    """
+    _, data = mail.response("UIDVALIDITY")
+    if data and data[0]:
+        return int(data[0])
+    typ, data = mail.status(folder, "(UIDVALIDITY)")
+    match = re.search(rb"UIDVALIDITY (\d+)", data[0] or b"") if typ == "OK" and data else None
+    if not match:
+        raise imaplib.IMAP4.error(f"Server did not report UIDVALIDITY for {folder}.")
+    return int(match.group(1))
+
+
+def load_cursor(db: Session, key: str, uidvalidity: int) -> int:
+    """
+    Return the stored last UID for ``key``, or 0 when the mailbox has never
+    been synced or its UIDVALIDITY changed (→ bootstrap search).
+    """
+    state = db.get(MailboxSyncState, key)
+    if state is None:
+        return 0
+    if state.uidvalidity != uidvalidity:
+        logger.warning(
+            "UIDVALIDITY changed for %s (%s → %s) — resetting sync cursor.",
+            key, state.uidvalidity, uidvalidity,
+        )
+        return 0
+    return int(state.last_uid or 0)
+
+
+def save_cursor(db: Session, key: str, uidvalidity: int, last_uid: int) -> None:
+    """Upsert the cursor for ``key``. Never moves it backwards within one UIDVALIDITY."""
+    state = db.get(MailboxSyncState, key)
+    if state is None:
+        db.add(MailboxSyncState(mailbox=key, uidvalidity=uidvalidity, last_uid=last_uid))
+    elif state.uidvalidity != uidvalidity:
+        state.uidvalidity = uidvalidity
+        state.last_uid = last_uid
+    elif last_uid > (state.last_uid or 0):
+        state.last_uid = last_uid
+    db.commit()
+
+
+def search_new_uids(mail: imaplib.IMAP4, last_uid: int, bootstrap_criteria: str) -> list[int]:
+    """
+    UIDs of messages newer than ``last_uid``, in ascending order.
+
+    With no cursor yet (``last_uid == 0``) the ``bootstrap_criteria`` search
+    is used instead.  Note ``UID n:*`` always matches the highest UID even
+    when it is below n, hence the explicit filter.
+    """
+    if last_uid > 0:
+        criteria = f"UID {last_uid + 1}:*"
+    else:
+        criteria = bootstrap_criteria
+    typ, data = mail.uid("SEARCH", None, criteria)
+    if typ != "OK":
+        raise imaplib.IMAP4.error(f"UID SEARCH {criteria} failed: {typ}")
+    uids = sorted(int(u) for u in (data[0] or b"").split())
+    return [u for u in uids if u > last_uid]
+
+
+def high_water_mark(candidates: list[int], completed: set[int], previous: int) -> int:
+    """
+    Highest UID the cursor may advance to: every candidate up to it must be
+    completed, so a message left unprocessed is picked up again next poll.
+    """
+    mark = previous
+    for uid in sorted(candidates):
+        if uid not in completed:
+            break
+        mark = uid
+    return mark
@@ -0,0 +1,741 @@
+"""
+Email ingestion as a service: IMAP → pipeline → tickets, no HTTP involved.
+
+fetch_emails() is the whole batch behind POST /fetch_emails.  It used to
+live inside the endpoint, so the lifespan poller reached it through an
+HTTP request to its own port — a blocking ``requests.post`` on the event
+loop that also held one of the server's request slots for minutes.  Now
+the endpoint, its background task and the poller all call this function
+directly; the poller runs it with ``asyncio.to_thread`` so the event loop
+stays free.  Every step opens its own short-lived SessionLocal() session.
+"""
+
+import os
+import json
+import uuid
+import imaplib
+import threading
+import time as _time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import Ticket, TicketPriority, TicketCategory, JobState
+from schemas import TicketAnalysisWithDraft
+from agent import ANALYSIS_MODE, analyze_for_ticket, analyze_cascade
+from drafts import schedule_pregeneration
+from urgency_classifier import classify_urgency, get_parent_category, provisional_priority, urgency_rank
+from pipeline import Stage, PipelineAbort, run_pipeline
+from llm_scheduler import scheduler, RateLimitExhausted
+from email_trim import trim_stats
+from imap_sync import get_uidvalidity, load_cursor, save_cursor, search_new_uids, high_water_mark
+from imap_fetch import IMAP_FETCH_BATCH_SIZE, chunked, fetch_headers, fetch_text_parts
+from dedup import content_sha256, known_message_ids, known_hashes
+from job_queue import new_worker_id, known_uids, enqueue, claim, advance, fail, release
+from fetch_runs import RunProgress
+from mailboxes import configured_mailboxes, quote_folder, fair_interleave
+from imap_pool import SeenFlags, session_pool
+
+# ── Pipeline: worker threads per stage + queue bound ──
+PIPELINE_FETCH_WORKERS = int(os.getenv("PIPELINE_FETCH_WORKERS", "2"))
+PIPELINE_PARSE_WORKERS = int(os.getenv("PIPELINE_PARSE_WORKERS", "2"))
+PIPELINE_ANALYSIS_WORKERS = int(os.getenv("PIPELINE_ANALYSIS_WORKERS", "4"))
+PIPELINE_PERSIST_WORKERS = int(os.getenv("PIPELINE_PERSIST_WORKERS", "1"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "10"))
+
+# "uid" = incremental sync from the stored UID cursor, "since" = last 2 days
+EMAIL_SYNC_MODE = os.getenv("EMAIL_SYNC_MODE", "uid").lower()
+
+# In "since" mode the headers of the newest max_emails × PRE_TRIAGE_LOOKAHEAD
+# messages are scanned so a fraud email queued behind a burst still makes
+# this run; in "uid" mode every message past the cursor is.
+PRE_TRIAGE_LOOKAHEAD = int(os.getenv("PRE_TRIAGE_LOOKAHEAD", "4"))
+
+# Mailboxes opened / searched concurrently at the start of a batch
+MAILBOX_CONNECT_WORKERS = int(os.getenv("MAILBOX_CONNECT_WORKERS", "4"))
+
+# Urgency classification runs next to each analyse worker's agent call
+_classifier_pool = ThreadPoolExecutor(max_workers=PIPELINE_ANALYSIS_WORKERS, thread_name_prefix="classify")
+
+
+class IngestionError(RuntimeError):
+    """The batch could not run (credentials, IMAP connection, search, ...)."""
+
+
+# ─────────────────── Priority resolution ───────────────────
+
+PRIORITY_MAP = {
+    "High": TicketPriority.HIGH,
+    "Medium": TicketPriority.MEDIUM,
+    "Low": TicketPriority.LOW,
+}
+
+CATEGORY_MAP = {
+    "Fraud": TicketCategory.FRAUD,
+    "Payment Issue": TicketCategory.PAYMENT_ISSUE,
+    "General": TicketCategory.GENERAL,
+}
+
+
+def resolve_priority(email_text: str, agent_priority: str, agent_category: str, clf=None):
+    """
+    Two-pass priority resolution:
+      1. Agent (llama-3.3-70b) provides initial priority + category.
+      2. Urgency classifier (llama-3.1-8b, 12 sub-categories) runs as a
+         fast second opinion.  Pass its result as ``clf`` when it was
+         already computed concurrently with the agent call.
+
+    Rules:
+      • If the classifier returns a HIGHER urgency than the agent → promote.
+      • If the classifier has confidence >= 0.75 → trust it outright.
+      • Otherwise keep the agent's original priority.
+      • Also return the classifier's subcategory + SLA for metadata.
+    """
+    if clf is None:
+        try:
+            clf = classify_urgency(email_text)
+        except Exception:
+            # Classifier failed — fall back to agent's judgement
+            return agent_priority, agent_category, None
+
+    clf_urgency = clf["urgency"]
+    clf_confidence = clf["confidence"]
+    clf_subcat = clf["subcategory"]
+    clf_sla = clf["sla"]
+
+    # Numeric ranking: High=3, Medium=2, Low=1
+    _rank = {"High": 3, "Medium": 2, "Low": 1}
+    agent_rank = _rank.get(agent_priority, 2)
+    clf_rank = _rank.get(clf_urgency, 2)
+
+    # Decide final priority
+    if clf_confidence >= 0.75:
+        # High-confidence classifier result takes precedence
+        final_priority = clf_urgency
+    elif clf_rank > agent_rank:
+        # Classifier sees higher urgency — always promote
+        final_priority = clf_urgency
+    else:
+        final_priority = agent_priority
+
+    # Optionally upgrade category based on subcategory
+    final_category = agent_category
+    parent_cat = get_parent_category(clf_subcat)
+    if final_priority == "High" and parent_cat == "Fraud" and agent_category != "Fraud":
+        final_category = "Fraud"
+    elif final_priority == "High" and parent_cat == "Payment Issue" and agent_category == "General":
+        final_category = "Payment Issue"
+
+    return final_priority, final_category, {
+        "subcategory": clf_subcat,
+        "sla": clf_sla,
+        "confidence": clf_confidence,
+        "reasoning": clf["reasoning"],
+    }
+
+
+# ─────────────────── Shared stages ───────────────────
+
+class IngestionBatch:
+    """
+    Per-run state and the source-independent pipeline stages:
+
+        parse   — skip short / duplicate emails
+        analyse — one LLM call (analysis + draft) + urgency override
+        persist — save the ticket and close the job in one transaction
+
+    Every item is an ingestion_jobs snapshot (job_queue.job_item), so any
+    source that enqueues jobs — IMAP in fetch_emails(), .eml / Maildir /
+    mbox files in replay_source — runs the exact same path.  ``on_done``
+    is called with each item that reached a terminal state (e.g. to flag
+    the IMAP message \\Seen).
+    """
+
+    def __init__(self, progress: RunProgress | None = None, on_done=None, start: float | None = None):
+        self.worker_id = new_worker_id()
+        self.progress = progress
+        self.on_done = on_done
+        self.duplicates: list[int] = []
+        self.start = start or _time.time()
+        self.lock = threading.Lock()
+        self._hashes: set[str] = set()   # dedup identical emails inside this batch
+
+    # ── progress ──
+
+    def track(self, item: dict, state: str, **fields):
+        """Report an email's progress to GET /jobs/{id} (async runs only)."""
+        if self.progress is not None:
+            key = f"{item['mailbox']}:{item['uid']}"
+            self.progress.email(key, state, uid=item["uid"], subject=item.get("subject", ""),
+                                mailbox=item["mailbox"], **fields)
+
+    def _done(self, item: dict):
+        if self.on_done is not None:
+            self.on_done(item)
+
+    @staticmethod
+    def result_row(item: dict) -> dict:
+        return {
+            "ticket_id": item["ticket_id"],
+            "subject": item["subject"],
+            "sender": item["sender"],
+            "priority": item["final_pri"],
+            "category": item["final_cat"],
+        }
+
+    @staticmethod
+    def err_label(item) -> str:
+        if isinstance(item, list):  # a whole fetch chunk failed
+            return f"fetch of {len(item)} email(s)"
+        return item.get("subject", "unknown")
+
+    def on_error(self, stage: str, item, exc: Exception):
+        if self.progress is None:
+            return
+        message = f"{self.err_label(item)}: {exc}"
+        if isinstance(item, list):
+            self.progress.error(None, message)
+            for hdr in item:
+                self.track(hdr, "error", error=str(exc))
+        else:
+            self.progress.error(f"{item['mailbox']}:{item['uid']}", message)
+
+    # ── stages ──
+
+    def stages(self) -> list[Stage]:
+        """parse → analyse → persist, to follow a source's own fetch/load stage."""
+        return [
+            Stage("parse", self.parse, PIPELINE_PARSE_WORKERS),
+            Stage("analyse", self.analyse, PIPELINE_ANALYSIS_WORKERS,
+                  priority=lambda item: (urgency_rank(item["provisional"]), item.get("order", 0))),
+            Stage("persist", self.persist, PIPELINE_PERSIST_WORKERS),
+        ]
+
+    def parse(self, item: dict) -> dict | None:
+        if item["state"] != JobState.FETCHED.value:
+            return item  # resumed past this step
+        body = item.pop("body") or ""
+
+        if len(body.strip()) < 10:
+            with SessionLocal() as session:
+                advance(session, item["job_id"], self.worker_id, JobState.SKIPPED, last_error="body too short")
+            self._done(item)
+            self.track(item, "skipped", reason="body too short")
+            return None
+
+        full_text = f"From: {item['sender']}\nSubject: {item['subject']}\n\n{body}"
+        item["full_text"] = full_text
+
+        # ── Skip duplicates: within this batch, then against the DB ──
+        digest = content_sha256(full_text)
+        item["content_sha256"] = digest
+        with self.lock:
+            is_dupe = digest in self._hashes
+            self._hashes.add(digest)
+        with SessionLocal() as session:
+            if not is_dupe:
+                is_dupe = bool(known_hashes(session, [digest]))
+            if is_dupe:
+                advance(session, item["job_id"], self.worker_id, JobState.SKIPPED, last_error="duplicate")
+            else:
+                advance(session, item["job_id"], self.worker_id, JobState.PARSED,
+                        full_text=full_text, content_sha256=digest)
+        if is_dupe:
+            self.duplicates.append(item["uid"])
+            self._done(item)
+            self.track(item, "skipped", reason="duplicate")
+            return None
+
+        item["state"] = JobState.PARSED.value
+        self.track(item, "parsed")
+        print(f"  📩 Processing [{item['provisional']}]: {item['subject'][:60]}")
+        return item
+
+    def analyse(self, item: dict) -> dict:
+        if item["state"] == JobState.ANALYSED.value:
+            stored = json.loads(item["analysis_json"])
+            item["analysis"] = TicketAnalysisWithDraft.model_validate(stored["analysis"])
+            item["final_pri"], item["final_cat"] = stored["final_pri"], stored["final_cat"]
+            return item
+        # The 8B urgency classifier does not need the agent's answer: run
+        # it alongside, so each email waits for the slower call, not both.
+        # In cascade mode its answer decides whether the 70B call runs.
+        clf_future = _classifier_pool.submit(classify_urgency, item["full_text"])
+        # llm_scheduler queues and retries 429s; it only gives up when
+        # the quota will not recover soon — then abort the batch.
+        try:
+            if ANALYSIS_MODE == "cascade":
+                try:
+                    early_clf = clf_future.result()
+                except Exception:
+                    early_clf = None
+                combined = analyze_cascade(item["full_text"], early_clf)
+            else:
+                combined = analyze_for_ticket(item["full_text"])
+        except RateLimitExhausted as ai_err:
+            clf_future.cancel()
+            raise PipelineAbort("rate_limit") from ai_err
+        except Exception:
+            clf_future.cancel()
+            raise
+        try:
+            clf = clf_future.result()
+        except Exception:
+            clf = None  # resolve_priority() classifies again / keeps the agent's call
+        item["analysis"] = combined
+        item["final_pri"], item["final_cat"], _ = resolve_priority(
+            item["full_text"], combined.priority.value, combined.category.value, clf=clf,
+        )
+        with SessionLocal() as session:
+            advance(session, item["job_id"], self.worker_id, JobState.ANALYSED, analysis_json=json.dumps({
+                "analysis": combined.model_dump(mode="json"),
+                "final_pri": item["final_pri"],
+                "final_cat": item["final_cat"],
+            }))
+        self.track(item, "analysed", priority=item["final_pri"], category=item["final_cat"])
+        return item
+
+    def persist(self, item: dict) -> dict | None:
+        analysis = item["analysis"]
+        sender = item["sender"]
+        with SessionLocal() as session:
+            ticket = Ticket(
+                id=uuid.uuid4(),
+                customer_name=analysis.entities.customer_name or sender.split("<")[0].strip() or "Unknown",
+                email_body=item["full_text"],
+                status="New",
+                priority=PRIORITY_MAP.get(item["final_pri"], TicketPriority.MEDIUM),
+                category=CATEGORY_MAP.get(item["final_cat"], TicketCategory.GENERAL),
+                sentiment=analysis.sentiment.value,
+                intent=analysis.intent,
+                summary=analysis.summary,
+                transaction_id=analysis.entities.transaction_id,
+                amount=analysis.entities.amount,
+                draft_response=analysis.draft_response or None,   # empty in DRAFT_MODE=lazy
+                message_id=item["message_id"],
+                content_sha256=item["content_sha256"],
+            )
+            session.add(ticket)
+            if not advance(session, item["job_id"], self.worker_id, JobState.SAVED,
+                           commit=False, ticket_id=ticket.id):
+                session.rollback()  # lease lost: another worker owns this job now
+                self.track(item, "skipped", reason="taken over by another worker")
+                return None
+            try:
+                session.commit()
+            except IntegrityError:
+                # Saved meanwhile by a concurrent fetch (poller vs. manual run)
+                session.rollback()
+                advance(session, item["job_id"], self.worker_id, JobState.SKIPPED, last_error="duplicate")
+                self.duplicates.append(item["uid"])
+                self._done(item)
+                self.track(item, "skipped", reason="duplicate")
+                return None
+            item["ticket_id"] = str(ticket.id)
+
+        schedule_pregeneration(ticket.id, item["final_pri"])
+        self._done(item)
+        if self.progress is not None:
+            self.progress.ticket(f"{item['mailbox']}:{item['uid']}", self.result_row(item))
+        print(f"    ✅ Ticket {item['ticket_id'][:8]} | {item['final_pri']} | {item['final_cat']}  "
+              f"({_time.time() - self.start:.1f}s elapsed)")
+        return item
+
+    def finish(self, run: dict | None):
+        """Count failed jobs as an attempt and release every lease still held."""
+        with SessionLocal() as session:
+            for err in (run["errors"] if run else []):
+                if isinstance(err["item"], dict) and "job_id" in err["item"] \
+                        and not isinstance(err["error"], PipelineAbort):
+                    fail(session, err["item"]["job_id"], self.worker_id, str(err["error"]))
+            release(session, self.worker_id)
+
+
+# ─────────────────── Batch ───────────────────
+
+def _open_mailbox(box: dict, include_read: bool, sync_mode: str, window: int) -> dict:
+    """
+    Connect to one mailbox, search it and prefetch headers.
+
+    Returns the mailbox's run state ("source"): its connection, cursor,
+    candidate headers (most urgent first) and the UIDs to flag / count as
+    done.  Errors are stored in ``source["error"]`` so one broken inbox
+    does not stop the others.
+    """
+    key = box["key"]
+    source = {
+        "box": box, "key": key, "mail": None, "error": None,
+        "use_cursor": sync_mode == "uid" and not include_read,
+        "uidvalidity": 0, "last_uid": 0, "uids": [], "candidates": [],
+        "seen": SeenFlags(),   # messages to flag \Seen once the run is over
+        "duplicates": [],
+        "enqueued": set(),     # UIDs now durable in ingestion_jobs
+        "jobbed": set(),       # UIDs that had a job before this run
+        "headers": 0, "kb": 0.0,
+    }
+    try:
+        mail = source["mail"] = session_pool.acquire(box)
+        print(f"  ✅ Session ready for {box['user']} / {box['folder']}")
+
+        # Use date-based search instead of UNSEEN to catch emails that
+        # were auto-marked as read by Gmail / phone within seconds.
+        # This way we never miss emails. In uid mode the stored cursor
+        # limits the search to messages we have never seen; duplicates
+        # are still filtered by Message-ID / content hash below.
+        # (IMAP SINCE uses date only, no time)
+        since_date = (datetime.now() - timedelta(days=2)).strftime("%d-%b-%Y")
+        since_criteria = f'(SINCE "{since_date}")'
+
+        uidvalidity = source["uidvalidity"] = get_uidvalidity(mail, quote_folder(box["folder"]))
+        if source["use_cursor"]:
+            with SessionLocal() as session:
+                last_uid = source["last_uid"] = load_cursor(session, key, uidvalidity)
+            uids = search_new_uids(mail, last_uid, since_criteria)
+            print(f"  🔍 [{key}] UID sync from {last_uid + 1 if last_uid else since_criteria}  uidvalidity={uidvalidity}")
+            # Every new UID is pre-triaged (headers only), not just the
+            # oldest ``window``: a High email that arrives behind a burst
+            # still makes this run.  The cursor only advances over a
+            # contiguous durable prefix, and UIDs that already have a job
+            # are skipped, so taking newer mail first leaves no gaps.
+        else:
+            search_criteria = "ALL" if include_read else since_criteria
+            status, messages = mail.uid("SEARCH", None, search_criteria)
+            print(f"  🔍 [{key}] Search criteria: {search_criteria}  status: {status}")
+            if status != "OK":
+                raise IngestionError("Could not search mailbox.")
+            # Take only the most recent emails (last items = newest)
+            uids = [int(u) for u in messages[0].split()][-window:]
+        source["uids"] = uids
+
+        # ── Header prefetch: one UID FETCH per batch, no bodies ──
+        headers = {}
+        for chunk in chunked(uids):
+            headers.update(fetch_headers(mail, chunk))
+        candidates = []
+        for uid in uids:
+            hdr = headers.get(uid)
+            if hdr is None:
+                source["seen"].add(uid)  # expunged since the search
+            else:
+                candidates.append({**hdr, "mailbox": key, "uidvalidity": uidvalidity})
+        # One IN (...) query each against the tickets and jobs tables
+        with SessionLocal() as session:
+            known_ids = known_message_ids(session, [h["message_id"] for h in candidates])
+            source["jobbed"] = known_uids(session, key, uidvalidity, [h["uid"] for h in candidates])
+        for hdr in candidates:
+            if hdr["message_id"] in known_ids:
+                source["duplicates"].append(hdr["uid"])
+                source["seen"].add(hdr["uid"])
+        candidates = [
+            h for h in candidates
+            if h["message_id"] not in known_ids and h["uid"] not in source["jobbed"]
+        ]
+
+        # ── Pre-triage: keyword guess from subject/sender, no LLM ──
+        # Most urgent first (oldest first in uid mode, newest first otherwise)
+        for hdr in candidates:
+            hdr["provisional"] = provisional_priority(hdr["subject"], hdr["sender"])
+        order = 1 if source["use_cursor"] else -1
+        candidates.sort(key=lambda h: (urgency_rank(h["provisional"]), order * h["uid"]))
+        source["candidates"] = candidates
+        source["headers"] = len(headers)
+        source["kb"] = sum(h["size"] or 0 for h in headers.values()) / 1024
+        print(f"  📑 [{key}] Headers: {len(headers)} message(s), {source['kb']:.0f} KB on server, "
+              f"{len(candidates)} new after Message-ID check")
+    except Exception as e:
+        print(f"  ❌ [{key}] Mailbox unavailable: {e}")
+        source["error"] = str(e)
+    return source
+
+
+def _flush_seen(source: dict) -> int:
+    """
+    Flag the run's \\Seen UIDs.  The mailbox session has been idle since
+    the header prefetch, so it is health-checked (or replaced) first; a
+    failed STORE is retried once on a fresh session.
+    """
+    for attempt in (1, 2):
+        try:
+            source["mail"] = session_pool.revalidate(source["box"], source["mail"])
+            return source["seen"].flush(source["mail"])
+        except Exception:
+            if source["mail"] is not None:
+                session_pool.release(source["box"], source["mail"], broken=True)
+                source["mail"] = None
+            if attempt == 2:
+                raise
+
+
+def _close_mailbox(source: dict):
+    """Hand the mailbox session back to the pool (logged out if it failed)."""
+    mail = source.get("mail")
+    if mail is None:
+        return
+    session_pool.release(source["box"], mail, broken=bool(source["error"]))
+    source["mail"] = None
+
+
+def fetch_emails(
+    include_read: bool,
+    max_emails: int,
+    sync_mode: str,
+    progress: RunProgress | None = None,
+) -> dict:
+    """
+    Connect to every configured mailbox (mailboxes.configured_mailboxes:
+    EMAIL_ACCOUNTS, or EMAIL_USER + EMAIL_FOLDERS), pull emails, analyse
+    each one with the AI agent, save tickets, and return a summary.
+
+    - sync_mode=uid (default) fetches only messages newer than the UID
+      high-water mark stored in mailbox_sync_state for each mailbox; the
+      first sync falls back to the last 2 days.
+    - sync_mode=since searches the last 2 days and relies on dedup.
+    - Set include_read=true to re-fetch ALL emails (useful for testing);
+      this ignores the cursor.
+
+    Mailboxes are opened, searched and header-prefetched concurrently,
+    each on its own IMAP connection, then feed one shared pipeline.  The
+    batch is shared fairly: within each pre-triage tier (High, then
+    Medium, then Low) mailboxes take turns, so one busy inbox cannot
+    starve the others.  A mailbox that cannot be reached is reported and
+    skipped.
+
+    Headers for the whole batch are prefetched in one UID FETCH so known
+    Message-IDs are skipped before any body is downloaded; the fetch stage
+    then pulls only the text part of each message, IMAP_FETCH_BATCH_SIZE
+    messages per command.
+
+    Emails flow through a staged pipeline (fetch → parse → analyse →
+    persist) with bounded queues and PIPELINE_*_WORKERS threads per stage,
+    so a batch takes about as long as its slowest stage.
+
+    Every fetched email is recorded in the ingestion_jobs table and moves
+    fetched → parsed → analysed → saved there; jobs left unfinished by a
+    crash or rate-limit abort are claimed and resumed at the start of the
+    next run (counted against max_emails).
+
+    A keyword pre-triage on subject/sender (urgency_classifier.provisional_priority)
+    picks which max_emails to take from a larger header window and orders
+    the analysis queue, so High emails reach the LLM first during bursts.
+
+    ``progress`` (optional) receives each email's state as it moves
+    through the stages, for GET /jobs/{id}.
+    """
+    boxes = configured_mailboxes()
+    if not boxes:
+        raise IngestionError(
+            "EMAIL_USER and EMAIL_PASSWORD (or EMAIL_ACCOUNTS) must be set in the .env file."
+        )
+
+    _start = _time.time()
+    print(f"📧 fetch_emails called  include_read={include_read}  max_emails={max_emails}  "
+          f"mailboxes={len(boxes)}")
+
+    # ── Connect + search + header prefetch, all mailboxes in parallel ──
+    window = max_emails * PRE_TRIAGE_LOOKAHEAD
+    with ThreadPoolExecutor(max_workers=min(len(boxes), MAILBOX_CONNECT_WORKERS)) as pool:
+        sources = list(pool.map(lambda b: _open_mailbox(b, include_read, sync_mode, window), boxes))
+    by_key = {src["key"]: src for src in sources}
+    mailbox_errors = [f"{src['key']}: {src['error']}" for src in sources if src["error"]]
+    if len(mailbox_errors) == len(sources):
+        for src in sources:
+            _close_mailbox(src)
+        raise IngestionError(f"IMAP connection failed: {'; '.join(mailbox_errors)}")
+
+    try:
+        live = [src for src in sources if not src["error"]]
+
+        def _done(item: dict):
+            """Flag the source message \\Seen if its mailbox is open in this run."""
+            src = by_key.get(item["mailbox"])
+            if src and src["mail"] is not None and item["uidvalidity"] == src["uidvalidity"]:
+                src["seen"].add(item["uid"])
+
+        batch = IngestionBatch(progress, on_done=_done, start=_start)
+        batch.duplicates.extend(uid for src in live for uid in src["duplicates"])
+        worker_id = batch.worker_id
+
+        # ── Resume jobs left unfinished by earlier runs (crash / rate limit) ──
+        with SessionLocal() as session:
+            resumed = claim(session, worker_id, limit=max_emails)
+        if resumed:
+            print(f"  ♻️  Resuming {len(resumed)} unfinished job(s): "
+                  + ", ".join(f"{j['state']}" for j in resumed))
+
+        # ── Fair share: per tier, mailboxes take turns ──
+        budget = max(0, max_emails - len(resumed))
+        candidates = []
+        for tier in ("High", "Medium", "Low"):
+            candidates += fair_interleave(
+                {src["key"]: [h for h in src["candidates"] if h["provisional"] == tier] for src in live},
+                budget - len(candidates),
+            )
+        for n, item in enumerate(resumed + candidates):
+            item["order"] = n  # analysis-queue tie-break: selection order
+        print("  🚦 Pre-triage: " + ", ".join(
+            f"{p}={sum(1 for h in candidates if h['provisional'] == p)}" for p in ("High", "Medium", "Low")
+        ) + (f"  across {len(live)} mailbox(es)" if len(live) > 1 else ""))
+
+        if progress is not None:
+            progress.set_total(len(resumed) + len(candidates))
+            for item in resumed + candidates:
+                batch.track(item, "queued", provisional=item["provisional"])
+
+        # Spread the bodies over the fetch workers, one FETCH per chunk of
+        # one mailbox; chunks of different mailboxes alternate.
+        per_worker = -(-len(candidates) // PIPELINE_FETCH_WORKERS) if candidates else 1
+        chunk_size = min(IMAP_FETCH_BATCH_SIZE, per_worker)
+        fetch_chunks = fair_interleave(
+            {src["key"]: chunked([h for h in candidates if h["mailbox"] == src["key"]], chunk_size)
+             for src in live},
+            len(candidates),
+        )
+
+        # IMAP connections are not thread-safe: each fetch worker borrows
+        # its own pooled session per mailbox for the run.
+        _local = threading.local()
+        worker_conns = []   # (box, conn) to hand back to the pool
+
+        # ── Stage 1: fetch the text part of a chunk of messages → jobs ──
+        def _fetch_stage(work) -> list[dict] | dict:
+            if isinstance(work, dict):
+                return work  # resumed job: already fetched
+            src = by_key[work[0]["mailbox"]]
+            conns = getattr(_local, "conns", None)
+            if conns is None:
+                conns = _local.conns = {}
+            conn = conns.get(src["key"])
+            if conn is None:
+                conn = conns[src["key"]] = session_pool.acquire(src["box"])
+                with batch.lock:
+                    worker_conns.append((src["box"], conn))
+            try:
+                texts = fetch_text_parts(conn, [hdr["uid"] for hdr in work])
+            except (imaplib.IMAP4.abort, OSError):
+                # Dead session: log it out; the next chunk gets a fresh one
+                del conns[src["key"]]
+                with batch.lock:
+                    worker_conns.remove((src["box"], conn))
+                session_pool.release(src["box"], conn, broken=True)
+                raise
+            fetched = []
+            for hdr in work:
+                if hdr["uid"] not in texts:
+                    src["seen"].add(hdr["uid"])  # expunged since the header fetch
+                    batch.track(hdr, "skipped", reason="expunged")
+                    continue
+                fetched.append({**hdr, "body": texts[hdr["uid"]]})
+            with SessionLocal() as session:
+                jobs = enqueue(session, worker_id, src["key"], src["uidvalidity"], fetched)
+            with batch.lock:
+                src["enqueued"].update(hdr["uid"] for hdr in fetched)
+            order = {hdr["uid"]: hdr["order"] for hdr in fetched}
+            for job in jobs:
+                job["order"] = order.get(job["uid"], 0)
+            return jobs
+
+        run = None
+        try:
+            run = run_pipeline(
+                resumed + fetch_chunks,
+                [Stage("fetch", _fetch_stage, PIPELINE_FETCH_WORKERS)] + batch.stages(),
+                queue_size=PIPELINE_QUEUE_SIZE,
+                on_error=batch.on_error,
+            )
+        finally:
+            for box, conn in worker_conns:
+                session_pool.release(box, conn)
+            # Failed jobs count an attempt; everything else we still hold
+            # (e.g. left behind by a rate-limit abort) is released for the next run.
+            batch.finish(run)
+
+        for src in live:
+            # ── Advance the UID cursor past every message that is durable ──
+            # (queued as a job, finished, or known already; a failed chunk
+            # FETCH is retried next poll)
+            if src["use_cursor"]:
+                completed = src["seen"].uids() | src["enqueued"] | src["jobbed"]
+                src["last_uid"] = high_water_mark(src["uids"], completed, src["last_uid"])
+                with SessionLocal() as session:
+                    save_cursor(session, src["key"], src["uidvalidity"], src["last_uid"])
+
+            # ── \Seen for the whole run: one UID STORE per UID-set chunk ──
+            try:
+                flagged = _flush_seen(src)
+                if flagged:
+                    print(f"  ✔️  [{src['key']}] Marked {flagged} email(s) as read")
+            except Exception as e:
+                src["error"] = f"could not flag \\Seen: {e}"
+                print(f"  ⚠️  [{src['key']}] {src['error']}")
+
+        results = [batch.result_row(item) for item in run["results"]]
+        errors = [
+            f"{batch.err_label(err['item'])}: {err['error']}"
+            for err in run["errors"]
+            if not isinstance(err["error"], PipelineAbort)
+        ]
+        errors = mailbox_errors + errors
+        for err in errors:
+            print(f"    ❌ Error: {err}")
+        skipped_dupes = len(batch.duplicates)
+        elapsed = round(_time.time() - batch.start, 1)
+        last_uid = sources[0]["last_uid"] if sources[0]["use_cursor"] else None
+        mailboxes = {
+            src["key"]: {
+                "found": len(src["uids"]),
+                "selected": sum(1 for h in candidates if h["mailbox"] == src["key"]),
+                "last_uid": src["last_uid"] if src["use_cursor"] else None,
+                "error": src["error"],
+            }
+            for src in sources
+        }
+        print(f"  ⏱️  Stage busy time: {run['stage_seconds']}  LLM scheduler: {scheduler.stats}  "
+              f"Trimmed tokens: {trim_stats['tokens_before']} → {trim_stats['tokens_after']}")
+
+        if run["aborted"] == "rate_limit":
+            print(f"  🚫 Groq API rate limit hit after {elapsed}s")
+            return {
+                "fetched": len(results),
+                "errors": len(errors) + 1,
+                "skipped_duplicates": skipped_dupes,
+                "tickets": results,
+                "error_details": [
+                    "⚠️ Groq API quota exhausted (rate limit did not clear within the retry window). "
+                    "Remaining emails will be picked up on the next fetch."
+                ] + errors[:9],
+                "message": f"Processed {len(results)} email(s) before hitting rate limit.",
+                "quota_error": True,
+                "sync_mode": sync_mode,
+                "last_uid": last_uid,
+                "mailboxes": mailboxes,
+                "resumed_jobs": len(resumed),
+            }
+
+        msg = f"Fetched and processed {len(results)} email(s) in {elapsed}s."
+        if skipped_dupes:
+            msg += f" Skipped {skipped_dupes} duplicate(s)."
+        print(f"  📊 Done: {msg}")
+
+        return {
+            "fetched": len(results),
+            "errors": len(errors),
+            "skipped_duplicates": skipped_dupes,
+            "tickets": results,
+            "error_details": errors[:10],
+            "message": msg,
+            "sync_mode": sync_mode,
+            "last_uid": last_uid,
+            "mailboxes": mailboxes,
+            "resumed_jobs": len(resumed),
+        }
+
+    except IngestionError:
+        raise
+    except Exception as e:
+        print(f"  ❌ Email processing failed: {e}")
+        raise IngestionError(f"Email processing failed: {e}") from e
+    finally:
+        for src in sources:
+            _close_mailbox(src)
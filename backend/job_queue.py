@@ -0,0 +1,239 @@
+"""
+Durable ingestion job queue backed by the ``ingestion_jobs`` table.
+
+Every email that leaves IMAP becomes a row that moves through
+
+    fetched → parsed → analysed → saved      (or skipped / failed)
+
+and carries the data produced so far (body, full_text, analysis JSON).
+If the process dies mid-batch, the next run claims the unfinished rows
+and resumes each one from its last state instead of re-fetching and
+re-analysing it; the IMAP cursor can advance as soon as a row exists.
+
+Claiming uses ``SELECT ... FOR UPDATE SKIP LOCKED`` plus a lease
+(``claimed_by`` / ``claimed_until``), so several workers — the
+background poller, a manual /fetch_emails, email_ingestion.py — drain
+the queue in parallel without taking the same row.  SQLite has no row
+locks; there SKIP LOCKED is a no-op and the lease alone applies.
+"""
+
+import os
+import uuid
+import socket
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import IngestionJob, JobState
+
+logger = logging.getLogger("job_queue")
+
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+ACTIVE_STATES = (JobState.FETCHED, JobState.PARSED, JobState.ANALYSED)
+TERMINAL_STATES = (JobState.SAVED, JobState.SKIPPED, JobState.FAILED)
+
+_IN_CHUNK = 500
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _lease() -> datetime:
+    return _now() + timedelta(seconds=JOB_LEASE_SECONDS)
+
+
+def new_worker_id() -> str:
+    """Unique claim owner for one run (host, pid and a random suffix)."""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"[:64]
+
+
+def job_item(job: IngestionJob) -> dict:
+    """Plain-dict snapshot of a job, safe to hand to pipeline threads."""
+    return {
+        "job_id": job.id,
+        "mailbox": job.mailbox,
+        "uidvalidity": job.uidvalidity,
+        "uid": job.uid,
+        "message_id": job.message_id,
+        "state": JobState(job.state).value,
+        "provisional": job.provisional_priority or "Medium",
+        "subject": job.subject or "",
+        "sender": job.sender or "",
+        "body": job.body,
+        "full_text": job.full_text,
+        "content_sha256": job.content_sha256,
+        "analysis_json": job.analysis_json,
+        "attempts": job.attempts,
+    }
+
+
+# ─────────────────── Enqueue ───────────────────
+
+def known_uids(db: Session, mailbox: str, uidvalidity: int, uids) -> set[int]:
+    """UIDs of ``mailbox`` that already have a job (in any state)."""
+    wanted = list(set(uids))
+    known: set[int] = set()
+    for i in range(0, len(wanted), _IN_CHUNK):
+        rows = (
+            db.query(IngestionJob.uid)
+            .filter(
+                IngestionJob.mailbox == mailbox,
+                IngestionJob.uidvalidity == uidvalidity,
+                IngestionJob.uid.in_(wanted[i:i + _IN_CHUNK]),
+            )
+            .all()
+        )
+        known.update(int(r[0]) for r in rows)
+    return known
+
+
+def enqueue(db: Session, worker_id: str, mailbox: str, uidvalidity: int, items: list[dict]) -> list[dict]:
+    """
+    Insert one ``fetched`` job per item (keys: uid, message_id, subject,
+    sender, body, provisional), already claimed by ``worker_id``.
+
+    Items that already have a job are skipped.  Returns the snapshots of
+    the jobs actually created.
+    """
+    existing = known_uids(db, mailbox, uidvalidity, [it["uid"] for it in items])
+    jobs = [
+        IngestionJob(
+            id=uuid.uuid4(),
+            mailbox=mailbox,
+            uidvalidity=uidvalidity,
+            uid=it["uid"],
+            message_id=it.get("message_id"),
+            state=JobState.FETCHED,
+            provisional_priority=it.get("provisional"),
+            subject=it.get("subject"),
+            sender=it.get("sender"),
+            body=it.get("body"),
+            attempts=0,
+            claimed_by=worker_id,
+            claimed_until=_lease(),
+        )
+        for it in items
+        if it["uid"] not in existing
+    ]
+    if not jobs:
+        return []
+    snapshots = [job_item(job) for job in jobs]
+    db.add_all(jobs)
+    try:
+        db.commit()
+        return snapshots
+    except IntegrityError:
+        # Another worker enqueued some of these meanwhile — insert one by one
+        db.rollback()
+    created = []
+    for job, snap in zip(jobs, snapshots):
+        db.add(job)
+        try:
+            db.commit()
+            created.append(snap)
+        except IntegrityError:
+            db.rollback()
+    return created
+
+
+# ─────────────────── Claim / advance ───────────────────
+
+def claim(
+    db: Session,
+    worker_id: str,
+    limit: int = 50,
+    states: tuple = ACTIVE_STATES,
+    mailbox: str | None = None,
+) -> list[dict]:
+    """
+    Lease up to ``limit`` unfinished jobs whose lease is free or expired,
+    oldest first.  Rows locked by a concurrent claimer are skipped.
+    """
+    query = (
+        db.query(IngestionJob)
+        .filter(IngestionJob.state.in_(states))
+        .filter(or_(IngestionJob.claimed_until.is_(None), IngestionJob.claimed_until < _now()))
+        .filter(IngestionJob.attempts < JOB_MAX_ATTEMPTS)
+    )
+    if mailbox:
+        query = query.filter(IngestionJob.mailbox == mailbox)
+    jobs = (
+        query.order_by(IngestionJob.created_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    lease = _lease()
+    for job in jobs:
+        job.claimed_by = worker_id
+        job.claimed_until = lease
+    snapshots = [job_item(job) for job in jobs]
+    db.commit()
+    if snapshots:
+        logger.info("Claimed %d unfinished ingestion job(s) for %s", len(snapshots), worker_id)
+    return snapshots
+
+
+def advance(db: Session, job_id, worker_id: str, state: JobState, commit: bool = True, **fields) -> bool:
+    """
+    Move a job we hold to ``state`` (storing ``fields``) and renew the lease.
+
+    Returns False when the lease was lost to another worker; nothing is
+    written then.  With ``commit=False`` the update joins the caller's
+    transaction (e.g. together with the Ticket insert).
+    """
+    values = {"state": state, "updated_at": _now(), **fields}
+    if state in TERMINAL_STATES:
+        values.update(claimed_by=None, claimed_until=None)
+    else:
+        values["claimed_until"] = _lease()
+    updated = (
+        db.query(IngestionJob)
+        .filter(IngestionJob.id == job_id, IngestionJob.claimed_by == worker_id)
+        .update(values, synchronize_session=False)
+    )
+    if commit:
+        db.commit()
+    return updated == 1
+
+
+def fail(db: Session, job_id, worker_id: str, error: str) -> JobState | None:
+    """
+    Record a failed attempt and release the job for a later retry, or
+    mark it ``failed`` after JOB_MAX_ATTEMPTS.  Returns the new state.
+    """
+    job = db.get(IngestionJob, job_id)
+    if job is None or job.claimed_by != worker_id:
+        return None
+    job.attempts = (job.attempts or 0) + 1
+    job.last_error = error[:2000]
+    if job.attempts >= JOB_MAX_ATTEMPTS:
+        job.state = JobState.FAILED
+    job.claimed_by = None
+    job.claimed_until = None
+    state = JobState(job.state)
+    db.commit()
+    return state
+
+
+def release(db: Session, worker_id: str) -> int:
+    """Drop every lease ``worker_id`` still holds (run ended or aborted)."""
+    released = (
+        db.query(IngestionJob)
+        .filter(IngestionJob.claimed_by == worker_id)
+        .update({"claimed_by": None, "claimed_until": None}, synchronize_session=False)
+    )
+    db.commit()
+    return released
+
+
+def queue_depth(db: Session) -> dict[str, int]:
+    """Number of jobs per state."""
+    rows = db.query(IngestionJob.state, func.count()).group_by(IngestionJob.state).all()
+    return {JobState(state).value: count for state, count in rows}
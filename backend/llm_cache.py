@@ -0,0 +1,127 @@
+"""
+Durable LLM result cache shared by every process and restart.
+
+cache.BoundedCache lives in process memory: it is empty after each
+redeploy and not shared between uvicorn workers, so the same email
+forwarded to two inboxes — or retried after a restart — paid for the 70B
+call again.  PersistentCache stores each result in the ``llm_cache``
+table, keyed by
+
+    (kind, model, prompt_version, content_sha256)
+
+where ``prompt_version`` is a short hash of the system prompt and output
+schema (prompt_version()).  Editing a prompt or schema changes the
+version, so stale entries are simply never looked up again — no manual
+invalidation.
+
+The table lives in the app database by default; LLM_CACHE_URL points it
+elsewhere (e.g. ``sqlite:///llm_cache.db`` for local runs, created on
+first use).  LLM_CACHE_ENABLED=false turns it off.  The cache is an
+optimisation only: any database error is logged and treated as a miss.
+The in-memory BoundedCache stays in front of it for hot entries.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+from cache import register_stats
+
+logger = logging.getLogger("llm_cache")
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_URL = os.getenv("LLM_CACHE_URL", "").strip()
+
+_session_factory = None
+_factory_lock = threading.Lock()
+
+
+def prompt_version(*parts) -> str:
+    """12-hex-digit fingerprint of the prompt text / schema that shape a result."""
+    digest = hashlib.sha256()
+    for part in parts:
+        text = part if isinstance(part, str) else json.dumps(part, sort_keys=True, default=str)
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:12]
+
+
+def _sessions():
+    """Session factory for the cache table (app DB unless LLM_CACHE_URL is set)."""
+    global _session_factory
+    if _session_factory is None:
+        with _factory_lock:
+            if _session_factory is None:
+                if LLM_CACHE_URL:
+                    from sqlalchemy import create_engine
+                    from sqlalchemy.orm import sessionmaker
+                    from models import LLMCacheEntry
+
+                    engine = create_engine(LLM_CACHE_URL, pool_pre_ping=True)
+                    LLMCacheEntry.__table__.create(bind=engine, checkfirst=True)
+                    _session_factory = sessionmaker(autoflush=False, bind=engine)
+                else:
+                    from database import SessionLocal
+
+                    _session_factory = SessionLocal
+    return _session_factory
+
+
+class PersistentCache:
+    """One kind of LLM result ("analysis", "urgency", ...) for one model + prompt version."""
+
+    def __init__(self, kind: str, model: str, version: str):
+        self.kind = kind
+        self.model = model
+        self.version = version
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "errors": 0}
+        register_stats(f"persistent:{kind}", self.stats)
+
+    def get(self, content_key: str) -> dict | None:
+        """Stored result for ``content_key`` (a SHA-256 of the LLM input), or None."""
+        if not LLM_CACHE_ENABLED:
+            return None
+        try:
+            from models import LLMCacheEntry
+
+            with _sessions()() as session:
+                entry = session.get(LLMCacheEntry, (self.kind, self.model, self.version, content_key))
+                value = json.loads(entry.value_json) if entry is not None else None
+        except Exception as exc:
+            self._stats["errors"] += 1
+            logger.warning("LLM cache read failed (%s); calling the model instead.", exc)
+            return None
+        self._stats["hits" if value is not None else "misses"] += 1
+        return value
+
+    def set(self, content_key: str, value: dict):
+        if not LLM_CACHE_ENABLED:
+            return
+        try:
+            from models import LLMCacheEntry
+
+            with _sessions()() as session:
+                session.add(LLMCacheEntry(
+                    kind=self.kind,
+                    model=self.model,
+                    prompt_version=self.version,
+                    content_sha256=content_key,
+                    value_json=json.dumps(value, default=str),
+                ))
+                try:
+                    session.commit()
+                except IntegrityError:
+                    session.rollback()  # stored meanwhile by another worker
+                    return
+            self._stats["writes"] += 1
+        except Exception as exc:
+            self._stats["errors"] += 1
+            logger.warning("LLM cache write failed: %s", exc)
+
+    def stats(self) -> dict:
+        return {**self._stats, "enabled": LLM_CACHE_ENABLED, "model": self.model,
+                "prompt_version": self.version}
@@ -0,0 +1,332 @@
+"""
+Central rate-limit-aware scheduler for Groq LLM calls.
+
+Every email costs two Groq requests (analyze_and_draft on the 70B model,
+classify_urgency on the 8B model), and a batch used to fire them as fast
+as the worker threads allowed — the first 429 then aborted the run.
+All LLM calls now go through one process-wide scheduler:
+
+  • Token buckets per model for requests-per-minute and tokens-per-minute.
+    A call waits (queues) until both buckets can cover it instead of
+    being sent and rejected.
+  • Groq's ``x-ratelimit-*`` response headers are read by an httpx
+    response hook on the SDK clients, so the buckets track the server's
+    view (remaining tokens, daily request quota, reset times) rather than
+    only our own estimate.
+  • A 429 is retried with exponential backoff + jitter, honouring
+    ``retry-after``.  Only when the wait would exceed LLM_MAX_RETRY_WAIT
+    or LLM_MAX_RETRIES is used up does the call raise RateLimitExhausted.
+
+The SDK clients are built with ``max_retries=0`` so retries happen here,
+where the budget is known, and not blindly inside the SDK.  Async callers
+(``ainvoke`` / AsyncGroq) use arun() and async_http_client(), which share
+the same buckets as the threaded callers.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger("llm_scheduler")
+
+# ─────────────────── Configuration ───────────────────
+
+# Groq free-tier defaults; override with e.g.
+#   LLM_RATE_LIMITS='{"llama-3.3-70b-versatile": {"rpm": 30, "tpm": 12000}}'
+_DEFAULT_LIMITS = {
+    "llama-3.3-70b-versatile": {"rpm": 30, "tpm": 12000},
+    "llama-3.1-8b-instant": {"rpm": 30, "tpm": 6000},
+}
+_FALLBACK_LIMITS = {"rpm": 30, "tpm": 6000}
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_MAX_RETRY_WAIT = float(os.getenv("LLM_MAX_RETRY_WAIT", "90"))  # seconds
+_BASE_BACKOFF = 2.0
+_ASYNC_POLL = 1.0   # aacquire() re-check interval (it is not woken by observe())
+
+
+def _load_limits() -> dict[str, dict]:
+    limits = {model: dict(v) for model, v in _DEFAULT_LIMITS.items()}
+    raw = os.getenv("LLM_RATE_LIMITS", "").strip()
+    if raw:
+        try:
+            for model, override in json.loads(raw).items():
+                limits.setdefault(model, dict(_FALLBACK_LIMITS)).update(override)
+        except (ValueError, AttributeError) as exc:
+            logger.warning("Ignoring malformed LLM_RATE_LIMITS (%s)", exc)
+    return limits
+
+
+class RateLimitExhausted(RuntimeError):
+    """Raised when a call is still rate-limited after every allowed retry."""
+
+
+# ─────────────────── Helpers ───────────────────
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_reset(value: str | None) -> float | None:
+    """Groq reset header ("2m59.56s", "7.66s", "120ms") → seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)  # plain seconds (retry-after)
+    except ValueError:
+        pass
+    total, matched = 0.0, False
+    for amount, unit in _DURATION_RE.findall(value):
+        matched = True
+        total += float(amount) * {"h": 3600, "m": 60, "s": 1, "ms": 0.001}[unit]
+    return total if matched else None
+
+
+def estimate_tokens(text: str, completion_tokens: int = 0) -> int:
+    """Rough token count for budgeting (~4 characters per token)."""
+    return len(text) // 4 + completion_tokens
+
+
+def is_rate_limit_error(exc: BaseException) -> bool:
+    """True for a 429 from the Groq SDK (possibly wrapped by LangChain)."""
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    text = str(exc).lower()
+    return "429" in text or "rate_limit" in text or "rate limit" in text
+
+
+def _retry_after(exc: BaseException) -> float | None:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    return parse_reset(headers.get("retry-after"))
+
+
+# ─────────────────── Token buckets ───────────────────
+
+class TokenBucket:
+    """Continuous-refill bucket: ``capacity`` units per ``period`` seconds."""
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = float(capacity)
+        self.period = period
+        self.level = float(capacity)
+        self._last = time.monotonic()
+
+    def _refill(self, now: float):
+        rate = self.capacity / self.period
+        self.level = min(self.capacity, self.level + (now - self._last) * rate)
+        self._last = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` units are available (0 if they are now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)  # oversize requests wait for a full bucket
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * self.period / self.capacity
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+    def clamp(self, remaining: float, capacity: float | None = None):
+        """Align with the server: never believe we have more than it reports."""
+        if capacity:
+            self.capacity = float(capacity)
+        self.level = min(self.level, float(remaining))
+
+
+class _ModelBudget:
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.blocked_until = 0.0   # set by 429s / exhausted daily quota
+
+
+# ─────────────────── Scheduler ───────────────────
+
+class LLMScheduler:
+    """Queues LLM calls per model so they stay inside Groq's rate limits."""
+
+    def __init__(self, limits: dict[str, dict] | None = None):
+        self._limits = limits if limits is not None else _load_limits()
+        self._budgets: dict[str, _ModelBudget] = {}
+        self._cond = threading.Condition()
+        self.stats = {"calls": 0, "retries": 0, "waited_seconds": 0.0, "exhausted": 0}
+
+    def _budget(self, model: str) -> _ModelBudget:
+        budget = self._budgets.get(model)
+        if budget is None:
+            cfg = self._limits.get(model, _FALLBACK_LIMITS)
+            budget = self._budgets[model] = _ModelBudget(cfg["rpm"], cfg["tpm"])
+        return budget
+
+    # ── Admission ──
+
+    def _admit(self, model: str, est_tokens: int, waited: float) -> float:
+        """
+        Take one request of ``est_tokens`` from the model's budget and
+        return 0, or return the seconds to wait before trying again.
+        Caller holds ``self._cond``.
+        """
+        budget = self._budget(model)
+        now = time.monotonic()
+        delay = max(
+            budget.blocked_until - now,
+            budget.requests.wait_time(1, now),
+            budget.tokens.wait_time(est_tokens, now),
+        )
+        if delay <= 0:
+            budget.requests.take(1)
+            budget.tokens.take(est_tokens)
+            self.stats["calls"] += 1
+            self.stats["waited_seconds"] += waited
+            return 0.0
+        if delay > LLM_MAX_RETRY_WAIT and budget.blocked_until - now > LLM_MAX_RETRY_WAIT:
+            self.stats["exhausted"] += 1
+            raise RateLimitExhausted(
+                f"{model} rate limit: quota resets in {delay:.0f}s"
+            )
+        return delay
+
+    def acquire(self, model: str, est_tokens: int):
+        """Block until one request of ``est_tokens`` fits the model's budget."""
+        waited = 0.0
+        with self._cond:
+            while True:
+                delay = self._admit(model, est_tokens, waited)
+                if delay <= 0:
+                    return
+                # Woken early if a response header changes the picture
+                self._cond.wait(timeout=min(delay, 5.0))
+                waited += min(delay, 5.0)
+
+    async def aacquire(self, model: str, est_tokens: int):
+        """
+        acquire() for coroutines: waits with asyncio.sleep, so a queue of
+        rate-limited requests holds no executor threads.  Re-checks at
+        least every _ASYNC_POLL seconds, since it cannot be notified.
+        """
+        waited = 0.0
+        while True:
+            with self._cond:
+                delay = self._admit(model, est_tokens, waited)
+            if delay <= 0:
+                return
+            await asyncio.sleep(min(delay, _ASYNC_POLL))
+            waited += min(delay, _ASYNC_POLL)
+
+    def block(self, model: str, seconds: float):
+        """Hold all calls to ``model`` for ``seconds`` (after a 429)."""
+        with self._cond:
+            budget = self._budget(model)
+            budget.blocked_until = max(budget.blocked_until, time.monotonic() + seconds)
+
+    # ── Server feedback (httpx response hook) ──
+
+    def observe(self, model: str, headers) -> None:
+        """Fold Groq ``x-ratelimit-*`` headers into the model's buckets."""
+        if not model or headers is None:
+            return
+        with self._cond:
+            budget = self._budget(model)
+            now = time.monotonic()
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            if remaining_tokens is not None:
+                try:
+                    budget.tokens.wait_time(0, now)  # refill before clamping
+                    budget.tokens.clamp(
+                        float(remaining_tokens),
+                        float(headers.get("x-ratelimit-limit-tokens") or 0) or None,
+                    )
+                except ValueError:
+                    pass
+            # Groq's request headers are the *daily* quota: when it is gone,
+            # nothing goes through until the reset.
+            if headers.get("x-ratelimit-remaining-requests") == "0":
+                reset = parse_reset(headers.get("x-ratelimit-reset-requests"))
+                if reset:
+                    budget.blocked_until = max(budget.blocked_until, now + reset)
+            retry_after = parse_reset(headers.get("retry-after"))
+            if retry_after:
+                budget.blocked_until = max(budget.blocked_until, now + retry_after)
+            self._cond.notify_all()
+
+    def _on_response(self, response) -> None:
+        try:
+            model = json.loads(response.request.content or b"{}").get("model")
+        except (ValueError, AttributeError):
+            return
+        self.observe(model, response.headers)
+
+    async def _aon_response(self, response) -> None:
+        self._on_response(response)
+
+    def http_client(self, timeout: float = 60.0):
+        """httpx.Client whose responses feed rate-limit headers back here."""
+        import httpx  # shipped with the groq SDK
+
+        return httpx.Client(timeout=timeout, event_hooks={"response": [self._on_response]})
+
+    def async_http_client(self, timeout: float = 60.0):
+        """httpx.AsyncClient counterpart of http_client() for AsyncGroq / ainvoke."""
+        import httpx
+
+        return httpx.AsyncClient(timeout=timeout, event_hooks={"response": [self._aon_response]})
+
+    # ── Calls ──
+
+    def run(self, model: str, fn: Callable[[], Any], est_tokens: int = 1000) -> Any:
+        """
+        Run ``fn`` (one LLM request to ``model``) inside the model's budget,
+        retrying 429s with backoff + jitter.  Raises RateLimitExhausted when
+        the limit does not clear in time.
+        """
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            self.acquire(model, est_tokens)
+            try:
+                return fn()
+            except Exception as exc:
+                self._back_off(model, exc, attempt)
+
+    async def arun(self, model: str, fn: Callable[[], Awaitable[Any]], est_tokens: int = 1000) -> Any:
+        """
+        run() for coroutines: ``fn`` returns an awaitable (e.g. a chain's
+        ainvoke).  Waiting for budget is an asyncio.sleep, not a thread —
+        up to LLM_MAX_RETRY_WAIT per call, which would otherwise starve the
+        default executor the request handlers' DB calls run in.
+        """
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            await self.aacquire(model, est_tokens)
+            try:
+                return await fn()
+            except Exception as exc:
+                self._back_off(model, exc, attempt)
+
+    def _back_off(self, model: str, exc: Exception, attempt: int):
+        """Re-raise non-429s; otherwise block ``model`` for the retry delay or give up."""
+        if not is_rate_limit_error(exc):
+            raise exc
+        if attempt == LLM_MAX_RETRIES:
+            self.stats["exhausted"] += 1
+            raise RateLimitExhausted(f"{model} still rate-limited after {attempt} retries") from exc
+        delay = _retry_after(exc)
+        if delay is None:
+            delay = _BASE_BACKOFF * (2 ** attempt)
+        delay += random.uniform(0, delay * 0.25)  # jitter: don't retry in lockstep
+        if delay > LLM_MAX_RETRY_WAIT:
+            self.stats["exhausted"] += 1
+            raise RateLimitExhausted(f"{model} rate limit: retry-after {delay:.0f}s") from exc
+        self.stats["retries"] += 1
+        logger.info("⏳ %s rate-limited — retry %d in %.1fs", model, attempt + 1, delay)
+        self.block(model, delay)
+
+
+# Process-wide instance shared by agent.py and urgency_classifier.py
+scheduler = LLMScheduler()
@@ -0,0 +1,295 @@
+"""
+Local urgency classifier trained on historical tickets — a Groq-free tier.
+
+Every row in ``tickets`` already carries the priority and category the
+LLMs assigned, i.e. free labelled training data.  This module fits a
+small linear model on it and serves it from memory:
+
+  • features: hashed word unigrams + bigrams of the trimmed body — the
+    LLM input callers already have (training trims ticket bodies once,
+    via email_trim.trim_text) — with near_dup's normalisation (numbers /
+    addresses / URLs masked),
+    sublinear TF × IDF, L2-normalised, 2**LOCAL_CLASSIFIER_FEATURE_BITS
+    buckets — no vocabulary to store;
+  • model: two multinomial logistic regressions (urgency and category)
+    trained with full-batch gradient descent in NumPy, class-balanced;
+  • scoring: a few hundred array lookups — well under a millisecond on
+    CPU, no network.
+
+Train (and persist to LOCAL_CLASSIFIER_PATH) with:
+
+    python local_classifier.py --min-tickets 200
+
+urgency_classifier uses the model when URGENCY_BACKEND is "local" (model
+only) or "hybrid" (model when its confidence reaches
+LOCAL_CLASSIFIER_MIN_CONFIDENCE, the 8B call otherwise), and in every
+mode as the answer of last resort when the Groq call fails.  NumPy is
+only needed when a model is trained or loaded.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import zlib
+import logging
+import argparse
+import threading
+
+from email_trim import trim_text
+from near_dup import tokens
+
+logger = logging.getLogger("local_classifier")
+
+LOCAL_CLASSIFIER_PATH = os.getenv(
+    "LOCAL_CLASSIFIER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts", "urgency_local.npz"),
+)
+LOCAL_CLASSIFIER_FEATURE_BITS = int(os.getenv("LOCAL_CLASSIFIER_FEATURE_BITS", "18"))
+
+URGENCY_LABELS = ("High", "Medium", "Low")
+CATEGORY_LABELS = ("Fraud", "Payment Issue", "General")
+
+_SLA = {"High": "Immediate", "Medium": "24 hours", "Low": "48 hours"}
+
+
+# ─────────────────── Features ───────────────────
+
+def _hashed_terms(text: str, bits: int) -> dict[int, int]:
+    """Bucket → count of the unigrams and bigrams of trimmed ``text`` (bucket 0 is the bias)."""
+    words = tokens(text)
+    mask = (1 << bits) - 1
+    counts: dict[int, int] = {}
+    for term in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        bucket = (zlib.crc32(term.encode("utf-8")) & mask) or 1
+        counts[bucket] = counts.get(bucket, 0) + 1
+    return counts
+
+
+def _vector(counts: dict[int, int], idf) -> tuple[list[int], list[float]]:
+    """Sparse TF-IDF row (indices, values), L2-normalised, bias appended."""
+    idx = list(counts)
+    val = [(1.0 + math.log(c)) * float(idf[i]) for i, c in zip(idx, counts.values())]
+    norm = math.sqrt(sum(v * v for v in val)) or 1.0
+    return idx + [0], [v / norm for v in val] + [1.0]
+
+
+# ─────────────────── Model ───────────────────
+
+class LocalUrgencyModel:
+    """Hashed TF-IDF + softmax regression heads for urgency and category."""
+
+    def __init__(self, idf, w_urgency, w_category, meta: dict):
+        self.idf = idf
+        self.w_urgency = w_urgency
+        self.w_category = w_category
+        self.meta = meta
+        self.bits = int(meta["feature_bits"])
+
+    def predict(self, text: str) -> dict:
+        """{"urgency", "category", "confidence", "probabilities"} for one trimmed email."""
+        import numpy as np
+
+        idx, val = _vector(_hashed_terms(text, self.bits), self.idf)
+        idx = np.asarray(idx)
+        val = np.asarray(val, dtype=np.float32)[:, None]
+        heads = {}
+        for name, weights, labels in (("urgency", self.w_urgency, URGENCY_LABELS),
+                                      ("category", self.w_category, CATEGORY_LABELS)):
+            logits = (weights[idx] * val).sum(axis=0)
+            probs = np.exp(logits - logits.max())
+            probs /= probs.sum()
+            heads[name] = dict(zip(labels, (float(p) for p in probs)))
+        urgency = max(heads["urgency"], key=heads["urgency"].get)
+        category = max(heads["category"], key=heads["category"].get)
+        return {
+            "urgency": urgency,
+            "category": category,
+            "confidence": heads["urgency"][urgency],
+            "probabilities": heads["urgency"],
+        }
+
+    def classify(self, text: str) -> dict:
+        """
+        Prediction as a urgency_classifier.UrgencyResult dict.  Tickets
+        store no sub-category, so the model has none to predict:
+        ``subcategory`` is None and the analysis path decides the category.
+        """
+        pred = self.predict(text)
+        return {
+            "urgency": pred["urgency"],
+            "subcategory": None,
+            "confidence": round(pred["confidence"], 2),
+            "reasoning": (
+                f"Local model ({self.meta['tickets']} tickets): "
+                + ", ".join(f"{k} {v:.2f}" for k, v in pred["probabilities"].items()) + "."
+            ),
+            "sla": _SLA[pred["urgency"]],
+        }
+
+    def save(self, path: str = LOCAL_CLASSIFIER_PATH):
+        import numpy as np
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(tmp, idf=self.idf, w_urgency=self.w_urgency, w_category=self.w_category,
+                            meta=np.array(json.dumps(self.meta)))
+        os.replace(tmp, path)  # readers never see a half-written model
+
+    @classmethod
+    def load(cls, path: str = LOCAL_CLASSIFIER_PATH) -> "LocalUrgencyModel":
+        import numpy as np
+
+        with np.load(path) as data:
+            return cls(data["idf"], data["w_urgency"], data["w_category"], json.loads(str(data["meta"])))
+
+
+def _fit_head(rows, labels: list[int], n_classes: int, dim: int, epochs: int, lr: float, l2: float):
+    """Class-balanced softmax regression on sparse rows by full-batch gradient descent."""
+    import numpy as np
+
+    doc = np.concatenate([np.full(len(idx), n) for n, (idx, _) in enumerate(rows)])
+    idx = np.concatenate([np.asarray(i) for i, _ in rows])
+    val = np.concatenate([np.asarray(v, dtype=np.float32) for _, v in rows])
+    starts = np.cumsum([0] + [len(i) for i, _ in rows[:-1]])
+    y = np.asarray(labels)
+    onehot = np.eye(n_classes, dtype=np.float32)[y]
+    freq = np.bincount(y, minlength=n_classes).astype(np.float32)
+    sample_w = (len(y) / (n_classes * np.maximum(freq, 1)))[y][:, None]
+
+    weights = np.zeros((dim, n_classes), dtype=np.float32)
+    for _ in range(epochs):
+        logits = np.add.reduceat(weights[idx] * val[:, None], starts, axis=0)
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        err = (probs - onehot) * sample_w / len(y)
+        grad = np.zeros_like(weights)
+        np.add.at(grad, idx, err[doc] * val[:, None])
+        weights -= lr * (grad + l2 * weights)
+    return weights
+
+
+def train(
+    texts: list[str],
+    urgencies: list[str],
+    categories: list[str],
+    feature_bits: int = LOCAL_CLASSIFIER_FEATURE_BITS,
+    epochs: int = 300,
+    lr: float = 2.0,
+    l2: float = 1e-4,
+) -> LocalUrgencyModel:
+    """Fit both heads on (text, urgency, category) triples."""
+    import numpy as np
+
+    dim = 1 << feature_bits
+    counts = [_hashed_terms(t, feature_bits) for t in texts]
+    df = np.zeros(dim, dtype=np.float32)
+    for c in counts:
+        df[list(c)] += 1
+    idf = np.log((1 + len(texts)) / (1 + df)).astype(np.float32) + 1.0
+    rows = [_vector(c, idf) for c in counts]
+
+    w_urgency = _fit_head(rows, [URGENCY_LABELS.index(u) for u in urgencies], len(URGENCY_LABELS),
+                          dim, epochs, lr, l2)
+    w_category = _fit_head(rows, [CATEGORY_LABELS.index(c) for c in categories], len(CATEGORY_LABELS),
+                           dim, epochs, lr, l2)
+    meta = {
+        "feature_bits": feature_bits,
+        "tickets": len(texts),
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "urgency_counts": {u: urgencies.count(u) for u in URGENCY_LABELS},
+    }
+    return LocalUrgencyModel(idf, w_urgency, w_category, meta)
+
+
+# ─────────────────── Serving ───────────────────
+
+_model: LocalUrgencyModel | None = None
+_model_mtime: float | None = None
+_model_lock = threading.Lock()
+
+
+def get_model() -> LocalUrgencyModel | None:
+    """The persisted model (reloaded when the file changes), or None if unavailable."""
+    global _model, _model_mtime
+    try:
+        mtime = os.path.getmtime(LOCAL_CLASSIFIER_PATH)
+    except OSError:
+        return None
+    if mtime != _model_mtime:
+        with _model_lock:
+            if mtime != _model_mtime:
+                try:
+                    _model = LocalUrgencyModel.load(LOCAL_CLASSIFIER_PATH)
+                    logger.info("Loaded local urgency model (%s tickets, trained %s)",
+                                _model.meta["tickets"], _model.meta["trained_at"])
+                except Exception as exc:  # numpy missing, corrupt file, ...
+                    logger.warning("Cannot load local urgency model %s: %s", LOCAL_CLASSIFIER_PATH, exc)
+                    _model = None
+                _model_mtime = mtime
+    return _model
+
+
+# ─────────────────── Training CLI ───────────────────
+
+def _load_tickets(limit: int | None) -> tuple[list[str], list[str], list[str]]:
+    from database import SessionLocal
+    from models import Ticket
+
+    with SessionLocal() as db:
+        query = db.query(Ticket.email_body, Ticket.priority, Ticket.category).order_by(Ticket.created_at.desc())
+        if limit:
+            query = query.limit(limit)
+        rows = [(trim_text(body.strip()), prio.value, cat.value) for body, prio, cat in query if body and body.strip()]
+    return [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Train the local urgency classifier on historical tickets.")
+    parser.add_argument("--limit", type=int, default=None, help="newest N tickets only")
+    parser.add_argument("--min-tickets", type=int, default=200, help="refuse to train on fewer tickets")
+    parser.add_argument("--holdout", type=float, default=0.2, help="share held out for the accuracy report")
+    parser.add_argument("--epochs", type=int, default=300)
+    parser.add_argument("--output", default=LOCAL_CLASSIFIER_PATH)
+    args = parser.parse_args(argv)
+
+    texts, urgencies, categories = _load_tickets(args.limit)
+    if len(texts) < args.min_tickets:
+        print(f"❌ Only {len(texts)} labelled ticket(s); need at least {args.min_tickets}.")
+        return 1
+
+    # Deterministic holdout: every k-th ticket
+    step = max(2, round(1 / args.holdout)) if args.holdout > 0 else 0
+    held = [i for i in range(len(texts)) if step and i % step == 0]
+    if held:
+        fit = [i for i in range(len(texts)) if i % step]
+        t0 = time.perf_counter()
+        model = train([texts[i] for i in fit], [urgencies[i] for i in fit], [categories[i] for i in fit],
+                      epochs=args.epochs)
+        print(f"🧪 Trained on {len(fit)} ticket(s) in {time.perf_counter() - t0:.1f}s; evaluating on {len(held)}")
+        preds = [model.predict(texts[i]) for i in held]
+        urg_acc = sum(p["urgency"] == urgencies[i] for p, i in zip(preds, held)) / len(held)
+        cat_acc = sum(p["category"] == categories[i] for p, i in zip(preds, held)) / len(held)
+        print(f"   Urgency accuracy {urg_acc:.1%}, category accuracy {cat_acc:.1%}")
+        for threshold in (0.6, 0.7, 0.8, 0.9):
+            sure = [(p, i) for p, i in zip(preds, held) if p["confidence"] >= threshold]
+            if sure:
+                acc = sum(p["urgency"] == urgencies[i] for p, i in sure) / len(sure)
+                print(f"   confidence ≥ {threshold:.1f}: {len(sure) / len(held):.0%} of emails, {acc:.1%} correct")
+
+    t0 = time.perf_counter()
+    model = train(texts, urgencies, categories, epochs=args.epochs)
+    model.save(args.output)
+    n = min(len(texts), 200)
+    t1 = time.perf_counter()
+    for text in texts[:n]:
+        model.predict(text)
+    per_email = (time.perf_counter() - t1) / n * 1000
+    print(f"✅ Saved model on {len(texts)} ticket(s) to {args.output} "
+          f"(trained in {t1 - t0:.1f}s, {per_email:.2f} ms per email)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Configured IMAP mailboxes (account × folder) for ingestion.
+
+One backend deployment can serve several support inboxes (fraud@,
+billing@, support@, ...) instead of one process per inbox.  Accounts are
+configured as JSON in EMAIL_ACCOUNTS:
+
+    EMAIL_ACCOUNTS='[
+      {"user": "fraud@acme.com",   "password_env": "FRAUD_IMAP_PASSWORD"},
+      {"user": "billing@acme.com", "password_env": "BILLING_IMAP_PASSWORD",
+       "folders": ["INBOX", "Disputes"]}
+    ]'
+
+Each entry accepts ``user``, ``password`` or ``password_env`` (name of the
+env var holding it — keeps secrets out of the JSON), ``folders`` (default
+["INBOX"]), ``host`` and ``port`` (default Gmail).  Without EMAIL_ACCOUNTS
+the single EMAIL_USER / EMAIL_PASSWORD account is used, with the folders
+in EMAIL_FOLDERS (comma-separated, default INBOX).
+
+Every mailbox gets its own IMAP connections and its own UID cursor
+(``mailbox_key(user, folder)``); fair_interleave() shares one batch
+between them.
+"""
+
+import os
+import json
+import imaplib
+import logging
+
+from imap_sync import mailbox_key
+
+logger = logging.getLogger("mailboxes")
+
+DEFAULT_IMAP_HOST = "imap.gmail.com"
+DEFAULT_IMAP_PORT = 993
+
+
+def _account_mailboxes(account: dict) -> list[dict]:
+    user = (account.get("user") or "").strip()
+    password = account.get("password") or os.getenv(account.get("password_env") or "", "")
+    if not user or not password:
+        logger.warning("Skipping EMAIL_ACCOUNTS entry without user/password: %r", user or account)
+        return []
+    folders = account.get("folders") or ["INBOX"]
+    return [
+        {
+            "user": user,
+            "password": password,
+            "host": account.get("host") or DEFAULT_IMAP_HOST,
+            "port": int(account.get("port") or DEFAULT_IMAP_PORT),
+            "folder": folder,
+            "key": mailbox_key(user, folder),
+        }
+        for folder in folders
+    ]
+
+
+def configured_mailboxes() -> list[dict]:
+    """Every (account, folder) to ingest; empty when nothing is configured."""
+    raw = os.getenv("EMAIL_ACCOUNTS", "").strip()
+    if raw:
+        try:
+            accounts = json.loads(raw)
+        except ValueError as exc:
+            logger.error("EMAIL_ACCOUNTS is not valid JSON (%s); no mailboxes configured.", exc)
+            return []
+    else:
+        user, password = os.getenv("EMAIL_USER"), os.getenv("EMAIL_PASSWORD")
+        if not user or not password:
+            return []
+        folders = [f.strip() for f in os.getenv("EMAIL_FOLDERS", "INBOX").split(",") if f.strip()]
+        accounts = [{"user": user, "password": password, "folders": folders}]
+
+    boxes, seen = [], set()
+    for account in accounts if isinstance(accounts, list) else []:
+        for box in _account_mailboxes(account):
+            if box["key"] not in seen:   # same folder listed twice → one cursor
+                seen.add(box["key"])
+                boxes.append(box)
+    return boxes
+
+
+def quote_folder(folder: str) -> str:
+    """IMAP-quote a folder name when needed ("Support Queue" → "\"Support Queue\"")."""
+    if folder and all(c.isalnum() or c in "/._-" for c in folder):
+        return folder
+    return '"' + folder.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def connect(box: dict, readonly: bool = False) -> imaplib.IMAP4_SSL:
+    """Authenticated IMAP session with ``box``'s folder selected."""
+    conn = imaplib.IMAP4_SSL(box["host"], box["port"])
+    conn.login(box["user"], box["password"])
+    typ, data = conn.select(quote_folder(box["folder"]), readonly=readonly)
+    if typ != "OK":
+        conn.logout()
+        raise imaplib.IMAP4.error(f"Cannot select {box['folder']} for {box['user']}: {data}")
+    return conn
+
+
+def fair_interleave(per_mailbox: dict[str, list], limit: int) -> list:
+    """
+    Round-robin across mailboxes: the first item of each, then the second
+    of each, ... up to ``limit`` items.  Each list is already in its own
+    preferred order (most urgent first), so one busy inbox cannot use the
+    whole batch while another waits.
+    """
+    queues = [list(items) for items in per_mailbox.values() if items]
+    picked: list = []
+    turn = 0
+    while queues and len(picked) < limit:
+        for items in queues:
+            if turn < len(items) and len(picked) < limit:
+                picked.append(items[turn])
+        turn += 1
+        queues = [items for items in queues if turn < len(items)]
+    return picked
@@ -3,16 +3,29 @@ from typing import Optional, List
 import os, re, smtplib, logging, asyncio
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from fastapi import FastAPI, HTTPException, Depends, Query, File, UploadFile, Form
+from fastapi import FastAPI, HTTPException, Depends, Query, File, UploadFile, Form, BackgroundTasks, Response
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 
-from database import engine, Base, get_db
-from models import Ticket, TicketStatus, TicketPriority, TicketCategory
+from database import engine, Base, get_db, SessionLocal
+from models import Ticket, TicketStatus, TicketPriority, TicketCategory, FetchRun
 from schemas import AnalyzeRequest, TicketAnalysis, ProcessTicketResponse
-from agent import analyze_ticket, generate_draft_response, analyze_and_draft
-from urgency_classifier import classify_urgency, get_parent_category
+from agent import generate_draft_response, aanalyze_ticket, aanalyze_and_draft, aanalyze_cascade, ANALYSIS_MODE
+from urgency_classifier import aclassify_urgency
+from llm_scheduler import RateLimitExhausted
+from cache import cache_stats
+from imap_idle import IdleListener
+from mailboxes import configured_mailboxes, quote_folder
+from imap_pool import session_pool
+from dedup import content_sha256, find_duplicate, backfill_content_hashes
+from fetch_runs import RunProgress, create_run, finish_run, fail_abandoned_runs, run_status
+from drafts import ensure_draft, ticket_analysis
+from ingestion_service import (
+    EMAIL_SYNC_MODE, PRIORITY_MAP, CATEGORY_MAP, IngestionError,
+    fetch_emails, resolve_priority,
+)
 
 load_dotenv()
 
@@ -118,47 +131,93 @@ async def lifespan(app: FastAPI):
             ))
             print("  ✅ Added is_ai_draft_edited column to tickets table.")
 
+        # 4. Dedup keys (Message-ID + content hash) if missing
+        if "message_id" not in columns:
+            conn.execute(text("ALTER TABLE tickets ADD COLUMN message_id VARCHAR(998)"))
+            print("  ✅ Added message_id column to tickets table.")
+        if "content_sha256" not in columns:
+            conn.execute(text("ALTER TABLE tickets ADD COLUMN content_sha256 VARCHAR(64)"))
+            print("  ✅ Added content_sha256 column to tickets table.")
+
+        # 5. Fetch-run leases (owner + expiry) if missing
+        run_columns = [c["name"] for c in inspector.get_columns("fetch_runs")]
+        if "claimed_by" not in run_columns:
+            conn.execute(text("ALTER TABLE fetch_runs ADD COLUMN claimed_by VARCHAR(64)"))
+            conn.execute(text("ALTER TABLE fetch_runs ADD COLUMN claimed_until TIMESTAMP WITH TIME ZONE"))
+            print("  ✅ Added lease columns to fetch_runs table.")
+
+    # Hash pre-existing tickets, then enforce uniqueness
+    with SessionLocal() as session:
+        backfill_content_hashes(session)
+        fail_abandoned_runs(session)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_tickets_message_id ON tickets (message_id)"
+        ))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_tickets_content_sha256 ON tickets (content_sha256)"
+        ))
+
     print("✅ Database tables are ready.")
 
     # ── Background email polling (Railway keeps the process alive) ──
     EMAIL_POLL_INTERVAL = int(os.getenv("EMAIL_POLL_INTERVAL", "300"))  # seconds (5 min)
     ENABLE_EMAIL_POLLING = os.getenv("ENABLE_EMAIL_POLLING", "true").lower() == "true"
-    _BACKEND_PORT = os.getenv("PORT", "8000")
+    # IMAP IDLE push: ingest within seconds of new mail; polling stays as
+    # the safety net (and the only trigger if the server lacks IDLE).
+    ENABLE_IMAP_IDLE = os.getenv("ENABLE_IMAP_IDLE", "true").lower() == "true"
+
+    wake = asyncio.Event()
+    idle_listeners = []
 
     async def _background_email_poller():
-        """Periodically fetch emails via IMAP in the background."""
+        """Fetch emails whenever IDLE reports new mail, or every EMAIL_POLL_INTERVAL."""
         await asyncio.sleep(15)  # let the server fully start
         logger.info(f"📧 Background email poller started (interval={EMAIL_POLL_INTERVAL}s)")
         while True:
+            wake.clear()  # mail arriving during this fetch triggers another one
             try:
-                import requests as _req
-                resp = _req.post(
-                    f"http://127.0.0.1:{_BACKEND_PORT}/fetch_emails?max_emails=5",
-                    timeout=300,  # 5 min timeout (AI analysis can be slow)
-                )
-                if resp.ok:
-                    data = resp.json()
-                    fetched = data.get("fetched", 0)
-                    if fetched > 0:
-                        logger.info(f"📬 Background poller: {fetched} new email(s) processed")
-                    else:
-                        logger.debug("📧 No new emails")
+                # Same batch as POST /fetch_emails, called directly in a worker
+                # thread: no HTTP round trip to ourselves, no blocked event loop.
+                data = await asyncio.to_thread(fetch_emails, False, 5, EMAIL_SYNC_MODE)
+                fetched = data.get("fetched", 0)
+                if fetched > 0:
+                    logger.info(f"📬 Background poller: {fetched} new email(s) processed")
                 else:
-                    logger.warning(f"📧 Background poller: API returned {resp.status_code}")
+                    logger.debug("📧 No new emails")
             except Exception as e:
                 logger.warning(f"📧 Background poller error (will retry): {e}")
-            await asyncio.sleep(EMAIL_POLL_INTERVAL)
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=EMAIL_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
 
     poll_task = None
     if ENABLE_EMAIL_POLLING:
         poll_task = asyncio.create_task(_background_email_poller())
         logger.info("📧 Email polling enabled (set ENABLE_EMAIL_POLLING=false to disable)")
+        if ENABLE_IMAP_IDLE:
+            # One IDLE session per configured mailbox; any of them wakes the poller
+            loop = asyncio.get_running_loop()
+            for box in configured_mailboxes():
+                listener = IdleListener(
+                    box["user"], box["password"],
+                    on_new_mail=lambda: loop.call_soon_threadsafe(wake.set),
+                    folder=quote_folder(box["folder"]),
+                    host=box["host"],
+                    port=box["port"],
+                )
+                listener.start()
+                idle_listeners.append(listener)
     else:
         logger.info("📧 Email polling disabled")
 
     yield
 
-    # Cleanup: cancel background task on shutdown
+    # Cleanup: stop the IDLE listeners and cancel background task on shutdown
+    for listener in idle_listeners:
+        listener.stop()
+    session_pool.close_all()
     if poll_task:
         poll_task.cancel()
         try:
@@ -349,6 +408,12 @@ def calculate_dashboard_metrics(db: Session) -> dict:
     }
 
 
+@app.get("/cache_stats")
+def get_cache_stats():
+    """Hit / miss / eviction counters and size of the in-memory LLM result caches."""
+    return cache_stats()
+
+
 @app.get("/dashboard_metrics")
 def dashboard_metrics(db: Session = Depends(get_db)):
     """Enterprise-grade dashboard metrics for the Finance Triage analytics page."""
@@ -359,7 +424,7 @@ def dashboard_metrics(db: Session = Depends(get_db)):
 
 
 @app.post("/classify_urgency")
-def classify_urgency_endpoint(request: AnalyzeRequest):
+async def classify_urgency_endpoint(request: AnalyzeRequest):
     """
     Advanced multi-tier urgency classification (3 tiers × 12 sub-categories).
 
@@ -367,7 +432,7 @@ def classify_urgency_endpoint(request: AnalyzeRequest):
     Targets < 500 ms latency. Falls back to Medium on errors.
     """
     try:
-        result = classify_urgency(request.email_body)
+        result = await aclassify_urgency(request.email_body)
         return result
     except Exception as e:
         raise HTTPException(
@@ -377,7 +442,7 @@ def classify_urgency_endpoint(request: AnalyzeRequest):
 
 
 @app.post("/analyze", response_model=TicketAnalysis)
-def analyze_email(request: AnalyzeRequest):
+async def analyze_email(request: AnalyzeRequest):
     """
     Analyse a customer support email and return structured triage data.
 
@@ -385,10 +450,12 @@ def analyze_email(request: AnalyzeRequest):
     extracted entities, priority, category, and a summary.
     """
     try:
-        result = analyze_ticket(request.email_body)
+        result = await aanalyze_ticket(request.email_body)
         return result
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
+    except RateLimitExhausted as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -396,78 +463,18 @@ def analyze_email(request: AnalyzeRequest):
         )
 
 
-# ---------- Map schema enums → ORM enums ----------
-
-_PRIORITY_MAP = {
-    "High": TicketPriority.HIGH,
-    "Medium": TicketPriority.MEDIUM,
-    "Low": TicketPriority.LOW,
-}
-
-_CATEGORY_MAP = {
-    "Fraud": TicketCategory.FRAUD,
-    "Payment Issue": TicketCategory.PAYMENT_ISSUE,
-    "General": TicketCategory.GENERAL,
-}
-
-
-def _resolve_priority(email_text: str, agent_priority: str, agent_category: str):
-    """
-    Two-pass priority resolution:
-      1. Agent (llama-3.3-70b) provides initial priority + category.
-      2. Urgency classifier (llama-3.1-8b, 12 sub-categories) runs as a
-         fast second opinion.
-
-    Rules:
-      • If the classifier returns a HIGHER urgency than the agent → promote.
-      • If the classifier has confidence >= 0.75 → trust it outright.
-      • Otherwise keep the agent's original priority.
-      • Also return the classifier's subcategory + SLA for metadata.
-    """
-    try:
-        clf = classify_urgency(email_text)
-    except Exception:
-        # Classifier failed — fall back to agent's judgement
-        return agent_priority, agent_category, None
-
-    clf_urgency = clf["urgency"]
-    clf_confidence = clf["confidence"]
-    clf_subcat = clf["subcategory"]
-    clf_sla = clf["sla"]
-
-    # Numeric ranking: High=3, Medium=2, Low=1
-    _rank = {"High": 3, "Medium": 2, "Low": 1}
-    agent_rank = _rank.get(agent_priority, 2)
-    clf_rank = _rank.get(clf_urgency, 2)
-
-    # Decide final priority
-    if clf_confidence >= 0.75:
-        # High-confidence classifier result takes precedence
-        final_priority = clf_urgency
-    elif clf_rank > agent_rank:
-        # Classifier sees higher urgency — always promote
-        final_priority = clf_urgency
-    else:
-        final_priority = agent_priority
-
-    # Optionally upgrade category based on subcategory
-    final_category = agent_category
-    parent_cat = get_parent_category(clf_subcat)
-    if final_priority == "High" and parent_cat == "Fraud" and agent_category != "Fraud":
-        final_category = "Fraud"
-    elif final_priority == "High" and parent_cat == "Payment Issue" and agent_category == "General":
-        final_category = "Payment Issue"
-
-    return final_priority, final_category, {
-        "subcategory": clf_subcat,
-        "sla": clf_sla,
-        "confidence": clf_confidence,
-        "reasoning": clf["reasoning"],
-    }
+def _ticket_to_response(ticket: Ticket) -> ProcessTicketResponse:
+    """Rebuild a /process_ticket response from a ticket already on file."""
+    return ProcessTicketResponse(
+        ticket_id=str(ticket.id),
+        analysis=ticket_analysis(ticket),
+        draft_response=ticket.draft_response or "",
+        message="Duplicate email — returning the existing ticket.",
+    )
 
 
 @app.post("/process_ticket", response_model=ProcessTicketResponse)
-def process_ticket(request: AnalyzeRequest, db: Session = Depends(get_db)):
+async def process_ticket(request: AnalyzeRequest, db: Session = Depends(get_db)):
     """
     End-to-end ticket processing pipeline:
 
@@ -476,23 +483,52 @@ def process_ticket(request: AnalyzeRequest, db: Session = Depends(get_db)):
     2. **Draft** — Generate a personalised email reply based on the analysis.
     3. **Save** — Persist the ticket with all data to the PostgreSQL database.
     4. **Return** — Send back the ticket ID, full analysis, and draft response.
+
+    An email already on file (same Message-ID or same content hash) is not
+    re-analysed: the existing ticket is returned instead.
+
+    The analysis call and the urgency classifier are independent, so they
+    run concurrently: the request waits for the slower one, not both.
     """
-    # ---- Step 1 + 2: Analyse the email AND generate draft (single LLM call) ----
+    # ---- Step 0: Dedup against existing tickets (index probe) ----
+    digest = content_sha256(request.email_body)
+    existing = await asyncio.to_thread(find_duplicate, db, request.message_id, digest)
+    if existing is not None:
+        return _ticket_to_response(existing)
+
+    # ---- Step 1 + 2 (+ classifier): Analyse AND draft (single LLM call) ----
+    # (ANALYSIS_MODE=cascade: the classifier goes first and confident
+    # Low-urgency mail skips the 70B call)
+    clf_task = asyncio.create_task(aclassify_urgency(request.email_body))
     try:
-        result = analyze_and_draft(request.email_body)
-        analysis = result   # TicketAnalysisWithDraft extends TicketAnalysis
-        draft = result.draft_response
-    except ValueError as e:
-        raise HTTPException(status_code=422, detail=str(e))
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Analysis failed: {str(e)}",
-        )
+        try:
+            if ANALYSIS_MODE == "cascade":
+                result = await aanalyze_cascade(request.email_body, await clf_task)
+            else:
+                result = await aanalyze_and_draft(request.email_body)
+            analysis = result   # TicketAnalysisWithDraft extends TicketAnalysis
+            draft = result.draft_response
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except RateLimitExhausted as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Analysis failed: {str(e)}",
+            )
+        clf = await clf_task
+    finally:
+        # Analysis failed or the request was cancelled: stop the classifier
+        # and collect its outcome, so no task is left running unobserved
+        if not clf_task.done():
+            clf_task.cancel()
+        await asyncio.gather(clf_task, return_exceptions=True)
 
     # ---- Step 3: Priority override via urgency classifier ----
-    final_pri, final_cat, clf_meta = _resolve_priority(
+    final_pri, final_cat, clf_meta = resolve_priority(
         request.email_body, analysis.priority.value, analysis.category.value,
+        clf=clf,
     )
 
     # ---- Step 4: Save to database ----
@@ -501,20 +537,29 @@ def process_ticket(request: AnalyzeRequest, db: Session = Depends(get_db)):
             customer_name=analysis.entities.customer_name or "Unknown",
             email_body=request.email_body,
             status="New",
-            priority=_PRIORITY_MAP.get(final_pri, TicketPriority.MEDIUM),
-            category=_CATEGORY_MAP.get(final_cat, TicketCategory.GENERAL),
+            priority=PRIORITY_MAP.get(final_pri, TicketPriority.MEDIUM),
+            category=CATEGORY_MAP.get(final_cat, TicketCategory.GENERAL),
             sentiment=analysis.sentiment.value,
             intent=analysis.intent,
             summary=analysis.summary,
             transaction_id=analysis.entities.transaction_id,
             amount=analysis.entities.amount,
             draft_response=draft,
+            message_id=request.message_id,
+            content_sha256=digest,
         )
         db.add(ticket)
-        db.commit()
-        db.refresh(ticket)
+        await asyncio.to_thread(db.commit)
+        await asyncio.to_thread(db.refresh, ticket)
+    except IntegrityError:
+        # Same email saved concurrently by another request
+        await asyncio.to_thread(db.rollback)
+        existing = await asyncio.to_thread(find_duplicate, db, request.message_id, digest)
+        if existing is None:
+            raise HTTPException(status_code=500, detail="Database save failed: integrity error")
+        return _ticket_to_response(existing)
     except Exception as e:
-        db.rollback()
+        await asyncio.to_thread(db.rollback)
         raise HTTPException(
             status_code=500,
             detail=f"Database save failed: {str(e)}",
@@ -607,6 +652,7 @@ def get_ticket(ticket_id: str, db: Session = Depends(get_db)):
     ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
+    ensure_draft(db, ticket)   # DRAFT_MODE=lazy: first view writes the draft
     return _ticket_to_dict(ticket)
 
 
@@ -646,7 +692,7 @@ def approve_and_close_ticket(ticket_id: str, db: Session = Depends(get_db)):
     # --- Actually send the reply email ---
     email_sent = False
     recipient = _extract_recipient_email(ticket.email_body)
-    if recipient and ticket.draft_response:
+    if recipient and ensure_draft(db, ticket):
         subject = _extract_subject(ticket.email_body)
         email_sent = send_reply_email(recipient, subject, ticket.draft_response)
     elif not recipient:
@@ -686,228 +732,71 @@ def reject_ticket(ticket_id: str, db: Session = Depends(get_db)):
 #  EMAIL INGESTION ENDPOINT (triggered from the Streamlit frontend)
 # =====================================================================
 
+
 @app.post("/fetch_emails")
 def fetch_emails_endpoint(
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    response: Response,
     include_read: bool = Query(False, description="Also fetch already-read emails"),
     max_emails: int = Query(5, ge=1, le=50, description="Max emails to process"),
+    sync_mode: str = Query(
+        EMAIL_SYNC_MODE, pattern="^(uid|since)$",
+        description="'uid' = only messages above the stored UID cursor, 'since' = last 2 days",
+    ),
+    wait: bool = Query(False, description="Block until the batch is done and return its summary"),
 ):
     """
-    Connect to Gmail via IMAP, pull emails, analyse each one
-    with the AI agent, save tickets, and return a summary.
+    Start an email batch in the background and return its job id (202).
 
-    - By default only UNSEEN (unread) emails are fetched.
-    - Set include_read=true to re-fetch ALL recent emails (useful for testing).
+    Poll GET /jobs/{job_id} for per-email progress, the tickets created
+    so far, errors, and finally the summary.  With wait=true the batch
+    runs inside the request and the summary is returned directly.  The
+    batch itself lives in ingestion_service.fetch_emails().
     """
-    import os
-    import imaplib
-    import email as email_lib
-    from email.header import decode_header as _decode_header
-    import time as _time
-
-    EMAIL_USER = os.getenv("EMAIL_USER")
-    EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
-
-    if not EMAIL_USER or not EMAIL_PASSWORD:
+    if not configured_mailboxes():
         raise HTTPException(
             status_code=500,
-            detail="EMAIL_USER and EMAIL_PASSWORD must be set in the .env file.",
+            detail="EMAIL_USER and EMAIL_PASSWORD (or EMAIL_ACCOUNTS) must be set in the .env file.",
         )
-
-    _start = _time.time()
-    print(f"📧 fetch_emails called  include_read={include_read}  max_emails={max_emails}")
-
-    # ── Helper: decode MIME headers ──
-    def _decode_hdr(value: str) -> str:
-        if not value:
-            return ""
-        parts = []
-        for part, charset in _decode_header(value):
-            if isinstance(part, bytes):
-                parts.append(part.decode(charset or "utf-8", errors="replace"))
-            else:
-                parts.append(part)
-        return " ".join(parts)
-
-    # ── Helper: extract plain-text body ──
-    def _extract_body(msg) -> str:
-        body = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                ct = part.get_content_type()
-                cd = str(part.get("Content-Disposition", ""))
-                if "attachment" in cd:
-                    continue
-                if ct == "text/plain":
-                    payload = part.get_payload(decode=True)
-                    if payload:
-                        body = payload.decode(part.get_content_charset() or "utf-8", errors="replace")
-                        break
-                elif ct == "text/html" and not body:
-                    payload = part.get_payload(decode=True)
-                    if payload:
-                        import re
-                        html = payload.decode(part.get_content_charset() or "utf-8", errors="replace")
-                        body = re.sub(r"<[^>]+>", " ", html)
-                        body = re.sub(r"\s+", " ", body).strip()
-        else:
-            payload = msg.get_payload(decode=True)
-            if payload:
-                body = payload.decode(msg.get_content_charset() or "utf-8", errors="replace")
-        return body.strip()
-
-    # ── Connect to Gmail ──
-    try:
-        mail = imaplib.IMAP4_SSL("imap.gmail.com", 993)
-        mail.login(EMAIL_USER, EMAIL_PASSWORD)
-        mail.select("INBOX")
-        print(f"  ✅ Connected to Gmail as {EMAIL_USER}")
-    except Exception as e:
-        print(f"  ❌ IMAP connection failed: {e}")
-        raise HTTPException(status_code=500, detail=f"IMAP connection failed: {e}")
-
-    # ── Search for emails ──
+    if wait:
+        try:
+            return fetch_emails(include_read, max_emails, sync_mode)
+        except IngestionError as exc:
+            raise HTTPException(status_code=500, detail=str(exc))
+
+    with SessionLocal() as session:
+        run = create_run(session, include_read, max_emails, sync_mode)
+    background_tasks.add_task(_fetch_emails_task, run.id, include_read, max_emails, sync_mode)
+    response.status_code = 202
+    print(f"📧 fetch_emails queued as job {run.id}")
+    return {"job_id": str(run.id), "status": "queued", "status_url": f"/jobs/{run.id}"}
+
+
+def _fetch_emails_task(run_id, include_read: bool, max_emails: int, sync_mode: str):
+    """BackgroundTasks entry point: run one batch and store its outcome."""
+    progress = RunProgress(run_id)
+    progress.start()
     try:
-        # Use date-based search instead of UNSEEN to catch emails that
-        # were auto-marked as read by Gmail / phone within seconds.
-        # This way we never miss emails. Duplicates are filtered by
-        # the email_body check against the DB below.
-        from datetime import datetime as _dt, timedelta as _td
-        if include_read:
-            search_criteria = "ALL"
-        else:
-            # Fetch emails from the last 2 days (IMAP SINCE uses date only, no time)
-            since_date = (_dt.now() - _td(days=2)).strftime("%d-%b-%Y")
-            search_criteria = f'(SINCE "{since_date}")'
-        status, messages = mail.search(None, search_criteria)
-        print(f"  🔍 Search criteria: {search_criteria}  status: {status}")
-
-        if status != "OK":
-            raise HTTPException(status_code=500, detail="Could not search mailbox.")
-
-        email_ids = messages[0].split()
-        # Take only the most recent N emails (last items = newest)
-        email_ids = email_ids[-max_emails:] if len(email_ids) > max_emails else email_ids
-        print(f"  📬 Found {len(email_ids)} email(s) to process")
-
-        results = []
-        errors = []
-        skipped_dupes = 0
-
-        for eid in email_ids:
-            try:
-                st_fetch, msg_data = mail.fetch(eid, "(RFC822)")
-                if st_fetch != "OK":
-                    continue
-                raw = msg_data[0][1]
-                msg = email_lib.message_from_bytes(raw)
-
-                subject = _decode_hdr(msg.get("Subject", "(No Subject)"))
-                sender = _decode_hdr(msg.get("From", "(Unknown)"))
-                body = _extract_body(msg)
-
-                if not body or len(body.strip()) < 10:
-                    mail.store(eid, "+FLAGS", "\\Seen")
-                    continue
-
-                full_text = f"From: {sender}\nSubject: {subject}\n\n{body}"
-
-                # ── Skip duplicates: check if an identical email_body already exists ──
-                existing = db.query(Ticket).filter(
-                    Ticket.email_body == full_text
-                ).first()
-                if existing:
-                    skipped_dupes += 1
-                    mail.store(eid, "+FLAGS", "\\Seen")
-                    continue
-
-                print(f"  📩 Processing: {subject[:60]}")
-
-                # ── Analyse + Draft (single LLM call) ──
-                try:
-                    combined = analyze_and_draft(full_text)
-                    analysis = combined
-                    draft = combined.draft_response
-                except Exception as ai_err:
-                    err_str = str(ai_err)
-                    # Detect quota / rate-limit errors and abort early
-                    if "429" in err_str or "rate_limit" in err_str.lower() or "quota" in err_str.lower():
-                        mail.close()
-                        mail.logout()
-                        elapsed = round(_time.time() - _start, 1)
-                        print(f"  🚫 Groq API rate limit hit after {elapsed}s")
-                        return {
-                            "fetched": len(results),
-                            "errors": len(errors) + 1,
-                            "skipped_duplicates": skipped_dupes,
-                            "tickets": results,
-                            "error_details": [
-                                "⚠️ Groq API rate limit reached (30 req/min). "
-                                "Please wait 1-2 minutes and try again."
-                            ],
-                            "message": f"Processed {len(results)} email(s) before hitting rate limit.",
-                            "quota_error": True,
-                        }
-                    raise
-
-                # ── Priority override via urgency classifier ──
-                final_pri, final_cat, clf_meta = _resolve_priority(
-                    full_text, analysis.priority.value, analysis.category.value,
-                )
-
-                # ── Save ticket ──
-                ticket = Ticket(
-                    customer_name=analysis.entities.customer_name or sender.split("<")[0].strip() or "Unknown",
-                    email_body=full_text,
-                    status="New",
-                    priority=_PRIORITY_MAP.get(final_pri, TicketPriority.MEDIUM),
-                    category=_CATEGORY_MAP.get(final_cat, TicketCategory.GENERAL),
-                    sentiment=analysis.sentiment.value,
-                    intent=analysis.intent,
-                    summary=analysis.summary,
-                    transaction_id=analysis.entities.transaction_id,
-                    amount=analysis.entities.amount,
-                    draft_response=draft,
-                )
-                db.add(ticket)
-                db.commit()
-                db.refresh(ticket)
-
-                mail.store(eid, "+FLAGS", "\\Seen")
-
-                results.append({
-                    "ticket_id": str(ticket.id),
-                    "subject": subject,
-                    "sender": sender,
-                    "priority": final_pri,
-                    "category": final_cat,
-                })
-                print(f"    ✅ Ticket {str(ticket.id)[:8]} | {final_pri} | {final_cat}  ({_time.time()-_start:.1f}s elapsed)")
-            except Exception as e:
-                errors.append(f"{subject if 'subject' in dir() else 'unknown'}: {str(e)}")
-                print(f"    ❌ Error: {e}")
-                continue
-
-        mail.close()
-        mail.logout()
-
-        elapsed = round(_time.time() - _start, 1)
-        msg = f"Fetched and processed {len(results)} email(s) in {elapsed}s."
-        if skipped_dupes:
-            msg += f" Skipped {skipped_dupes} duplicate(s)."
-        print(f"  📊 Done: {msg}")
-
-        return {
-            "fetched": len(results),
-            "errors": len(errors),
-            "skipped_duplicates": skipped_dupes,
-            "tickets": results,
-            "error_details": errors[:10],
-            "message": msg,
-        }
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"  ❌ Email processing failed: {e}")
-        raise HTTPException(status_code=500, detail=f"Email processing failed: {e}")
+        result = fetch_emails(include_read, max_emails, sync_mode, progress)
+    except IngestionError as exc:
+        finish_run(run_id, error=str(exc))
+        return
+    except Exception as exc:
+        logger.exception(f"❌ Fetch job {run_id} failed")
+        finish_run(run_id, error=str(exc))
+        return
+    finally:
+        progress.stop()
+    progress.flush(force=True)
+    finish_run(run_id, result=result)
+
+
+@app.get("/jobs/{job_id}")
+def get_fetch_job(job_id: str, db: Session = Depends(get_db)):
+    """Status of an asynchronous /fetch_emails run: progress, partial results, errors."""
+    run = db.query(FetchRun).filter(FetchRun.id == job_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if fail_abandoned_runs(db, run.id):   # its worker died mid-run
+        db.refresh(run)
+    return run_status(run)
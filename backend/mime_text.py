@@ -0,0 +1,358 @@
+"""
+Streaming, size-bounded MIME text extraction.
+
+``message_from_bytes`` + ``get_payload(decode=True)`` on every part builds
+the whole message tree in memory and decodes each part in one go — a
+25 MB email with inline images costs several copies of 25 MB before a
+single line of text is read.  Triage only needs the readable text, so
+this module streams the raw message line by line instead:
+
+  • part headers are parsed with ``email.parser.BytesHeaderParser`` as
+    soon as the blank line after them arrives;
+  • non-text parts (images, PDFs, attachments) are skipped line by line
+    and never decoded or stored;
+  • text parts are transfer-decoded and charset-decoded incrementally
+    (base64 quanta and multi-byte characters may straddle lines) and
+    stop being collected at ``max_bytes`` (EMAIL_MAX_TEXT_BYTES);
+  • HTML goes through an incremental HTMLParser-based converter rather
+    than a regex over the whole part.
+
+``email.parser.BytesFeedParser`` itself buffers every leaf payload until
+the part closes, so it cannot bound memory; the line walker below keeps
+the email package for header parsing only.  Peak memory per message is
+the text budget plus one line, whatever the size of the attachments.
+
+The same decoders back imap_fetch, which fetches just the text section.
+"""
+
+import os
+import re
+import codecs
+import base64
+import binascii
+import quopri
+from email.message import Message
+from email.parser import BytesHeaderParser
+from html.parser import HTMLParser
+from typing import BinaryIO, Iterable
+
+EMAIL_MAX_TEXT_BYTES = int(os.getenv("EMAIL_MAX_TEXT_BYTES", str(256 * 1024)))
+
+_MAX_LINE = 64 * 1024          # longer lines are processed in pieces
+_MAX_HEADER_BYTES = 64 * 1024  # a part's header block beyond this is ignored
+_READ_SIZE = 64 * 1024
+_B64_JUNK_RE = re.compile(rb"[^A-Za-z0-9+/=]")
+
+
+# ─────────────────── HTML → text ───────────────────
+
+class HTMLTextConverter(HTMLParser):
+    """
+    Incremental HTML-to-text: feed() markup in any number of pieces and
+    read text() at the end.  Script/style/head content is dropped, block
+    elements become line breaks, output stops at ``max_chars``.
+    """
+
+    _SKIP = {"script", "style", "head", "title", "noscript", "template"}
+    _BLOCK = {
+        "br", "p", "div", "tr", "li", "ul", "ol", "table", "section", "article",
+        "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "hr",
+    }
+
+    def __init__(self, max_chars: int | None = None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self._chunks: list[str] = []
+        self._size = 0
+        self._skip_depth = 0
+
+    @property
+    def full(self) -> bool:
+        return self.max_chars is not None and self._size >= self.max_chars
+
+    def _emit(self, text: str):
+        if self.full:
+            return
+        if self.max_chars is not None:
+            text = text[: self.max_chars - self._size]
+        self._chunks.append(text)
+        self._size += len(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skip_depth += 1
+        elif tag in self._BLOCK:
+            self._emit("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in self._BLOCK:
+            self._emit("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self._BLOCK:
+            self._emit("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._emit(data)
+
+    def text(self) -> str:
+        """Collected text: runs of spaces collapsed, at most one blank line in a row."""
+        self.close()
+        raw = "".join(self._chunks)
+        lines = [re.sub(r"[ \t\r\f\v\xa0]+", " ", line).strip() for line in raw.split("\n")]
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def html_to_text(html: str, max_chars: int | None = None) -> str:
+    """Convert an HTML string to plain text (see HTMLTextConverter)."""
+    converter = HTMLTextConverter(max_chars)
+    converter.feed(html)
+    return converter.text()
+
+
+# ─────────────────── Incremental part decoding ───────────────────
+
+class TextPartDecoder:
+    """
+    Undo Content-Transfer-Encoding and charset of one text part, fed in
+    arbitrary byte pieces; collects at most ``max_bytes`` of decoded text.
+    """
+
+    def __init__(self, encoding: str = "7bit", charset: str | None = None,
+                 subtype: str = "plain", max_bytes: int = EMAIL_MAX_TEXT_BYTES):
+        self.encoding = (encoding or "7bit").strip().lower()
+        self.subtype = subtype
+        self.max_bytes = max_bytes
+        try:
+            self._chars = codecs.getincrementaldecoder(charset or "utf-8")(errors="replace")
+        except LookupError:
+            self._chars = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._b64_tail = b""
+        self._qp_tail = b""
+        self._taken = 0
+        self._html = HTMLTextConverter() if subtype == "html" else None
+        self._chunks: list[str] = []
+
+    @property
+    def full(self) -> bool:
+        return self.max_bytes > 0 and self._taken >= self.max_bytes
+
+    def _transfer_decode(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "base64":
+            data = self._b64_tail + _B64_JUNK_RE.sub(b"", data)
+            cut = len(data) if final else len(data) - len(data) % 4
+            self._b64_tail = data[cut:]
+            try:
+                return base64.b64decode(data[:cut])
+            except (binascii.Error, ValueError):
+                return b""
+        if self.encoding == "quoted-printable":
+            # Decode whole lines only, so "=XX" escapes are never split
+            data = self._qp_tail + data
+            cut = len(data) if final else data.rfind(b"\n") + 1
+            self._qp_tail = data[cut:]
+            return quopri.decodestring(data[:cut])
+        return data
+
+    def feed(self, data: bytes, final: bool = False):
+        if self.full:
+            return
+        raw = self._transfer_decode(data, final)
+        cut = self.max_bytes > 0 and len(raw) > self.max_bytes - self._taken
+        if cut:
+            raw = raw[: self.max_bytes - self._taken]
+        self._taken += len(raw)
+        if cut:
+            # The cap may split a multi-byte character: keep the complete
+            # ones and drop the decoder's partial bytes instead of a U+FFFD
+            text = self._chars.decode(raw, final=False)
+            self._chars.reset()
+        else:
+            text = self._chars.decode(raw, final=final or self.full)
+        if self._html is not None:
+            self._html.feed(text)
+        else:
+            self._chunks.append(text)
+
+    def text(self) -> str:
+        self.feed(b"", final=True)
+        if self._html is not None:
+            return self._html.text()
+        return "".join(self._chunks).replace("\r\n", "\n").strip()
+
+
+def decode_text_payload(payload: bytes, encoding: str = "7bit", charset: str | None = None,
+                        subtype: str = "plain", max_bytes: int = EMAIL_MAX_TEXT_BYTES) -> str:
+    """Decode a complete (or truncated) text part in one call."""
+    decoder = TextPartDecoder(encoding, charset, subtype, max_bytes)
+    decoder.feed(payload)
+    return decoder.text()
+
+
+# ─────────────────── Streaming MIME walker ───────────────────
+
+class MimeTextExtractor:
+    """
+    Feed a raw RFC 822 message in chunks; result() returns the top-level
+    headers and the text of the first text/plain part (else the first
+    text/html part), nested message/rfc822 parts included.
+    """
+
+    def __init__(self, max_bytes: int = EMAIL_MAX_TEXT_BYTES):
+        self.max_bytes = max_bytes
+        self.headers: Message | None = None
+        self._parser = BytesHeaderParser()
+        self._boundaries: list[bytes] = []   # enclosing multipart boundaries
+        self._state = "headers"              # headers | text | skip
+        self._header_lines: list[bytes] = []
+        self._header_size = 0
+        self._part: TextPartDecoder | None = None
+        self._plain: TextPartDecoder | None = None
+        self._html: TextPartDecoder | None = None
+        self._pending = b""                  # incomplete last line
+        self._midline = False                # inside a line longer than _MAX_LINE
+
+    # ── input ──
+
+    def feed(self, chunk: bytes):
+        data = self._pending + chunk
+        start = 0
+        while True:
+            end = data.find(b"\n", start)
+            if end < 0:
+                break
+            self._line(data[start:end + 1])
+            start = end + 1
+        self._pending = data[start:]
+        if len(self._pending) > _MAX_LINE:
+            self._line(self._pending)       # no boundary can start mid-line
+            self._pending = b""
+            self._midline = True
+
+    def result(self) -> tuple[Message, str]:
+        if self._pending:
+            self._line(self._pending)
+            self._pending = b""
+        if self._state == "headers" and self._header_lines:
+            self._end_headers()
+        self._end_part()
+        headers = self.headers if self.headers is not None else Message()
+        for decoder in (self._plain, self._html):
+            if decoder is not None:
+                text = decoder.text()
+                if text:
+                    return headers, text
+        return headers, ""
+
+    # ── state machine ──
+
+    def _line(self, line: bytes):
+        at_line_start = not self._midline
+        self._midline = not line.endswith(b"\n")
+        if at_line_start and self._boundaries and line.startswith(b"--") and self._boundary_line(line):
+            return
+        if self._state == "headers":
+            if line.strip() == b"":
+                self._end_headers()
+            elif self._header_size < _MAX_HEADER_BYTES:
+                self._header_lines.append(line)
+                self._header_size += len(line)
+        elif self._state == "text" and self._part is not None:
+            self._part.feed(line)
+
+    def _boundary_line(self, line: bytes) -> bool:
+        marker = line.rstrip()[2:]
+        for depth in range(len(self._boundaries) - 1, -1, -1):
+            boundary = self._boundaries[depth]
+            if marker == boundary or marker == boundary + b"--":
+                self._end_part()
+                if marker == boundary:
+                    del self._boundaries[depth + 1:]
+                    self._state = "headers"              # next sibling part
+                else:
+                    del self._boundaries[depth:]
+                    self._state = "skip"                 # epilogue
+                return True
+        return False
+
+    def _end_headers(self):
+        part = self._parser.parsebytes(b"".join(self._header_lines))
+        self._header_lines, self._header_size = [], 0
+        if self.headers is None:
+            self.headers = part
+
+        ctype = part.get_content_type()
+        disposition = str(part.get("Content-Disposition", "")).lower()
+        if ctype.startswith("multipart/"):
+            boundary = part.get_boundary()
+            if boundary:
+                self._boundaries.append(boundary.encode("utf-8", errors="replace"))
+            self._state = "skip"                         # preamble
+        elif ctype == "message/rfc822" and "attachment" not in disposition:
+            self._state = "headers"                      # forwarded message inline
+        elif ctype in ("text/plain", "text/html") and "attachment" not in disposition:
+            subtype = ctype.split("/", 1)[1]
+            wanted = self._plain is None if subtype == "plain" else self._plain is None and self._html is None
+            if wanted:
+                self._part = TextPartDecoder(
+                    str(part.get("Content-Transfer-Encoding", "7bit")),
+                    part.get_content_charset(),
+                    subtype,
+                    self.max_bytes,
+                )
+                self._state = "text"
+            else:
+                self._state = "skip"
+        else:
+            self._state = "skip"                         # image, PDF, attachment, ...
+
+    def _end_part(self):
+        part, self._part = self._part, None
+        if part is None:
+            return
+        if part.subtype == "plain":
+            self._plain = part
+        elif self._html is None:
+            self._html = part
+
+
+def _chunks(source) -> Iterable[bytes]:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for i in range(0, len(view), _READ_SIZE):
+            yield bytes(view[i:i + _READ_SIZE])
+    elif hasattr(source, "read"):
+        while True:
+            chunk = source.read(_READ_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        yield from source
+
+
+def extract_message(
+    source: bytes | BinaryIO | Iterable[bytes],
+    max_bytes: int = EMAIL_MAX_TEXT_BYTES,
+) -> tuple[Message, str]:
+    """
+    Top-level headers and readable text of a raw message.
+
+    ``source`` may be the raw bytes, a binary file object or an iterable
+    of byte chunks (e.g. straight from a socket).
+    """
+    extractor = MimeTextExtractor(max_bytes)
+    for chunk in _chunks(source):
+        extractor.feed(chunk)
+    return extractor.result()
+
+
+def extract_text(
+    source: bytes | BinaryIO | Iterable[bytes],
+    max_bytes: int = EMAIL_MAX_TEXT_BYTES,
+) -> str:
+    """Readable text of a raw message: first text/plain part, else text/html."""
+    return extract_message(source, max_bytes)[1]
@@ -1,7 +1,7 @@
 import uuid
 import enum
 from datetime import datetime, timezone
-from sqlalchemy import Boolean, Column, String, Text, Enum, DateTime
+from sqlalchemy import BigInteger, Boolean, Column, Integer, String, Text, Enum, DateTime, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 
 from database import Base
@@ -29,6 +29,22 @@ class TicketCategory(str, enum.Enum):
     GENERAL = "General"
 
 
+class JobState(str, enum.Enum):
+    FETCHED = "fetched"     # text pulled from IMAP
+    PARSED = "parsed"       # full_text built, dedup passed
+    ANALYSED = "analysed"   # LLM analysis stored
+    SAVED = "saved"         # ticket written (terminal)
+    SKIPPED = "skipped"     # too short / duplicate (terminal)
+    FAILED = "failed"       # gave up after JOB_MAX_ATTEMPTS (terminal)
+
+
+class FetchRunStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
 # --------------- ORM Model ---------------
 
 class Ticket(Base):
@@ -63,6 +79,9 @@ class Ticket(Base):
     transaction_id = Column(String(100), nullable=True)
     amount = Column(String(50), nullable=True)
     draft_response = Column(Text, nullable=True)
+    # Dedup keys (unique, so a duplicate check is an index probe)
+    message_id = Column(String(998), nullable=True, unique=True, index=True)
+    content_sha256 = Column(String(64), nullable=True, unique=True, index=True)
     is_read = Column(Boolean, nullable=False, default=False, server_default="false")
     is_ai_draft_edited = Column(Boolean, nullable=False, default=False, server_default="false")
     created_at = Column(
@@ -77,3 +96,148 @@ class Ticket(Base):
             f"status='{self.status}', priority='{self.priority}', "
             f"category='{self.category}')>"
         )
+
+
+class MailboxSyncState(Base):
+    """Incremental IMAP sync cursor: highest UID already ingested per mailbox."""
+    __tablename__ = "mailbox_sync_state"
+
+    mailbox = Column(String(320), primary_key=True)   # "<account>/<folder>"
+    uidvalidity = Column(BigInteger, nullable=False)
+    last_uid = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
+
+    def __repr__(self):
+        return (
+            f"<MailboxSyncState(mailbox='{self.mailbox}', "
+            f"uidvalidity={self.uidvalidity}, last_uid={self.last_uid})>"
+        )
+
+
+class IngestionJob(Base):
+    """
+    One row per ingested email, advanced fetched → parsed → analysed → saved.
+
+    Work survives restarts: unfinished rows are claimed again (lease +
+    SELECT ... FOR UPDATE SKIP LOCKED) and resume from their last state.
+    """
+    __tablename__ = "ingestion_jobs"
+    __table_args__ = (
+        UniqueConstraint("mailbox", "uidvalidity", "uid", name="uq_ingestion_jobs_source"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    mailbox = Column(String(320), nullable=False)          # "<account>/<folder>"
+    uidvalidity = Column(BigInteger, nullable=False)
+    uid = Column(BigInteger, nullable=False)
+    message_id = Column(String(998), nullable=True)
+    state = Column(
+        Enum(JobState, name="ingestion_job_state", create_constraint=True,
+             values_callable=lambda e: [m.value for m in e]),
+        nullable=False,
+        default=JobState.FETCHED,
+        index=True,
+    )
+    provisional_priority = Column(String(10), nullable=True)
+    subject = Column(Text, nullable=True)
+    sender = Column(Text, nullable=True)
+    body = Column(Text, nullable=True)
+    full_text = Column(Text, nullable=True)
+    content_sha256 = Column(String(64), nullable=True)
+    analysis_json = Column(Text, nullable=True)            # analysis + final priority/category
+    ticket_id = Column(UUID(as_uuid=True), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    claimed_by = Column(String(64), nullable=True)
+    claimed_until = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+    )
+    updated_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
+
+    def __repr__(self):
+        return (
+            f"<IngestionJob(mailbox='{self.mailbox}', uid={self.uid}, "
+            f"state='{self.state}', attempts={self.attempts})>"
+        )
+
+
+class LLMCacheEntry(Base):
+    """
+    One cached LLM result (see llm_cache.PersistentCache).
+
+    ``prompt_version`` fingerprints the prompt + output schema, so editing
+    either leaves old rows unreachable instead of serving stale results.
+    """
+    __tablename__ = "llm_cache"
+
+    kind = Column(String(32), primary_key=True)             # "analysis" | "urgency"
+    model = Column(String(100), primary_key=True)
+    prompt_version = Column(String(16), primary_key=True)
+    content_sha256 = Column(String(64), primary_key=True)   # SHA-256 of the trimmed LLM input
+    value_json = Column(Text, nullable=False)
+    created_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+    )
+
+    def __repr__(self):
+        return f"<LLMCacheEntry(kind='{self.kind}', model='{self.model}', version='{self.prompt_version}')>"
+
+
+class FetchRun(Base):
+    """
+    One asynchronous /fetch_emails run, polled via GET /jobs/{id}.
+
+    ``progress_json`` holds the per-email progress list and is rewritten
+    while the run is going; ``result_json`` is the final summary (same
+    shape as the synchronous /fetch_emails response).
+    """
+    __tablename__ = "fetch_runs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    status = Column(
+        Enum(FetchRunStatus, name="fetch_run_status", create_constraint=True,
+             values_callable=lambda e: [m.value for m in e]),
+        nullable=False,
+        default=FetchRunStatus.QUEUED,
+    )
+    include_read = Column(Boolean, nullable=False, default=False)
+    max_emails = Column(Integer, nullable=False)
+    sync_mode = Column(String(10), nullable=False)
+    total = Column(Integer, nullable=True)                 # emails selected for this run
+    progress_json = Column(Text, nullable=True)
+    result_json = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    # Process running the batch; renewed by its heartbeat until the run closes
+    claimed_by = Column(String(64), nullable=True)
+    claimed_until = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+    )
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
+
+    def __repr__(self):
+        return f"<FetchRun(id={self.id}, status='{self.status}', total={self.total})>"
@@ -0,0 +1,152 @@
+"""
+Near-duplicate email detection with SimHash.
+
+The exact-hash caches (cache.BoundedCache, llm_cache) only help when the
+trimmed body is byte-for-byte identical.  Template-driven complaints and
+waves of the same phishing report differ in the greeting, a timestamp, a
+ticket reference or whitespace, so each one paid for a full LLM call.
+
+NearDupIndex fingerprints the normalised body — lower-cased, sender line
+and greeting dropped, numbers (amounts, dates, IDs) / e-mail addresses /
+URLs masked — as a 64-bit SimHash over 3-word shingles.  Bodies that
+differ in only a few words land within a few bits of each other.  Lookups
+are banded: the fingerprint is split into NEAR_DUP_MAX_DISTANCE + 1
+bands, and any two fingerprints within that Hamming distance agree
+exactly on at least one band, so a lookup only compares against entries
+sharing a band.
+
+NEAR_DUP_MAX_DISTANCE (bits, default 8) is the similarity threshold: the
+same template with another customer's name and amounts measures ~7 bits,
+unrelated emails ~30.  Bodies with fewer than NEAR_DUP_MIN_TOKENS words
+are not indexed (short texts collide too easily).  At most NEAR_DUP_MAX_ENTRIES fingerprints are
+kept, least recently matched evicted first.  NEAR_DUP_ENABLED=false
+turns the index off.
+"""
+
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from cache import register_stats
+
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "true").lower() == "true"
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "8"))
+NEAR_DUP_MIN_TOKENS = int(os.getenv("NEAR_DUP_MIN_TOKENS", "12"))
+NEAR_DUP_MAX_ENTRIES = int(os.getenv("NEAR_DUP_MAX_ENTRIES", "5000"))
+
+_BITS = 64
+_SHINGLE = 3
+
+_SENDER_LINE = re.compile(r"\Afrom: [^\n]*\n")
+_GREETING = re.compile(r"^\s*(hi|hello|hey|dear|good (morning|afternoon|evening))\b[^\n,]*[,!]?", re.MULTILINE)
+_MASKS = [
+    (re.compile(r"https?://\S+|www\.\S+"), " url "),
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), " email "),
+    (re.compile(r"\d[\d,.:/-]*\d|\d"), "0"),   # amounts, dates, times, IDs → one token
+]
+_TOKEN = re.compile(r"\w+")
+
+
+def tokens(text: str) -> list[str]:
+    """Normalised words of ``text`` (see module docstring)."""
+    text = _GREETING.sub(" ", _SENDER_LINE.sub("", text.lower()))
+    for pattern, repl in _MASKS:
+        text = pattern.sub(repl, text)
+    return _TOKEN.findall(text)
+
+
+def simhash(words: list[str], shingle: int = _SHINGLE) -> int:
+    """64-bit SimHash over the distinct ``shingle``-word shingles of ``words``."""
+    grams = {" ".join(words[i:i + shingle]) for i in range(max(1, len(words) - shingle + 1))}
+    counts = [0] * _BITS
+    for gram in grams:
+        h = int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(_BITS):
+            counts[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(_BITS) if counts[bit] > 0)
+
+
+class NearDupIndex:
+    """Bounded SimHash index: fingerprint → value of the email it came from."""
+
+    def __init__(
+        self,
+        name: str,
+        max_distance: int = NEAR_DUP_MAX_DISTANCE,
+        min_tokens: int = NEAR_DUP_MIN_TOKENS,
+        max_entries: int = NEAR_DUP_MAX_ENTRIES,
+    ):
+        self.max_distance = max(0, min(max_distance, _BITS - 1))
+        self.min_tokens = min_tokens
+        self.max_entries = max(1, max_entries)
+        bands = self.max_distance + 1
+        width = _BITS // bands
+        # (shift, mask) per band; the last band takes the leftover bits
+        self._bands = [
+            (i * width, (1 << (width if i < bands - 1 else _BITS - i * width)) - 1)
+            for i in range(bands)
+        ]
+        self._entries: OrderedDict[int, Any] = OrderedDict()
+        self._buckets: list[dict[int, set[int]]] = [{} for _ in self._bands]
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "indexed": 0, "too_short": 0}
+        register_stats(name, self.stats)
+
+    def _fingerprint(self, text: str) -> int | None:
+        words = tokens(text)
+        return simhash(words) if len(words) >= self.min_tokens else None
+
+    def find(self, text: str) -> tuple[Any, int] | None:
+        """(value, Hamming distance) of the closest indexed email within the threshold."""
+        if not NEAR_DUP_ENABLED:
+            return None
+        fp = self._fingerprint(text)
+        with self._lock:
+            self._stats["lookups"] += 1
+            if fp is None:
+                self._stats["too_short"] += 1
+                return None
+            best = None
+            for (shift, mask), buckets in zip(self._bands, self._buckets):
+                for other in buckets.get(fp >> shift & mask, ()):
+                    distance = (fp ^ other).bit_count()
+                    if distance <= self.max_distance and (best is None or distance < best[1]):
+                        best = (other, distance)
+            if best is None:
+                return None
+            self._entries.move_to_end(best[0])
+            self._stats["hits"] += 1
+            return self._entries[best[0]], best[1]
+
+    def add(self, text: str, value: Any):
+        if not NEAR_DUP_ENABLED:
+            return
+        fp = self._fingerprint(text)
+        if fp is None:
+            return
+        with self._lock:
+            if fp not in self._entries:
+                for (shift, mask), buckets in zip(self._bands, self._buckets):
+                    buckets.setdefault(fp >> shift & mask, set()).add(fp)
+                self._stats["indexed"] += 1
+            self._entries[fp] = value
+            self._entries.move_to_end(fp)
+            while len(self._entries) > self.max_entries:
+                old, _ = self._entries.popitem(last=False)
+                for (shift, mask), buckets in zip(self._bands, self._buckets):
+                    bucket = buckets.get(old >> shift & mask)
+                    if bucket is not None:
+                        bucket.discard(old)
+                        if not bucket:
+                            del buckets[old >> shift & mask]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "enabled": NEAR_DUP_ENABLED,
+                    "max_distance": self.max_distance}
@@ -0,0 +1,219 @@
+"""
+Staged, bounded-queue processing pipeline used by email ingestion.
+
+Each stage runs in its own pool of worker threads and hands items to the
+next stage through a bounded queue:
+
+    items → [fetch] → q → [parse] → q → [analyse] → q → [persist] → results
+
+While one email waits on the LLM, the next is already being fetched and
+parsed, so a batch takes roughly as long as its slowest stage instead of
+the sum of every per-email step.  Bounded queues give back-pressure: a
+slow stage stalls the stages in front of it instead of buffering the
+whole mailbox in memory.
+
+A stage function receives one item and returns the (possibly updated) item
+to pass downstream, or ``None`` to drop it (duplicate, empty body, ...).
+Returning a list fans out: each element travels downstream as its own
+item, which lets a stage work on a batch (e.g. one IMAP FETCH for a whole
+UID set) while later stages still see one email at a time.
+A stage built with ``priority=`` reads its input from a priority queue
+instead of FIFO: the lowest key is processed first (e.g. fraud emails
+reach the LLM before newsletters that were queued earlier).
+Any other exception is recorded against the item and the run continues.
+Raising ``PipelineAbort`` stops the run: items still queued are drained
+without being processed and reported as pending.  A BaseException from a
+stage (CancelledError, KeyboardInterrupt, ...) aborts the run the same
+way, so run_pipeline() still returns instead of waiting on a dead worker.
+"""
+
+import time
+import queue
+import logging
+import itertools
+import threading
+from typing import Any, Callable, Iterable
+
+logger = logging.getLogger("pipeline")
+
+_DONE = object()  # end-of-stream marker, one per downstream worker
+
+
+class PipelineAbort(Exception):
+    """Raised by a stage function to stop the whole run (e.g. API quota exhausted)."""
+
+
+class Stage:
+    """
+    One pipeline step: a name, a per-item function and its worker count.
+
+    ``priority`` (optional) maps an incoming item to a sort key (any
+    comparable value, e.g. a tuple); the stage then drains its input
+    lowest key first.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Any], Any],
+        workers: int = 1,
+        priority: Callable[[Any], Any] | None = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.priority = priority
+
+    def __repr__(self):
+        return f"<Stage(name='{self.name}', workers={self.workers})>"
+
+
+def run_pipeline(
+    items: Iterable[Any],
+    stages: list[Stage],
+    queue_size: int = 10,
+    on_error: Callable[[str, Any, Exception], None] | None = None,
+) -> dict:
+    """
+    Push ``items`` through ``stages`` and block until every item has left
+    the pipeline.  ``on_error(stage_name, item, exc)`` (optional) is called
+    as soon as an item fails, e.g. to report progress while the run is
+    still going.
+
+    Returns a dict with:
+        results       — items returned by the last stage
+        errors        — [{"stage", "item", "error"}] for items that raised
+        dropped       — number of items a stage returned None (or []) for
+        pending       — items never processed because the run was aborted
+        aborted       — the PipelineAbort message (or "<stage>: <exception type>"), or None
+        stage_seconds — busy time per stage (sum over its workers)
+        elapsed       — wall-clock seconds for the whole run
+    """
+    if not stages:
+        raise ValueError("run_pipeline needs at least one stage.")
+
+    queues = [
+        (queue.PriorityQueue if s.priority else queue.Queue)(maxsize=max(1, queue_size))
+        for s in stages
+    ]
+    seq = itertools.count()  # FIFO tie-break; items themselves are never compared
+    lock = threading.Lock()
+    abort = threading.Event()
+    state = {
+        "results": [],
+        "errors": [],
+        "dropped": 0,
+        "pending": 0,
+        "aborted": None,
+        "stage_seconds": {s.name: 0.0 for s in stages},
+    }
+    remaining = [s.workers for s in stages]  # live workers per stage
+
+    def _put(idx: int, item):
+        stage = stages[idx]
+        if stage.priority is None:
+            queues[idx].put(item)
+        elif item is _DONE:
+            queues[idx].put((1, None, next(seq), item))  # after every real item
+        else:
+            queues[idx].put((0, stage.priority(item), next(seq), item))
+
+    def _get(idx: int):
+        entry = queues[idx].get()
+        return entry[3] if stages[idx].priority else entry
+
+    def _worker(idx: int, stage: Stage):
+        has_next = idx + 1 < len(stages)
+        fatal = None  # BaseException from stage.fn, re-raised once the stream is closed
+        try:
+            while True:
+                item = _get(idx)
+                if item is _DONE:
+                    break
+                if abort.is_set():
+                    with lock:
+                        state["pending"] += 1
+                    continue
+
+                t0 = time.perf_counter()
+                try:
+                    out = stage.fn(item)
+                except PipelineAbort as exc:
+                    with lock:
+                        if state["aborted"] is None:
+                            state["aborted"] = str(exc) or stage.name
+                        state["errors"].append({"stage": stage.name, "item": item, "error": exc})
+                    abort.set()
+                    continue
+                except Exception as exc:
+                    logger.warning("Pipeline stage '%s' failed: %s", stage.name, exc)
+                    with lock:
+                        state["errors"].append({"stage": stage.name, "item": item, "error": exc})
+                    if on_error is not None:
+                        try:
+                            on_error(stage.name, item, exc)
+                        except Exception:
+                            logger.exception("Pipeline on_error callback failed")
+                    continue
+                except BaseException as exc:
+                    # Cancellation / interpreter exit: abort the run, but keep
+                    # draining so upstream puts and the final join never block
+                    logger.error("Pipeline stage '%s' interrupted: %r", stage.name, exc)
+                    with lock:
+                        if state["aborted"] is None:
+                            state["aborted"] = f"{stage.name}: {type(exc).__name__}"
+                        state["errors"].append({"stage": stage.name, "item": item, "error": exc})
+                    abort.set()
+                    fatal = fatal or exc
+                    continue
+                finally:
+                    with lock:
+                        state["stage_seconds"][stage.name] += time.perf_counter() - t0
+
+                outs = out if isinstance(out, list) else ([] if out is None else [out])
+                if not outs:
+                    with lock:
+                        state["dropped"] += 1
+                elif not has_next:
+                    with lock:
+                        state["results"].extend(outs)
+                else:
+                    for o in outs:
+                        _put(idx + 1, o)
+        finally:
+            # Last worker of this stage out → close the next stage's input
+            with lock:
+                remaining[idx] -= 1
+                last = remaining[idx] == 0
+            if last and has_next:
+                for _ in range(stages[idx + 1].workers):
+                    _put(idx + 1, _DONE)
+        if fatal is not None:
+            raise fatal
+
+    threads = []
+    for idx, stage in enumerate(stages):
+        for n in range(stage.workers):
+            t = threading.Thread(
+                target=_worker, args=(idx, stage),
+                name=f"pipeline-{stage.name}-{n}", daemon=True,
+            )
+            t.start()
+            threads.append(t)
+
+    start = time.perf_counter()
+    for item in items:
+        if abort.is_set():
+            with lock:
+                state["pending"] += 1
+            continue
+        _put(0, item)  # blocks when the first stage is saturated
+    for _ in range(stages[0].workers):
+        _put(0, _DONE)
+
+    for t in threads:
+        t.join()
+
+    state["elapsed"] = time.perf_counter() - start
+    state["stage_seconds"] = {k: round(v, 2) for k, v in state["stage_seconds"].items()}
+    return state
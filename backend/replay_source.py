@@ -0,0 +1,215 @@
+"""
+Offline ingestion source: replay .eml files, Maildir directories and mbox
+archives through the ingestion pipeline.
+
+Live Gmail IMAP is the only production source, which makes ingestion
+throughput impossible to benchmark or regression-test without a mailbox
+full of real mail.  replay() reads a local corpus instead and feeds it
+through the same path as POST /fetch_emails — ingestion_jobs rows, then
+ingestion_service.IngestionBatch's parse → analyse → persist stages — so
+only the IMAP fetch stage is swapped for a file loader.
+
+Optionally messages are released at a fixed rate (``rate`` messages per
+second, e.g. to model a burst or a steady inbound load); without it the
+corpus is pushed as fast as the pipeline accepts it.
+
+Usage:
+    python replay_source.py corpus/                   # every .eml / Maildir / mbox below
+    python replay_source.py archive.mbox --rate 50 --limit 10000
+
+Tickets are really created: point DATABASE_URL at a scratch database.
+Each replay is its own ingestion_jobs generation (uidvalidity = start
+time in nanoseconds, so even replays started in the same second differ),
+so a corpus can be replayed again; Message-ID / content-hash dedup
+still applies against tickets already in the database.
+"""
+
+import os
+import sys
+import time
+import mailbox
+import argparse
+from typing import Iterator
+
+from database import SessionLocal
+from imap_fetch import decode_header_value
+from mime_text import extract_message
+from urgency_classifier import provisional_priority
+from dedup import known_message_ids
+from job_queue import enqueue
+from pipeline import Stage, run_pipeline
+from llm_scheduler import scheduler
+from ingestion_service import (
+    IngestionBatch, PIPELINE_FETCH_WORKERS, PIPELINE_QUEUE_SIZE,
+)
+
+REPLAY_MAILBOX_PREFIX = "replay:"
+
+
+# ─────────────────── Corpus readers ───────────────────
+
+def _is_maildir(path: str) -> bool:
+    return all(os.path.isdir(os.path.join(path, sub)) for sub in ("cur", "new", "tmp"))
+
+
+def _is_mbox(path: str) -> bool:
+    try:
+        with open(path, "rb") as fh:
+            return fh.read(5) == b"From "
+    except OSError:
+        return False
+
+
+def iter_raw_messages(paths: list[str]) -> Iterator[tuple[str, bytes]]:
+    """
+    Yield (reference, raw RFC 822 bytes) for every message under ``paths``.
+
+    A path may be a single .eml file, an mbox archive, a Maildir
+    (cur/new/tmp) or any directory containing those; directories are
+    walked in sorted order so a replay is reproducible.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            if _is_maildir(path):
+                box = mailbox.Maildir(path, factory=None, create=False)
+                for key in sorted(box.iterkeys()):
+                    yield f"{path}#{key}", box.get_bytes(key)
+                continue
+            for name in sorted(os.listdir(path)):
+                yield from iter_raw_messages([os.path.join(path, name)])
+        elif path.lower().endswith(".eml"):
+            with open(path, "rb") as fh:
+                yield path, fh.read()
+        elif _is_mbox(path):
+            box = mailbox.mbox(path, factory=None, create=False)
+            try:
+                for n, key in enumerate(box.iterkeys()):
+                    yield f"{path}#{n}", box.get_bytes(key)
+            finally:
+                box.close()
+
+
+def paced(messages, rate: float | None = None, limit: int | None = None):
+    """Release at most ``limit`` messages, ``rate`` per second (None = no pacing)."""
+    start = time.perf_counter()
+    for n, message in enumerate(messages):
+        if limit is not None and n >= limit:
+            return
+        if rate:
+            delay = start + n / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield message
+
+
+# ─────────────────── Replay ───────────────────
+
+def replay(
+    paths: list[str],
+    rate: float | None = None,
+    limit: int | None = None,
+    mailbox_name: str | None = None,
+) -> dict:
+    """
+    Ingest every message under ``paths`` and return a throughput summary.
+
+    Messages are numbered in corpus order; that number is the job's UID
+    under the mailbox ``replay:<name>``.
+    """
+    key = REPLAY_MAILBOX_PREFIX + (mailbox_name or os.path.basename(os.path.abspath(paths[0])))
+    uidvalidity = time.time_ns()   # BIGINT; second resolution let concurrent replays collide
+    batch = IngestionBatch()
+    counts = {"read": 0, "known_message_id": 0}
+
+    def _items():
+        for uid, (ref, raw) in enumerate(paced(iter_raw_messages(paths), rate, limit), start=1):
+            counts["read"] += 1
+            yield {"uid": uid, "ref": ref, "raw": raw}
+
+    # ── Stage 1: parse the raw message and enqueue it as a job ──
+    def _load_stage(item: dict) -> list[dict]:
+        headers, body = extract_message(item.pop("raw"))
+        hdr = {
+            "uid": item["uid"],
+            "message_id": (headers.get("Message-ID") or "").strip() or None,
+            "subject": decode_header_value(headers.get("Subject", "(No Subject)")),
+            "sender": decode_header_value(headers.get("From", "(Unknown)")),
+            "body": body,
+        }
+        hdr["provisional"] = provisional_priority(hdr["subject"], hdr["sender"])
+        with SessionLocal() as session:
+            if hdr["message_id"] and known_message_ids(session, [hdr["message_id"]]):
+                with batch.lock:
+                    counts["known_message_id"] += 1
+                return []
+            jobs = enqueue(session, batch.worker_id, key, uidvalidity, [hdr])
+        for job in jobs:
+            job["order"] = item["uid"]
+        return jobs
+
+    def _err_label(item) -> str:
+        if isinstance(item, dict) and "job_id" not in item:
+            return item.get("ref", "unknown")  # failed before it became a job
+        return batch.err_label(item)
+
+    print(f"🔁 Replaying {', '.join(paths)} as {key}"
+          + (f" at {rate:g} msg/s" if rate else "") + (f" (limit {limit})" if limit else ""))
+    run = None
+    try:
+        run = run_pipeline(
+            _items(),
+            [Stage("load", _load_stage, PIPELINE_FETCH_WORKERS)] + batch.stages(),
+            queue_size=PIPELINE_QUEUE_SIZE,
+            on_error=batch.on_error,
+        )
+    finally:
+        batch.finish(run)
+
+    elapsed = run["elapsed"] or 1e-9
+    tickets = len(run["results"])
+    summary = {
+        "mailbox": key,
+        "read": counts["read"],
+        "tickets": tickets,
+        "skipped_duplicates": len(batch.duplicates) + counts["known_message_id"],
+        "dropped": run["dropped"],
+        "errors": len(run["errors"]),
+        "error_details": [f"{_err_label(e['item'])}: {e['error']}" for e in run["errors"][:10]],
+        "aborted": run["aborted"],
+        "pending": run["pending"],
+        "elapsed": round(elapsed, 2),
+        "read_per_second": round(counts["read"] / elapsed, 2),
+        "tickets_per_second": round(tickets / elapsed, 2),
+        "stage_seconds": run["stage_seconds"],
+        "llm_scheduler": dict(scheduler.stats),
+    }
+    return summary
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay .eml / Maildir / mbox files through ingestion.")
+    parser.add_argument("paths", nargs="+", help=".eml files, Maildir or mbox paths, or directories of them")
+    parser.add_argument("--rate", type=float, default=None, help="messages per second (default: as fast as possible)")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many messages")
+    parser.add_argument("--mailbox", default=None, help="name for the replay mailbox (default: first path's name)")
+    args = parser.parse_args(argv)
+
+    missing = [p for p in args.paths if not os.path.exists(p)]
+    if missing:
+        parser.error(f"not found: {', '.join(missing)}")
+
+    summary = replay(args.paths, rate=args.rate, limit=args.limit, mailbox_name=args.mailbox)
+    print(f"📊 Replayed {summary['read']} message(s) in {summary['elapsed']}s → "
+          f"{summary['tickets']} ticket(s), {summary['skipped_duplicates']} duplicate(s), "
+          f"{summary['errors']} error(s)")
+    print(f"   Throughput: {summary['read_per_second']} read/s, {summary['tickets_per_second']} tickets/s")
+    print(f"   Stage busy time: {summary['stage_seconds']}")
+    if summary["aborted"]:
+        print(f"   🚫 Aborted ({summary['aborted']}); {summary['pending']} message(s) not processed")
+    for err in summary["error_details"]:
+        print(f"   ❌ {err}")
+    return 1 if summary["aborted"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
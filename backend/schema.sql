@@ -21,6 +21,8 @@ CREATE TABLE IF NOT EXISTS tickets (
     transaction_id VARCHAR(100),
     amount        VARCHAR(50),
     draft_response TEXT,
+    message_id    VARCHAR(998),
+    content_sha256 VARCHAR(64),
     is_read       BOOLEAN         NOT NULL DEFAULT FALSE,
     is_ai_draft_edited BOOLEAN    NOT NULL DEFAULT FALSE,
     created_at    TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
@@ -31,3 +33,77 @@ CREATE INDEX IF NOT EXISTS idx_tickets_status     ON tickets (status);
 CREATE INDEX IF NOT EXISTS idx_tickets_priority   ON tickets (priority);
 CREATE INDEX IF NOT EXISTS idx_tickets_category   ON tickets (category);
 CREATE INDEX IF NOT EXISTS idx_tickets_created_at ON tickets (created_at DESC);
+
+-- Dedup keys: Message-ID header and SHA-256 of the ticket text
+CREATE UNIQUE INDEX IF NOT EXISTS ix_tickets_message_id     ON tickets (message_id);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_tickets_content_sha256 ON tickets (content_sha256);
+
+-- IMAP sync cursor (UID high-water mark per mailbox)
+CREATE TABLE IF NOT EXISTS mailbox_sync_state (
+    mailbox       VARCHAR(320)    PRIMARY KEY,
+    uidvalidity   BIGINT          NOT NULL,
+    last_uid      BIGINT          NOT NULL DEFAULT 0,
+    updated_at    TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- Durable ingestion queue: one row per email, resumable after restarts
+CREATE TYPE ingestion_job_state AS ENUM ('fetched', 'parsed', 'analysed', 'saved', 'skipped', 'failed');
+
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id                   UUID            PRIMARY KEY DEFAULT gen_random_uuid(),
+    mailbox              VARCHAR(320)    NOT NULL,
+    uidvalidity          BIGINT          NOT NULL,
+    uid                  BIGINT          NOT NULL,
+    message_id           VARCHAR(998),
+    state                ingestion_job_state NOT NULL DEFAULT 'fetched',
+    provisional_priority VARCHAR(10),
+    subject              TEXT,
+    sender               TEXT,
+    body                 TEXT,
+    full_text            TEXT,
+    content_sha256       VARCHAR(64),
+    analysis_json        TEXT,
+    ticket_id            UUID,
+    attempts             INTEGER         NOT NULL DEFAULT 0,
+    last_error           TEXT,
+    claimed_by           VARCHAR(64),
+    claimed_until        TIMESTAMP WITH TIME ZONE,
+    created_at           TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    updated_at           TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    CONSTRAINT uq_ingestion_jobs_source UNIQUE (mailbox, uidvalidity, uid)
+);
+
+CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_state ON ingestion_jobs (state);
+
+-- Asynchronous /fetch_emails runs (polled via GET /jobs/{id})
+CREATE TYPE fetch_run_status AS ENUM ('queued', 'running', 'completed', 'failed');
+
+CREATE TABLE IF NOT EXISTS fetch_runs (
+    id              UUID            PRIMARY KEY DEFAULT gen_random_uuid(),
+    status          fetch_run_status NOT NULL DEFAULT 'queued',
+    include_read    BOOLEAN         NOT NULL DEFAULT FALSE,
+    max_emails      INTEGER         NOT NULL,
+    sync_mode       VARCHAR(10)     NOT NULL,
+    total           INTEGER,
+    progress_json   TEXT,
+    result_json     TEXT,
+    error           TEXT,
+    claimed_by      VARCHAR(64),
+    claimed_until   TIMESTAMP WITH TIME ZONE,
+    created_at      TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    started_at      TIMESTAMP WITH TIME ZONE,
+    finished_at     TIMESTAMP WITH TIME ZONE,
+    updated_at      TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- Durable LLM result cache (llm_cache.PersistentCache); prompt_version
+-- changes whenever a prompt or output schema is edited
+CREATE TABLE IF NOT EXISTS llm_cache (
+    kind            VARCHAR(32)     NOT NULL,
+    model           VARCHAR(100)    NOT NULL,
+    prompt_version  VARCHAR(16)     NOT NULL,
+    content_sha256  VARCHAR(64)     NOT NULL,
+    value_json      TEXT            NOT NULL,
+    created_at      TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (kind, model, prompt_version, content_sha256)
+);
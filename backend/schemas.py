@@ -121,6 +121,10 @@ class AnalyzeRequest(BaseModel):
             )
         },
     )
+    message_id: Optional[str] = Field(
+        default=None,
+        description="Message-ID header of the source email, used for dedup (optional).",
+    )
 
 
 class ProcessTicketResponse(BaseModel):
@@ -0,0 +1,103 @@
+"""
+Single-flight coalescing of identical in-flight LLM requests.
+
+The analysis / urgency caches are only filled once a call returns.  When
+the background poller and a manual "Fetch New Emails" click (or two
+uvicorn workers' threads, or a burst of identical webhook posts) reach
+the same email at the same moment, every one of them missed the cache
+and paid for its own LLM call — exactly when Groq's quota is tightest.
+
+SingleFlight keys calls by content hash: the first caller for a key runs
+the call, later callers for the same key wait on its future and share
+the result (or its exception).  Threads (do) and coroutines (ado) share
+one table, so a pipeline thread and a FastAPI handler also coalesce.
+The key is dropped once the call finishes; by then its result is in the
+cache, so later callers hit that instead.
+
+Only an ordinary exception is shared.  A leader that is cancelled (or
+interrupted) gives up the key without an outcome; its followers retry,
+and one of them becomes the new leader — a cancelled /process_ticket
+must not raise CancelledError inside an ingestion thread.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable
+
+from cache import register_stats
+
+
+class _LeaderGone(Exception):
+    """The leader left without an outcome; followers should retry."""
+
+
+class SingleFlight:
+    """At most one in-flight call per key; concurrent callers share its outcome."""
+
+    def __init__(self, name: str):
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+        self._stats = {"calls": 0, "coalesced": 0}
+        register_stats(name, self.stats)
+
+    def _join(self, key: str) -> tuple[Future, bool]:
+        """(future for ``key``, True if this caller must run the call)."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            self._stats["calls"] += 1
+            return future, True
+
+    def _settle(self, key: str, future: Future, result: Any = None, exc: BaseException | None = None):
+        if exc is not None and not isinstance(exc, Exception):
+            exc = _LeaderGone()  # cancellation / interrupt belongs to the leader only
+        with self._lock:
+            self._inflight.pop(key, None)
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Run ``fn()`` unless a call for ``key`` is already in flight; return its result."""
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return future.result()
+            except _LeaderGone:
+                continue
+        try:
+            result = fn()
+        except BaseException as exc:
+            self._settle(key, future, exc=exc)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Async do(): awaits ``fn()`` or the call already in flight for ``key``."""
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except _LeaderGone:
+                continue
+        try:
+            result = await fn()
+        except BaseException as exc:
+            self._settle(key, future, exc=exc)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._inflight)}
@@ -0,0 +1,99 @@
+"""email_trim: reply history / forwards / signatures."""
+
+from email_trim import trim_email
+
+FORWARDED = (
+    "From: Jane Doe <jane@example.com>\n"
+    "Sent: Monday, March 3, 2025 10:00 AM\n"
+    "To: Support <support@bank.com>\n"
+    "Subject: {subject}\n"
+    "\n"
+    "{body}"
+)
+
+
+def _trim(text: str) -> str:
+    return trim_email(text)["text"]
+
+
+def test_gmail_reply_history_is_dropped():
+    text = "Thanks, that fixed it.\n\nOn Mon, 3 Mar 2025 at 10:00, Support <s@bank.com> wrote:\n> We refunded you."
+    assert _trim(text) == "Thanks, that fixed it."
+
+
+def test_outlook_forward_without_banner_keeps_body():
+    body = "Hello, my card was charged twice for order 4411. Please refund $49.99."
+    text = "Please handle this one, thanks team.\n\n" + FORWARDED.format(subject="Card charged twice", body=body)
+    out = _trim(text)
+    assert out.startswith("Please handle this one")
+    assert body in out
+    assert "Sent:" not in out
+
+
+def test_outlook_fw_subject_is_a_forward_even_under_a_long_note():
+    note = "Forwarding the customer's complaint below. " * 8
+    body = "Someone withdrew $900 from my account without my permission."
+    out = _trim(note + "\n\n" + FORWARDED.format(subject="FW: Unauthorised withdrawal", body=body))
+    assert body in out
+
+
+def test_outlook_re_subject_is_reply_history():
+    text = "Got it, thanks for the quick help.\n\n" + FORWARDED.format(subject="RE: Card charged twice", body="We refunded you.")
+    assert _trim(text) == "Got it, thanks for the quick help."
+
+
+def test_different_forwards_with_same_cover_note_trim_differently():
+    note = "Please handle this one, thanks team.\n\n"
+    a = _trim(note + FORWARDED.format(subject="Refund", body="Refund for order 1 has not arrived after ten days."))
+    b = _trim(note + FORWARDED.format(subject="Hacked", body="My account was hacked and money is gone, help now."))
+    assert a != b
+
+
+def test_underscore_separator_without_header_block_is_kept():
+    text = "Hi team,\nplease see below.\n__________________________\nmy account was hacked and $900 is gone."
+    assert "my account was hacked" in _trim(text)
+
+
+def test_underscore_separator_before_reply_block_cuts_history():
+    reply = "Thanks, the refund arrived and everything is fine now. " * 5
+    text = reply + "\n________________________________\n" + FORWARDED.format(
+        subject="RE: Refund", body="We have issued the refund.")
+    out = _trim(text)
+    assert "We have issued the refund." not in out
+    assert "____" not in out
+
+
+def test_rfc3676_signature_keeps_name_only():
+    text = "My transfer TXN-4411 failed twice.\n-- \nJane Doe\nSenior Analyst, Acme\n+1 555 0100"
+    assert _trim(text) == "My transfer TXN-4411 failed twice.\nJane Doe"
+
+
+def test_bare_double_dash_is_not_a_signature():
+    text = "My transfer failed.\n--\nAlso my card was blocked yesterday without notice."
+    assert "card was blocked" in _trim(text)
+
+
+def test_synthetic_header_is_preserved():
+    text = "From: jane@example.com\nSubject: Help\n\nMy card is blocked, please help.\n\nSent from my iPhone"
+    assert _trim(text) == "From: jane@example.com\nSubject: Help\n\nMy card is blocked, please help."
+
+
+def test_trailing_disclaimer_is_dropped():
+    text = ("My card ending 4411 was charged twice yesterday.\n\nThanks,\nJane\n\n"
+            "CONFIDENTIALITY NOTICE: This e-mail and any attachments are confidential and intended "
+            "solely for the addressee.")
+    out = _trim(text)
+    assert out.endswith("Jane")
+    assert "CONFIDENTIALITY" not in out
+
+
+def test_notice_wording_mid_message_is_kept():
+    text = ("Hi team, I am writing about my debit card.\n\nIMPORTANT NOTICE: my card was used in a shop I have never visited.\n"
+            "Three payments of $120 went through on Friday. Please block the card.\n\nThanks,\nJane")
+    assert _trim(text) == text
+
+
+def test_disclaimer_heading_before_long_customer_text_is_kept():
+    text = "My account was charged again this week.\n\nDISCLAIMER\nI am not a lawyer, but this charge looks unauthorized to me.\n" + "\n".join(
+        f"Line {n}: payment of ${n}0 to an unknown merchant." for n in range(1, 25))
+    assert "Line 24" in _trim(text)
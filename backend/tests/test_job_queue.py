@@ -0,0 +1,94 @@
+"""job_queue: enqueue / claim / lease / advance / fail on SQLite (the lease applies; no row locks)."""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import job_queue
+from job_queue import advance, claim, enqueue, fail, known_uids, release
+from models import IngestionJob, JobState
+
+BOX = "support@example.com/INBOX"
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    IngestionJob.__table__.create(engine)
+    with sessionmaker(bind=engine)() as session:
+        yield session
+    engine.dispose()
+
+
+def _items(*uids):
+    return [{"uid": uid, "message_id": f"<{uid}@example.com>", "subject": f"#{uid}", "sender": "a@b.c",
+             "body": "body", "provisional": "Medium"} for uid in uids]
+
+
+def _expire_leases(monkeypatch):
+    """Leases written from now on are already over."""
+    monkeypatch.setattr(job_queue, "JOB_LEASE_SECONDS", -1)
+
+
+def test_enqueue_skips_uids_that_already_have_a_job(db):
+    created = enqueue(db, "w1", BOX, 7, _items(1, 2))
+    assert [job["uid"] for job in created] == [1, 2]
+    assert [job["uid"] for job in enqueue(db, "w1", BOX, 7, _items(2, 3))] == [3]
+    assert known_uids(db, BOX, 7, [1, 2, 3, 4]) == {1, 2, 3}
+    assert known_uids(db, BOX, 8, [1]) == set()   # new UIDVALIDITY generation
+
+
+def test_leased_jobs_are_not_claimed_by_another_worker(db):
+    enqueue(db, "w1", BOX, 7, _items(1, 2))
+    assert claim(db, "w2") == []
+
+
+def test_expired_lease_is_claimed(db, monkeypatch):
+    _expire_leases(monkeypatch)
+    enqueue(db, "w1", BOX, 7, _items(1, 2))
+    monkeypatch.setattr(job_queue, "JOB_LEASE_SECONDS", 600)
+    claimed = claim(db, "w2")
+    assert sorted(job["uid"] for job in claimed) == [1, 2]
+    assert claim(db, "w3") == []   # w2's fresh lease holds
+
+
+def test_advance_after_losing_the_lease_writes_nothing(db, monkeypatch):
+    _expire_leases(monkeypatch)
+    job = enqueue(db, "w1", BOX, 7, _items(1))[0]
+    monkeypatch.setattr(job_queue, "JOB_LEASE_SECONDS", 600)
+    claim(db, "w2")
+    assert advance(db, job["job_id"], "w1", JobState.PARSED, full_text="stale") is False
+    assert advance(db, job["job_id"], "w2", JobState.PARSED, full_text="fresh") is True
+    row = db.get(IngestionJob, job["job_id"])
+    db.refresh(row)
+    assert (row.state, row.full_text, row.claimed_by) == (JobState.PARSED, "fresh", "w2")
+
+
+def test_terminal_state_drops_the_lease(db):
+    job = enqueue(db, "w1", BOX, 7, _items(1))[0]
+    assert advance(db, job["job_id"], "w1", JobState.SAVED)
+    row = db.get(IngestionJob, job["job_id"])
+    db.refresh(row)
+    assert row.claimed_by is None and row.claimed_until is None
+    assert claim(db, "w2") == []   # saved jobs are never resumed
+
+
+def test_failed_attempts_retry_then_give_up(db, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 2)
+    job = enqueue(db, "w1", BOX, 7, _items(1))[0]
+    assert fail(db, job["job_id"], "w1", "LLM timeout") == JobState.FETCHED
+    retry = claim(db, "w2")
+    assert [j["attempts"] for j in retry] == [1]
+    assert fail(db, job["job_id"], "w2", "LLM timeout") == JobState.FAILED
+    assert claim(db, "w3") == []
+
+
+def test_fail_by_a_non_owner_is_ignored(db):
+    job = enqueue(db, "w1", BOX, 7, _items(1))[0]
+    assert fail(db, job["job_id"], "w2", "not mine") is None
+
+
+def test_release_frees_every_lease_of_a_worker(db):
+    enqueue(db, "w1", BOX, 7, _items(1, 2))
+    assert release(db, "w1") == 2
+    assert len(claim(db, "w2")) == 2
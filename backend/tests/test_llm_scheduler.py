@@ -0,0 +1,30 @@
+"""llm_scheduler: async admission waits on the event loop, not in a thread."""
+
+import asyncio
+import time
+
+from llm_scheduler import LLMScheduler
+
+
+def test_aacquire_waits_without_blocking_the_loop():
+    sched = LLMScheduler({"m": {"rpm": 60, "tpm": 100000}})
+
+    async def main():
+        for _ in range(60):
+            await sched.aacquire("m", 10)   # bucket now empty: next one waits ~1s
+        start = time.monotonic()
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while time.monotonic() - start < 0.5:
+                await asyncio.sleep(0.05)
+                ticks += 1
+
+        await asyncio.gather(sched.aacquire("m", 10), ticker())
+        return time.monotonic() - start, ticks
+
+    waited, ticks = asyncio.run(main())
+    assert waited >= 0.5
+    assert ticks >= 5
+    assert sched.stats["calls"] == 61
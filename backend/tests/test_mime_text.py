@@ -0,0 +1,27 @@
+"""mime_text: size-capped decoding of text parts."""
+
+import base64
+
+from mime_text import TextPartDecoder, decode_text_payload
+
+
+def test_cap_never_splits_a_multibyte_character():
+    payload = ("é" * 10).encode("utf-8")
+    for cap in range(1, 12):
+        text = decode_text_payload(payload, max_bytes=cap)
+        assert "�" not in text
+        assert text == "é" * (cap // 2)
+
+
+def test_cap_inside_streamed_base64():
+    payload = base64.encodebytes(("Zahlung fehlgeschlagen – " * 20).encode("utf-8"))
+    decoder = TextPartDecoder("base64", "utf-8", max_bytes=101)
+    for i in range(0, len(payload), 7):
+        decoder.feed(payload[i:i + 7])
+    text = decoder.text()
+    assert "�" not in text
+    assert text.startswith("Zahlung fehlgeschlagen –")
+
+
+def test_invalid_bytes_are_still_replaced():
+    assert decode_text_payload(b"\xff ok", max_bytes=0) == "� ok"
@@ -0,0 +1,76 @@
+"""near_dup + agent._reuse: reusing a near-duplicate's analysis for a new sender."""
+
+from agent import _reuse
+from near_dup import NearDupIndex
+from schemas import TicketAnalysisWithDraft
+
+TEMPLATE = (
+    "Hello, my name is {name}. I was charged {amount} twice for the same order "
+    "yesterday and the second charge still shows on my statement. The reference "
+    "is {txn}. Please reverse the duplicate charge as soon as possible. I have "
+    "already contacted the merchant and they confirmed only one payment went "
+    "through on their side, so the second debit must be an error at the bank."
+)
+
+
+def _donor(name: str, amount: str, txn: str, draft: str) -> TicketAnalysisWithDraft:
+    return TicketAnalysisWithDraft(
+        sentiment="Negative",
+        intent="Request refund of duplicate charge",
+        entities={"customer_name": name, "transaction_id": txn, "amount": amount},
+        priority="Medium",
+        category="Payment Issue",
+        summary=f"{name} was charged {amount} twice ({txn}).",
+        draft_response=draft,
+    )
+
+
+def test_template_variants_are_near_duplicates():
+    index = NearDupIndex("test_near_dup")
+    index.add(TEMPLATE.format(name="Jane Doe", amount="$50.00", txn="TXN-1001"), "donor")
+    hit = index.find(TEMPLATE.format(name="Bob Stone", amount="$75.00", txn="TXN-2002"))
+    assert hit is not None and hit[0] == "donor"
+
+
+def test_unrelated_email_is_not_a_near_duplicate():
+    index = NearDupIndex("test_near_dup_unrelated")
+    index.add(TEMPLATE.format(name="Jane Doe", amount="$50.00", txn="TXN-1001"), "donor")
+    assert index.find(
+        "What are the interest rates on your savings accounts this quarter, and is there a "
+        "minimum balance for the premium tier? I would also like to know the withdrawal limits."
+    ) is None
+
+
+def test_reuse_swaps_whole_words_only():
+    donor = _donor(
+        "Jane", "$50", "TXN-1001",
+        "Dear Jane, we refunded $50 (TXN-1001). Jane's card also had a $500 hold, "
+        "which Janet from billing released.",
+    )
+    out = _reuse(donor, TEMPLATE.format(name="Bob Stone", amount="$75", txn="TXN-2002"))
+    assert out is not None
+    assert out.entities.customer_name == "Bob Stone"
+    assert out.draft_response.startswith("Dear Bob Stone, we refunded $75 (TXN-2002).")
+    assert "$500 hold" in out.draft_response
+    assert "Janet" in out.draft_response
+    assert out.summary == "Bob Stone was charged $75 twice (TXN-2002)."
+
+
+def test_reuse_skips_short_old_values():
+    donor = _donor("Al", "$50.00", "TXN-1001", "Dear Al, Also note your refund of $50.00.")
+    assert _reuse(donor, TEMPLATE.format(name="Bob Stone", amount="$75.00", txn="TXN-2002")) is None
+
+
+def test_reuse_skips_values_that_also_occur_in_the_new_email():
+    donor = _donor("Jane Doe", "$50.00", "TXN-1001", "Dear Jane Doe, we refunded $50.00.")
+    text = TEMPLATE.format(name="Bob Stone", amount="$75.00", txn="TXN-2002") + " My wife paid $50.00 too."
+    assert _reuse(donor, text) is None
+
+
+def test_reuse_falls_back_to_placeholders():
+    donor = _donor("Jane Doe", "$50.00", "TXN-1001", "Dear Jane Doe, we refunded $50.00 (TXN-1001).")
+    text = ("I was charged twice for the same order yesterday and the second charge still shows "
+            "on my statement. Please reverse the duplicate charge as soon as possible.")
+    out = _reuse(donor, text)
+    assert out is not None
+    assert out.draft_response == "Dear Customer, we refunded [amount] ([transaction ID])."
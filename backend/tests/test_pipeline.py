@@ -0,0 +1,56 @@
+"""pipeline: staged runs finish even when a stage misbehaves."""
+
+import asyncio
+import threading
+
+from pipeline import PipelineAbort, Stage, run_pipeline
+
+
+def test_items_flow_through_every_stage():
+    run = run_pipeline(range(5), [Stage("double", lambda x: x * 2, 2), Stage("inc", lambda x: x + 1)])
+    assert sorted(run["results"]) == [1, 3, 5, 7, 9]
+    assert run["aborted"] is None
+
+
+def test_exception_is_recorded_and_run_continues():
+    def fn(x):
+        if x == 2:
+            raise ValueError("bad")
+        return x
+
+    run = run_pipeline(range(4), [Stage("a", fn), Stage("b", lambda x: x)])
+    assert sorted(run["results"]) == [0, 1, 3]
+    assert [e["item"] for e in run["errors"]] == [2]
+
+
+def test_pipeline_abort_reports_pending():
+    def fn(x):
+        if x == 0:
+            raise PipelineAbort("quota")
+        return x
+
+    run = run_pipeline(range(5), [Stage("a", fn), Stage("b", lambda x: x)], queue_size=10)
+    assert run["aborted"] == "quota"
+    assert run["results"] == []
+
+
+def test_base_exception_in_a_stage_does_not_hang_the_run():
+    def fn(x):
+        if x == 1:
+            raise asyncio.CancelledError()
+        return x
+
+    done = []
+    hook = threading.excepthook
+    threading.excepthook = lambda args: None  # the worker re-raises once the stream is closed
+    try:
+        t = threading.Thread(target=lambda: done.append(run_pipeline(
+            range(20), [Stage("a", fn), Stage("b", lambda x: x)], queue_size=1)))
+        t.start()
+        t.join(5)
+    finally:
+        threading.excepthook = hook
+    assert done, "run_pipeline blocked after a BaseException"
+    run = done[0]
+    assert run["aborted"] == "a: CancelledError"
+    assert len(run["results"]) + run["pending"] + len(run["errors"]) == 20
@@ -0,0 +1,144 @@
+"""single_flight: concurrent identical calls share one execution."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_threads_share_one_call():
+    flight = SingleFlight("test_flight_threads")
+    calls = []
+    gate = threading.Event()
+
+    def fn():
+        calls.append(1)
+        gate.wait(1)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", fn))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    gate.set()
+    for t in threads:
+        t.join()
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"calls": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight("test_flight_keys")
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("b", lambda: 2) == 2
+    assert flight.stats()["calls"] == 2
+
+
+def test_key_is_released_after_the_call():
+    flight = SingleFlight("test_flight_release")
+    calls = []
+    for _ in range(3):
+        flight.do("k", lambda: calls.append(1))
+    assert len(calls) == 3
+
+
+def test_followers_share_the_exception():
+    flight = SingleFlight("test_flight_error")
+    gate = threading.Event()
+    errors = []
+
+    def fn():
+        gate.wait(1)
+        raise RuntimeError("rate limited")
+
+    def call():
+        try:
+            flight.do("k", fn)
+        except RuntimeError as exc:
+            errors.append(str(exc))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    gate.set()
+    for t in threads:
+        t.join()
+    assert errors == ["rate limited"] * 3
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_coroutines_share_one_call():
+    flight = SingleFlight("test_flight_async")
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("k", fn) for _ in range(4)))
+
+    assert asyncio.run(main()) == ["result"] * 4
+    assert len(calls) == 1
+
+
+def test_thread_and_coroutine_coalesce():
+    flight = SingleFlight("test_flight_mixed")
+    gate = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        gate.wait(1)
+        return "result"
+
+    leader = threading.Thread(target=lambda: flight.do("k", fn))
+    leader.start()
+    time.sleep(0.05)
+
+    async def follower():
+        asyncio.get_running_loop().call_later(0.05, gate.set)
+        return await flight.ado("k", lambda: pytest.fail("follower must not call"))
+
+    assert asyncio.run(follower()) == "result"
+    leader.join()
+    assert len(calls) == 1
+
+
+def test_cancelled_async_leader_hands_over_to_thread_follower():
+    flight = SingleFlight("test_flight_cancel")
+    started = threading.Event()
+    outcome = []
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(10)
+
+    def follower():
+        try:
+            outcome.append(flight.do("k", lambda: "from follower"))
+        except BaseException as exc:  # CancelledError must not reach here
+            outcome.append(exc)
+
+    async def main():
+        leader = asyncio.create_task(flight.ado("k", slow))
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        t = threading.Thread(target=follower)
+        t.start()
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        await asyncio.to_thread(t.join, 2)
+
+    asyncio.run(main())
+    assert outcome == ["from follower"]
+    assert flight.stats()["in_flight"] == 0
@@ -3,10 +3,18 @@ Advanced multi-tier email urgency classifier using the native Groq client.
 
 Architecture:
   • Model    : llama-3.1-8b-instant (fastest inference on Groq)
-  • Client   : Native groq SDK — zero LangChain overhead
+  • Client   : Native groq SDK — zero LangChain overhead (AsyncGroq for
+               aclassify_urgency, used by the async FastAPI handlers)
   • Temp     : 0.0 — deterministic, no sampling jitter
   • Tokens   : max_tokens=512 — room for detailed sub-category reasoning
-  • Caching  : SHA-256 in-memory dedup avoids redundant API calls
+  • Caching  : SHA-256 keyed, bounded LRU (cache.BoundedCache) avoids
+               redundant API calls
+  • Rules    : unambiguous emails ("OTP I didn't request", "tax
+               certificate") are classified by keyword rules built from
+               the taxonomy, skipping the API call (rule_classify)
+  • Local    : URGENCY_BACKEND=local|hybrid scores with a model trained
+               on past tickets (local_classifier.py) instead of / before
+               the API; it also answers when the API call fails
   • Fallback : Graceful degradation to "Medium" on any API/timeout error
 
 Taxonomy (3 urgency tiers × 11 sub-categories):
@@ -20,15 +28,24 @@ Author: Senior AI Engineer — HFT-grade classification pipeline
 """
 
 import os
+import re
+import asyncio
 import json
 import time
 import hashlib
 import logging
 from typing import TypedDict, Literal
 
-from groq import Groq
+from groq import Groq, AsyncGroq
 from dotenv import load_dotenv
 
+from llm_scheduler import scheduler, estimate_tokens
+from email_trim import trim_for_llm
+from cache import BoundedCache, register_stats
+from llm_cache import PersistentCache, prompt_version
+from single_flight import SingleFlight
+from local_classifier import get_model as get_local_model
+
 load_dotenv()
 
 logger = logging.getLogger("urgency_classifier")
@@ -41,6 +58,15 @@ TEMPERATURE = 0.0
 MAX_TOKENS = 512
 TIMEOUT_SECONDS = 10  # hard deadline for the API call
 
+# Rule fast path: answer without the API when rule confidence reaches this
+URGENCY_RULES_ENABLED = os.getenv("URGENCY_RULES_ENABLED", "true").lower() == "true"
+URGENCY_RULES_MIN_CONFIDENCE = float(os.getenv("URGENCY_RULES_MIN_CONFIDENCE", "0.75"))
+
+# "groq" (8B call), "local" (trained model only) or "hybrid" (local model
+# when at least LOCAL_CLASSIFIER_MIN_CONFIDENCE sure, 8B call otherwise)
+URGENCY_BACKEND = os.getenv("URGENCY_BACKEND", "groq").strip().lower()
+LOCAL_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("LOCAL_CLASSIFIER_MIN_CONFIDENCE", "0.8"))
+
 # ─────────────────── Taxonomy ───────────────────
 
 URGENCY_TAXONOMY = {
@@ -129,24 +155,111 @@ for _urg, _meta in URGENCY_TAXONOMY.items():
         _SUBCAT_TO_URGENCY[_sub] = _urg
         _VALID_SUBCATEGORIES.add(_sub)
 
+# ─────────────────── Pre-triage (no LLM) ───────────────────
+# Keyword patterns lifted from the sub-category descriptions above. They
+# only order the analysis queue (fraud before newsletters); the LLM and
+# classify_urgency() still decide the final priority.
+
+PRE_TRIAGE_KEYWORDS: dict[str, tuple[str, ...]] = {
+    "Security_Breach": (r"hack(ed|er)?", r"unauthori[sz]ed login", r"otp", r"password (was )?changed",
+                        r"unknown (device|location)", r"breach", r"compromised"),
+    "Fraud_Report": (r"unauthori[sz]ed", r"stolen", r"unrecogni[sz]ed", r"identity theft",
+                     r"clon(ed|ing)", r"fraud\w*", r"scam"),
+    "Transaction_Failure_Critical": (r"(money|amount) (was )?(deducted|debited)", r"refund not (received|credited)",
+                                     r"(payment|transfer) (failed|stuck)", r"salary"),
+    "Account_Lockout": (r"locked out", r"(account )?frozen", r"can'?t access", r"cannot access"),
+    "Billing_Error": (r"double[- ]charged", r"charged after cancel\w*", r"cancelled subscription",
+                      r"incorrect fee"),
+    "Dispute_Initiation": (r"dispute", r"chargeback", r"overcharge[d]?"),
+    "Feature_Malfunction": (r"app crash\w*", r"crash(es|ing)?", r"bug", r"not working"),
+    "KYC_Compliance": (r"kyc", r"document rejected", r"verification", r"passport", r"compliance hold"),
+    "General_Inquiry": (r"interest rates?", r"how (do|to|can)", r"eligib\w+"),
+    "Statement_Request": (r"statement", r"tax certificate", r"transaction history"),
+    "Feedback_Feature_Request": (r"feedback", r"feature (request|suggestion)", r"dark mode", r"thank(s| you)"),
+    "Status_Check": (r"(delivery|application|transfer) status", r"status (update|check)"),
+}
+assert set(PRE_TRIAGE_KEYWORDS) == _VALID_SUBCATEGORIES, "pre-triage keywords out of sync with taxonomy"
+
+_URGENCY_RANK = {"High": 0, "Medium": 1, "Low": 2}
+# Checked High → Medium → Low so the most urgent match wins
+_PRE_TRIAGE_RULES = sorted(
+    (
+        (_SUBCAT_TO_URGENCY[_sub], re.compile(r"\b(" + "|".join(_pats) + r")\b", re.IGNORECASE))
+        for _sub, _pats in PRE_TRIAGE_KEYWORDS.items()
+    ),
+    key=lambda rule: _URGENCY_RANK[rule[0]],
+)
+_BULK_SENDER_RE = re.compile(r"newsletter|no-?reply|marketing|promo|digest|notifications?@", re.IGNORECASE)
+
+
+def provisional_priority(subject: str, sender: str = "") -> str:
+    """
+    Instant "High" / "Medium" / "Low" guess from the subject and sender.
+
+    Used to order queued emails before any LLM call: High keywords win,
+    bulk senders (newsletters, no-reply) without one go to Low, and
+    anything unmatched sits in the middle as Medium.
+    """
+    text = f"{subject or ''} {sender or ''}"
+    for urgency, pattern in _PRE_TRIAGE_RULES:
+        if urgency == "High" and pattern.search(text):
+            return "High"
+    if _BULK_SENDER_RE.search(sender or ""):
+        return "Low"
+    for urgency, pattern in _PRE_TRIAGE_RULES:
+        if pattern.search(text):
+            return urgency
+    return "Medium"
+
+
+def urgency_rank(urgency: str) -> int:
+    """Sort key for urgency labels: High=0, Medium=1, Low=2 (unknown → Medium)."""
+    return _URGENCY_RANK.get(urgency, 1)
+
 # ─────────────────── Groq Client (singleton) ───────────────────
 
 _client: Groq | None = None
+_async_client: AsyncGroq | None = None
+
+
+def _require_key():
+    if not GROQ_API_KEY:
+        raise RuntimeError(
+            "GROQ_API_KEY is not set. "
+            "Add it to your .env file: GROQ_API_KEY=gsk_..."
+        )
 
 
 def _get_client() -> Groq:
     """Lazy-initialise the Groq client (one TCP pool for the process)."""
     global _client
     if _client is None:
-        if not GROQ_API_KEY:
-            raise RuntimeError(
-                "GROQ_API_KEY is not set. "
-                "Add it to your .env file: GROQ_API_KEY=gsk_..."
-            )
-        _client = Groq(api_key=GROQ_API_KEY, timeout=TIMEOUT_SECONDS)
+        _require_key()
+        # Retries + pacing live in llm_scheduler, which also reads the
+        # rate-limit headers off every response via the httpx hook.
+        _client = Groq(
+            api_key=GROQ_API_KEY,
+            timeout=TIMEOUT_SECONDS,
+            max_retries=0,
+            http_client=scheduler.http_client(TIMEOUT_SECONDS),
+        )
     return _client
 
 
+def _get_async_client() -> AsyncGroq:
+    """Lazy-initialise the AsyncGroq client (used from the server's event loop)."""
+    global _async_client
+    if _async_client is None:
+        _require_key()
+        _async_client = AsyncGroq(
+            api_key=GROQ_API_KEY,
+            timeout=TIMEOUT_SECONDS,
+            max_retries=0,
+            http_client=scheduler.async_http_client(TIMEOUT_SECONDS),
+        )
+    return _async_client
+
+
 # ─────────────────── System Prompt ───────────────────
 
 def _build_system_prompt() -> str:
@@ -202,21 +315,138 @@ def _build_system_prompt() -> str:
 
 
 SYSTEM_PROMPT = _build_system_prompt()
+_PROMPT_TOKENS = estimate_tokens(SYSTEM_PROMPT)
 
 # ─────────────────── Result Type ───────────────────
 
 
 class UrgencyResult(TypedDict):
     urgency: str        # "High" | "Medium" | "Low"
-    subcategory: str    # One of the 12 sub-categories
+    subcategory: str | None   # One of the 12 sub-categories (None: local model, no sub-category)
     confidence: float   # 0.0 – 1.0
     reasoning: str      # 1-sentence explanation
     sla: str            # "Immediate" | "24 hours" | "48 hours"
 
 
-# ─────────────────── In-memory Cache ───────────────────
+# ─────────────────── Rule fast path (no LLM) ───────────────────
+# Deterministic pre-classifier.  Every sub-category gets weighted cues:
+#   • strong phrases hand-picked from real tickets (weight 0.7);
+#   • the multi-word example phrases of its taxonomy description (0.55);
+#   • its PRE_TRIAGE_KEYWORDS (0.3 — single words are weak evidence).
+# A sub-category's score combines its distinct matched cues noisy-OR style
+# (1 - Π(1 - w)); confidence is the best score minus half the runner-up,
+# so emails that look like two sub-categories fall through to the LLM.
+# Rules never downgrade: if any cue of a more urgent tier matched, the
+# LLM decides.  The default 0.75 threshold asks for two independent cues
+# with at least one specific phrase (strong + keyword = 0.79, two
+# taxonomy phrases = 0.80); any single cue, or keywords alone (three =
+# 0.66), is left to the LLM.  On the __main__ samples that answers 9 of
+# 12 by rule, all with the intended sub-category.
+
+_STRONG_WEIGHT, _TAXONOMY_WEIGHT, _KEYWORD_WEIGHT = 0.7, 0.55, 0.3
+
+FAST_PATH_PHRASES: dict[str, tuple[str, ...]] = {
+    "Security_Breach": (r"otp( code)? (that )?i (didn'?t|did not|never) request(ed)?",
+                        r"account (has been|was|is|got) (hacked|compromised)",
+                        r"login from (an? )?(unknown|unrecogni[sz]ed|new|strange) (device|location|ip)"),
+    "Fraud_Report": (r"card (ending in \d+ )?(was |has been |got )?stolen",
+                     r"(didn'?t|did not|never) (make|authori[sz]e) (this|these|that|a|the|any) (purchase|transaction|payment)s?"),
+    "Transaction_Failure_Critical": (r"(failed|declined|bounced) but (the )?(money|amount|funds) (was |were )?(deducted|debited)",
+                                     r"(not|never) (received|got) (my|the) refund",
+                                     r"refund (has )?(still )?not (been )?(received|credited)"),
+    "Account_Lockout": (r"locked out of (my )?account", r"account (has been |was |is )?frozen"),
+    "Billing_Error": (r"cancel+ed (my )?[\w ]{0,30}subscription[^.]{0,60}(charged|billed)",
+                      r"(charged|billed) (twice|two times)", r"still (being )?(charged|billed) after cancel"),
+    "Dispute_Initiation": (r"(want|like|need) to dispute", r"open a dispute", r"chargeback"),
+    "Feature_Malfunction": (r"app (keeps )?crash(es|ing)?", r"(button|page|screen|feature) (is )?not working"),
+    "KYC_Compliance": (r"(passport|document|id|selfie) (was |got |has been )?rejected", r"\bkyc\b"),
+    "General_Inquiry": (r"(what|which) (are )?(your|the) (current )?interest rates?",
+                        r"do you (support|offer)"),
+    "Statement_Request": (r"tax certificate", r"(send|email|need) (me )?(my|the) [\w ]{0,20}statements?"),
+    "Feedback_Feature_Request": (r"(add|introduce) (a )?dark mode", r"(just )?a (suggestion|feature request)"),
+    "Status_Check": (r"status of my", r"(delivery|application|transfer|refund) status",
+                     r"(where|when) (is|will) my (new )?(card|debit card|credit card)"),
+}
+assert set(FAST_PATH_PHRASES) == _VALID_SUBCATEGORIES, "fast-path phrases out of sync with taxonomy"
+
+
+def _taxonomy_phrases(description: str) -> list[str]:
+    """Multi-word example phrases of a sub-category description, as regexes."""
+    description = re.sub(r"NOTE:.*", "", description, flags=re.DOTALL)
+    description = re.sub(r"\([^)]*\)", "", description)
+    phrases = []
+    for part in re.split(r"[,.]", description):
+        words = part.lower().split()
+        if 2 <= len(words) <= 5:
+            phrases.append(r"\s+".join(re.escape(w) for w in words))
+    return phrases
 
-_cache: dict[str, UrgencyResult] = {}
+
+def _compile_rules() -> list[tuple[str, str, list[tuple[re.Pattern, float]]]]:
+    rules = []
+    for urgency, meta in URGENCY_TAXONOMY.items():
+        for sub, description in meta["subcategories"].items():
+            cues = [(p, _STRONG_WEIGHT) for p in FAST_PATH_PHRASES[sub]]
+            cues += [(p, _TAXONOMY_WEIGHT) for p in _taxonomy_phrases(description)]
+            cues += [(p, _KEYWORD_WEIGHT) for p in PRE_TRIAGE_KEYWORDS[sub]]
+            rules.append((urgency, sub, [(re.compile(r"\b" + p + r"\b", re.IGNORECASE), w) for p, w in cues]))
+    return rules
+
+
+_FAST_PATH_RULES = _compile_rules()
+
+# How urgency_classifier answered: rules, cache, local model, llm (or empty input)
+path_stats = {"rules": 0, "cache": 0, "local": 0, "llm": 0, "local_fallback": 0, "empty": 0}
+register_stats("urgency_paths", lambda: dict(path_stats))
+
+
+def rule_classify(text: str, min_confidence: float | None = None) -> UrgencyResult | None:
+    """
+    Classify ``text`` by the fast-path rules; None when the rules are not
+    confident enough (or disagree with a more urgent tier) and the LLM
+    should decide.
+    """
+    threshold = URGENCY_RULES_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    scored = []
+    for urgency, sub, cues in _FAST_PATH_RULES:
+        matched: dict[str, float] = {}
+        for pattern, weight in cues:
+            for m in pattern.finditer(text):
+                cue = m.group(0).lower()
+                matched[cue] = max(matched.get(cue, 0.0), weight)
+        if matched:
+            miss = 1.0
+            for weight in matched.values():
+                miss *= 1.0 - weight
+            scored.append((1.0 - miss, urgency, sub, sorted(matched)))
+    if not scored:
+        return None
+
+    scored.sort(key=lambda s: s[0], reverse=True)
+    score, urgency, sub, cues = scored[0]
+    runner_up = scored[1][0] if len(scored) > 1 else 0.0
+    confidence = score - runner_up / 2
+    if confidence < threshold:
+        return None
+    if any(_URGENCY_RANK[other] < _URGENCY_RANK[urgency] for _, other, _, _ in scored[1:]):
+        return None
+    return {
+        "urgency": urgency,
+        "subcategory": sub,
+        "confidence": round(confidence, 2),
+        "reasoning": f"Rule match: {', '.join(repr(c) for c in cues[:3])}.",
+        "sla": URGENCY_TAXONOMY[urgency]["sla"],
+    }
+
+
+# ─────────────────── Caches ───────────────────
+# Bounded in-memory LRU in front of the durable llm_cache table, which
+# survives restarts and is shared by workers; the prompt hash versions it.
+
+_cache = BoundedCache("urgency")
+_store = PersistentCache("urgency", MODEL, prompt_version(SYSTEM_PROMPT))
+# Concurrent misses for the same email share one API call
+_flight = SingleFlight("single_flight:urgency")
 
 
 def _cache_key(text: str) -> str:
@@ -287,49 +517,100 @@ def _parse_response(raw: str) -> UrgencyResult:
 
 # ─────────────────── Public API ───────────────────
 
-def classify_urgency(email_text: str) -> UrgencyResult:
-    """
-    Classify the urgency of a finance support email.
+def _request(clean: str) -> dict:
+    """chat.completions.create() arguments for one classification."""
+    return dict(
+        model=MODEL,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Classify this customer email:\n\n{clean}"},
+        ],
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
+        stream=False,
+    )
 
-    Returns a dict with keys: urgency, subcategory, confidence, reasoning, sla.
-    Uses 3-tier taxonomy with 12 sub-categories for precise triage.
-    Falls back to Medium urgency on any error.
-    """
+
+def _prepare(email_text: str) -> tuple[str, str, UrgencyResult | None]:
+    """(LLM input, cache key, ready result) — the result is set for empty input or a cache hit."""
     if not email_text or not email_text.strip():
-        return {**_FALLBACK, "reasoning": "Empty email body — defaulted to Medium."}
+        path_stats["empty"] += 1
+        return "", "", {**_FALLBACK, "reasoning": "Empty email body — defaulted to Medium."}
 
-    clean = email_text.strip()
+    clean = trim_for_llm(email_text.strip())
     key = _cache_key(clean)
 
     # ── Cache hit → instant return ──
-    if key in _cache:
+    cached = _cache.get(key)
+    if cached is not None:
         logger.debug("Urgency cache hit for key=%s", key[:12])
-        return _cache[key]
+        path_stats["cache"] += 1
+        return clean, key, cached
+
+    # ── Unambiguous by rule → no API call ──
+    if URGENCY_RULES_ENABLED:
+        ruled = rule_classify(clean)
+        if ruled is not None:
+            logger.debug("Urgency rule hit → %s / %s (%.2f)", ruled["urgency"], ruled["subcategory"], ruled["confidence"])
+            path_stats["rules"] += 1
+            return clean, key, ruled
+
+    # ── Local model (URGENCY_BACKEND=local / hybrid) ──
+    if URGENCY_BACKEND in ("local", "hybrid"):
+        local = _local_result(clean)
+        if local is not None and (
+            URGENCY_BACKEND == "local" or local["confidence"] >= LOCAL_CLASSIFIER_MIN_CONFIDENCE
+        ):
+            path_stats["local"] += 1
+            return clean, key, local
+    return clean, key, None
+
+
+def _local_result(clean: str) -> UrgencyResult | None:
+    """The trained local model's answer, or None when no model is available."""
+    model = get_local_model()
+    if model is None:
+        if URGENCY_BACKEND != "groq":
+            logger.debug("URGENCY_BACKEND=%s but no local model is available", URGENCY_BACKEND)
+        return None
+    try:
+        return model.classify(clean)
+    except Exception as exc:
+        logger.warning("Local urgency model failed: %s", exc)
+        return None
+
 
-    # ── API call ──
-    t0 = time.perf_counter()
+def _stored(key: str) -> UrgencyResult | None:
+    """Result from the durable cache, promoted into the in-memory one."""
+    stored = _store.get(key)
+    if stored is not None:
+        _cache.set(key, stored)
+        path_stats["cache"] += 1
+    return stored
+
+
+def _finish(key: str, t0: float, response=None, exc: Exception | None = None, clean: str = "") -> UrgencyResult:
+    """Parse the API response (or map the API error to the local model / fallback), log and cache."""
+    cacheable = durable = True
     try:
-        client = _get_client()
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": f"Classify this customer email:\n\n{clean}"},
-            ],
-            temperature=TEMPERATURE,
-            max_tokens=MAX_TOKENS,
-            stream=False,
-        )
+        if exc is not None:
+            raise exc
         raw = response.choices[0].message.content or ""
         result = _parse_response(raw)
 
-    except json.JSONDecodeError as exc:
-        logger.warning("Urgency classifier JSON parse error: %s", exc)
-        result = {**_FALLBACK, "reasoning": f"JSON parse error — defaulted to Medium. ({exc})"}
+    except json.JSONDecodeError as err:
+        logger.warning("Urgency classifier JSON parse error: %s", err)
+        result = {**_FALLBACK, "reasoning": f"JSON parse error — defaulted to Medium. ({err})"}
+        durable = False  # don't pin a fallback across restarts
 
-    except Exception as exc:
-        logger.warning("Urgency classifier API error: %s", exc)
-        result = {**_FALLBACK, "reasoning": f"API error — defaulted to Medium. ({type(exc).__name__})"}
+    except Exception as err:
+        logger.warning("Urgency classifier API error: %s", err)
+        result = _local_result(clean) if clean else None
+        if result is not None:
+            path_stats["local_fallback"] += 1  # Groq down / rate-limited: triage keeps working
+        else:
+            result = {**_FALLBACK, "reasoning": f"API error — defaulted to Medium. ({type(err).__name__})"}
+        cacheable = False  # transient (e.g. rate limit) — classify again next time
 
     elapsed_ms = (time.perf_counter() - t0) * 1000
     logger.info(
@@ -338,10 +619,76 @@ def classify_urgency(email_text: str) -> UrgencyResult:
     )
 
     # ── Cache store ──
-    _cache[key] = result
+    if cacheable:
+        _cache.set(key, result)
+    if cacheable and durable:
+        _store.set(key, dict(result))
     return result
 
 
+def classify_urgency(email_text: str) -> UrgencyResult:
+    """
+    Classify the urgency of a finance support email.
+
+    Returns a dict with keys: urgency, subcategory, confidence, reasoning, sla.
+    Uses 3-tier taxonomy with 12 sub-categories for precise triage.
+    Falls back to Medium urgency on any error.
+    """
+    clean, key, ready = _prepare(email_text)
+    if ready is None:
+        ready = _stored(key)
+    if ready is not None:
+        return ready
+
+    # ── API call (one per key at a time) ──
+    def _call() -> UrgencyResult:
+        hit = _cache.get(key)  # a call for this key may have finished meanwhile
+        if hit is not None:
+            return hit
+        path_stats["llm"] += 1
+        t0 = time.perf_counter()
+        try:
+            client = _get_client()
+            response = scheduler.run(
+                MODEL,
+                lambda: client.chat.completions.create(**_request(clean)),
+                est_tokens=_PROMPT_TOKENS + estimate_tokens(clean, MAX_TOKENS // 2),
+            )
+        except Exception as exc:
+            return _finish(key, t0, exc=exc, clean=clean)
+        return _finish(key, t0, response)
+
+    return _flight.do(key, _call)
+
+
+async def aclassify_urgency(email_text: str) -> UrgencyResult:
+    """Async classify_urgency() over AsyncGroq; same cache, fallback and budget."""
+    clean, key, ready = _prepare(email_text)
+    if ready is None:
+        ready = await asyncio.to_thread(_stored, key)
+    if ready is not None:
+        return ready
+
+    async def _call() -> UrgencyResult:
+        hit = _cache.get(key)
+        if hit is not None:
+            return hit
+        path_stats["llm"] += 1
+        t0 = time.perf_counter()
+        try:
+            client = _get_async_client()
+            response = await scheduler.arun(
+                MODEL,
+                lambda: client.chat.completions.create(**_request(clean)),
+                est_tokens=_PROMPT_TOKENS + estimate_tokens(clean, MAX_TOKENS // 2),
+            )
+        except Exception as exc:
+            return _finish(key, t0, exc=exc, clean=clean)
+        return await asyncio.to_thread(_finish, key, t0, response)  # may write llm_cache
+
+    return await _flight.ado(key, _call)
+
+
 # ─────────────────── Helper: Map subcategory → parent category ───────────────────
 
 _SUBCAT_TO_PARENT_CATEGORY = {
@@ -18,6 +18,7 @@ import plotly.express as px
 #  CONFIG
 # ═══════════════════════════════════════════════════════
 API = os.environ.get("API_BASE_URL", "http://127.0.0.1:8000")
+FETCH_JOB_MAX_MISSES = 5   # failed progress polls (2s apart) before giving up on a fetch job
 
 st.set_page_config(
     page_title="Finance Triage",
@@ -34,6 +35,9 @@ for k, v in {
     "tickets": [],
     "all_tickets": [],
     "fetch_res": None,
+    "fetch_job": None,
+    "fetch_job_misses": 0,
+    "fetch_err": None,
     "tab": "dashboard",
     "page": "main",
     "read_ids": set(),
@@ -711,6 +715,16 @@ def _fetch_tickets(status: str = "All"):
         return []
 
 
+def _api_get_ticket(tid: str):
+    """Single ticket; the backend writes a missing (DRAFT_MODE=lazy) draft first."""
+    try:
+        r = requests.get(f"{API}/tickets/{tid}", timeout=60)
+        r.raise_for_status()
+        return r.json()
+    except Exception:
+        return None
+
+
 def _api_approve(tid: str):
     try:
         r = requests.post(f"{API}/approve_ticket/{tid}", timeout=30)
@@ -741,14 +755,15 @@ def _api_mark_read(tid: str):
 
 
 def _api_fetch_emails(include_read: bool = False, max_emails: int = 5):
+    """Start a background fetch; returns the job id (poll with _api_fetch_job)."""
     try:
         r = requests.post(
             f"{API}/fetch_emails",
             params={"include_read": include_read, "max_emails": max_emails},
-            timeout=600,
+            timeout=30,
         )
         r.raise_for_status()
-        return r.json()
+        return r.json().get("job_id")
     except requests.ConnectionError:
         st.error("Cannot connect to the backend API.")
         return None
@@ -757,6 +772,18 @@ def _api_fetch_emails(include_read: bool = False, max_emails: int = 5):
         return None
 
 
+def _api_fetch_job(job_id: str):
+    """Progress of a background fetch (None if the backend is unreachable)."""
+    try:
+        r = requests.get(f"{API}/jobs/{job_id}", timeout=10)
+        if r.status_code == 404:
+            return {"status": "not_found", "error": "The backend no longer knows this fetch job."}
+        r.raise_for_status()
+        return r.json()
+    except Exception:
+        return None
+
+
 def _api_dashboard_metrics():
     """Fetch enterprise dashboard metrics from the backend."""
     try:
@@ -899,10 +926,53 @@ if st.session_state.page == "fetch":
 
     bc, _ = st.columns([1, 2])
     with bc:
-        if st.button("Fetch Emails Now", type="primary", use_container_width=True):
-            with st.spinner("Connecting to Gmail and processing emails…"):
-                result = _api_fetch_emails(include_read=include_read, max_emails=max_emails)
-            st.session_state.fetch_res = result
+        if st.button("Fetch Emails Now", type="primary", use_container_width=True,
+                     disabled=st.session_state.fetch_job is not None):
+            st.session_state.fetch_job = _api_fetch_emails(include_read=include_read, max_emails=max_emails)
+            st.session_state.fetch_job_misses = 0
+            st.session_state.fetch_res = None
+            st.session_state.fetch_err = None
+
+    if st.session_state.fetch_err:
+        st.error(st.session_state.fetch_err)
+
+    # ── Background fetch in flight: poll its progress every 2s ──
+    if st.session_state.fetch_job:
+        job = _api_fetch_job(st.session_state.fetch_job)
+        if job is None:
+            st.session_state.fetch_job_misses += 1
+        else:
+            st.session_state.fetch_job_misses = 0
+        if job is None and st.session_state.fetch_job_misses >= FETCH_JOB_MAX_MISSES:
+            # Backend unreachable: stop polling and re-enable the button
+            st.session_state.fetch_job = None
+            st.session_state.fetch_err = "Lost contact with the backend while fetching emails — try again."
+            st.rerun()
+        elif job and job["status"] == "not_found":
+            st.session_state.fetch_job = None
+            st.session_state.fetch_err = f"Email fetch failed: {job['error']}"
+            st.rerun()
+        elif job and job["status"] in ("completed", "failed"):
+            st.session_state.fetch_job = None
+            if job["status"] == "completed":
+                st.session_state.fetch_res = job["result"]
+            else:
+                st.session_state.fetch_err = f"Email fetch failed: {job.get('error')}"
+            st.rerun()
+        else:
+            st_autorefresh(interval=2_000, limit=None, key="fetch_job_poll")
+            total = (job or {}).get("total")
+            done = (job or {}).get("processed", 0)
+            label = (
+                f"Processing emails… {done}/{total}" if total
+                else "Connecting to Gmail and selecting emails…"
+            )
+            st.progress(done / total if total else 0.0, text=label)
+            created = len((job or {}).get("tickets", []))
+            if created:
+                st.caption(f"{created} ticket(s) created so far")
+            for e in (job or {}).get("emails", []):
+                st.caption(f"{e.get('state', '')} · {e.get('subject', '')[:80]}")
 
     result = st.session_state.fetch_res
     if result:
@@ -1017,8 +1087,15 @@ def _render_detail(ticket: dict, key_prefix: str = "d"):
     st.markdown(f"**{_icon('file-text', '#4f46e5', 15)} Summary:** {ticket.get('summary', 'N/A')}", unsafe_allow_html=True)
 
     st.markdown(f'<div class="section-hdr">{_icon("edit-3", "#4f46e5", 15)} Draft Response</div>', unsafe_allow_html=True)
+    _dr = ticket.get("draft_response") or st.session_state.get(f"draft_src_{tid}")
+    if not _dr and _st in ("New", "Open", "In Progress"):
+        with st.spinner("Drafting reply…"):
+            _full = _api_get_ticket(tid)
+        _dr = (_full or {}).get("draft_response") or ""
+        if _dr:
+            st.session_state[f"draft_src_{tid}"] = _dr
     draft = st.text_area(
-        "draft", value=ticket.get("draft_response", ""),
+        "draft", value=_dr or "",
         height=170, key=f"draft_{kp}_{tid}", label_visibility="collapsed",
     )
     if _st in ("New", "Open", "In Progress"):
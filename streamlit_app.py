@@ -118,6 +118,10 @@ def _get_conn() -> sqlite3.Connection:
     conn.execute("PRAGMA journal_mode=WAL")
     return conn
 
+def _content_sha256(text: str) -> str:
+    """Dedup hash of a ticket's text (same normalisation as the backend)."""
+    return hashlib.sha256(text.replace("\r\n", "\n").strip().encode("utf-8")).hexdigest()
+
 def _init_db():
     conn = _get_conn()
     conn.execute("""
@@ -141,6 +145,42 @@ def _init_db():
     conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_priority ON tickets (priority)")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_category ON tickets (category)")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_created_at ON tickets (created_at DESC)")
+
+    # Dedup keys: Message-ID + content hash with unique indexes
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(tickets)")}
+    if "message_id" not in cols:
+        conn.execute("ALTER TABLE tickets ADD COLUMN message_id TEXT")
+    if "content_sha256" not in cols:
+        conn.execute("ALTER TABLE tickets ADD COLUMN content_sha256 TEXT")
+        taken = set()
+        rows = conn.execute("SELECT id, email_body FROM tickets ORDER BY created_at").fetchall()
+        for tid, body in rows:
+            digest = _content_sha256(body or "")
+            if digest not in taken:  # older copies of a duplicate stay NULL
+                conn.execute("UPDATE tickets SET content_sha256 = ? WHERE id = ?", (digest, tid))
+                taken.add(digest)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_tickets_message_id ON tickets (message_id)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_tickets_content_sha256 ON tickets (content_sha256)")
+
+    # Durable ingestion jobs: parsed → analysed → saved, resumed after a restart
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ingestion_jobs (
+            id              TEXT PRIMARY KEY,
+            source_key      TEXT NOT NULL UNIQUE,
+            state           TEXT NOT NULL DEFAULT 'parsed',
+            subject         TEXT,
+            sender          TEXT,
+            full_text       TEXT NOT NULL,
+            message_id      TEXT,
+            analysis_json   TEXT,
+            ticket_id       TEXT,
+            attempts        INTEGER NOT NULL DEFAULT 0,
+            last_error      TEXT,
+            created_at      TEXT NOT NULL DEFAULT (datetime('now')),
+            updated_at      TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_state ON ingestion_jobs (state)")
     conn.commit()
     conn.close()
 
@@ -155,8 +195,9 @@ def db_insert_ticket(data: dict) -> str:
     conn.execute(
         """INSERT INTO tickets
            (id, customer_name, email_body, status, priority, category,
-            sentiment, intent, summary, transaction_id, amount, draft_response, created_at)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))""",
+            sentiment, intent, summary, transaction_id, amount, draft_response,
+            message_id, content_sha256, created_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))""",
         (
             tid,
             data.get("customer_name", "Unknown"),
@@ -170,6 +211,8 @@ def db_insert_ticket(data: dict) -> str:
             data.get("transaction_id"),
             data.get("amount"),
             data.get("draft_response"),
+            data.get("message_id"),
+            _content_sha256(data.get("email_body", "")),
         ),
     )
     conn.commit()
@@ -199,12 +242,61 @@ def db_update_status(tid: str, status: str):
     conn.commit()
     conn.close()
 
-def db_email_body_exists(email_body: str) -> bool:
+def db_ticket_exists(email_body: str, message_id: str | None = None) -> bool:
+    """Index probe on the Message-ID / content-hash dedup keys."""
     conn = _get_conn()
-    row = conn.execute("SELECT 1 FROM tickets WHERE email_body = ?", (email_body,)).fetchone()
+    row = conn.execute(
+        "SELECT 1 FROM tickets WHERE content_sha256 = ? OR (? IS NOT NULL AND message_id = ?)",
+        (_content_sha256(email_body), message_id, message_id),
+    ).fetchone()
     conn.close()
     return row is not None
 
+JOB_MAX_ATTEMPTS = 3
+
+def db_job_enqueue(full_text: str, subject: str, sender: str, message_id: str | None) -> dict:
+    """Insert a 'parsed' job (or return the existing one for the same email)."""
+    source_key = message_id or _content_sha256(full_text)
+    conn = _get_conn()
+    conn.execute(
+        """INSERT OR IGNORE INTO ingestion_jobs (id, source_key, subject, sender, full_text, message_id)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        (str(uuid.uuid4()), source_key, subject, sender, full_text, message_id),
+    )
+    conn.commit()
+    row = conn.execute("SELECT * FROM ingestion_jobs WHERE source_key = ?", (source_key,)).fetchone()
+    conn.close()
+    return dict(row)
+
+def db_jobs_unfinished(limit: int) -> list[dict]:
+    """Jobs a previous run left half-done (crash, rate limit, error)."""
+    conn = _get_conn()
+    rows = conn.execute(
+        """SELECT * FROM ingestion_jobs
+           WHERE state IN ('parsed', 'analysed') AND attempts < ?
+           ORDER BY created_at LIMIT ?""",
+        (JOB_MAX_ATTEMPTS, limit),
+    ).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+def db_job_update(job_id: str, **fields):
+    conn = _get_conn()
+    cols = ", ".join(f"{k} = ?" for k in fields)
+    conn.execute(
+        f"UPDATE ingestion_jobs SET {cols}, updated_at = datetime('now') WHERE id = ?",
+        (*fields.values(), job_id),
+    )
+    conn.commit()
+    conn.close()
+
+def db_job_fail(job: dict, error: str):
+    attempts = (job.get("attempts") or 0) + 1
+    db_job_update(
+        job["id"], attempts=attempts, last_error=error[:2000],
+        state="failed" if attempts >= JOB_MAX_ATTEMPTS else job["state"],
+    )
+
 # ═══════════════════════════════════════════════════════
 #  AI AGENT  (Groq + LangChain)
 # ═══════════════════════════════════════════════════════
@@ -304,7 +396,9 @@ def analyze_and_draft(email_body: str) -> TicketAnalysisWithDraft:
     if not email_body or not email_body.strip():
         raise ValueError("email_body cannot be empty.")
 
-    clean = email_body.strip()
+    from email_trim import trim_for_llm  # backend/: drop quoted history + signatures
+
+    clean = trim_for_llm(email_body.strip())
     key = hashlib.sha256(clean.encode()).hexdigest()
 
     cache = st.session_state.analysis_cache
@@ -376,8 +470,8 @@ def send_reply_email(to_email: str, subject: str, body: str) -> bool:
 def fetch_emails_from_gmail(include_read: bool = False, max_emails: int = 5) -> dict:
     """Connect to Gmail via IMAP, pull emails, analyse + save."""
     import imaplib
-    import email as email_lib
     from email.header import decode_header as _decode_header
+    from mime_text import extract_message  # backend/: streams text, skips attachments
 
     if not EMAIL_USER or not EMAIL_PASSWORD:
         return {"fetched": 0, "errors": 1, "error_details": ["EMAIL_USER / EMAIL_PASSWORD not set."], "tickets": [], "message": "Credentials missing."}
@@ -395,31 +489,6 @@ def fetch_emails_from_gmail(include_read: bool = False, max_emails: int = 5) ->
                 parts.append(part)
         return " ".join(parts)
 
-    def _extract_body(msg):
-        body = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                ct = part.get_content_type()
-                cd = str(part.get("Content-Disposition", ""))
-                if "attachment" in cd:
-                    continue
-                if ct == "text/plain":
-                    payload = part.get_payload(decode=True)
-                    if payload:
-                        body = payload.decode(part.get_content_charset() or "utf-8", errors="replace")
-                        break
-                elif ct == "text/html" and not body:
-                    payload = part.get_payload(decode=True)
-                    if payload:
-                        html = payload.decode(part.get_content_charset() or "utf-8", errors="replace")
-                        body = re.sub(r"<[^>]+>", " ", html)
-                        body = re.sub(r"\s+", " ", body).strip()
-        else:
-            payload = msg.get_payload(decode=True)
-            if payload:
-                body = payload.decode(msg.get_content_charset() or "utf-8", errors="replace")
-        return body.strip()
-
     try:
         mail = imaplib.IMAP4_SSL("imap.gmail.com", 993)
         mail.login(EMAIL_USER, EMAIL_PASSWORD)
@@ -444,63 +513,100 @@ def fetch_emails_from_gmail(include_read: bool = False, max_emails: int = 5) ->
         errors = []
         skipped_dupes = 0
 
+        def _run_job(job: dict):
+            """Advance one job parsed → analysed → saved; returns the result row."""
+            if job["state"] == "analysed":
+                analysis = TicketAnalysisWithDraft.model_validate_json(job["analysis_json"])
+            else:
+                analysis = analyze_and_draft(job["full_text"])
+                db_job_update(job["id"], state="analysed", analysis_json=analysis.model_dump_json())
+            sender = job["sender"] or ""
+            if db_ticket_exists(job["full_text"], job["message_id"]):
+                # Crashed between the ticket insert and the job update last time
+                db_job_update(job["id"], state="saved")
+                return None
+            tid = db_insert_ticket({
+                "customer_name": analysis.entities.customer_name or sender.split("<")[0].strip() or "Unknown",
+                "email_body": job["full_text"],
+                "status": "New",
+                "priority": analysis.priority.value,
+                "category": analysis.category.value,
+                "sentiment": analysis.sentiment.value,
+                "intent": analysis.intent,
+                "summary": analysis.summary,
+                "transaction_id": analysis.entities.transaction_id,
+                "amount": analysis.entities.amount,
+                "draft_response": analysis.draft_response,
+                "message_id": job["message_id"],
+            })
+            db_job_update(job["id"], state="saved", ticket_id=tid)
+            return {
+                "ticket_id": tid,
+                "subject": job["subject"],
+                "sender": sender,
+                "priority": analysis.priority.value,
+                "category": analysis.category.value,
+            }
+
+        def _is_rate_limit(err: Exception) -> bool:
+            err_str = str(err)
+            return "429" in err_str or "rate_limit" in err_str.lower() or "quota" in err_str.lower()
+
+        def _quota_response():
+            mail.close(); mail.logout()
+            return {
+                "fetched": len(results), "errors": len(errors) + 1,
+                "skipped_duplicates": skipped_dupes, "tickets": results,
+                "error_details": ["Groq API rate limit reached. Wait 1-2 min."],
+                "message": f"Processed {len(results)} before rate limit.", "quota_error": True,
+            }
+
+        # ── Resume jobs a previous run left unfinished ──
+        resumed = db_jobs_unfinished(max_emails)
+        for job in resumed:
+            try:
+                row = _run_job(job)
+                if row:
+                    results.append(row)
+            except Exception as e:
+                if _is_rate_limit(e):
+                    return _quota_response()
+                db_job_fail(job, str(e))
+                errors.append(str(e))
+        email_ids = email_ids[len(resumed):] if resumed else email_ids
+
         for eid in email_ids:
             try:
                 st_fetch, msg_data = mail.fetch(eid, "(RFC822)")
                 if st_fetch != "OK":
                     continue
-                raw = msg_data[0][1]
-                msg = email_lib.message_from_bytes(raw)
+                msg, body = extract_message(msg_data[0][1])
                 subject = _decode_hdr(msg.get("Subject", "(No Subject)"))
                 sender = _decode_hdr(msg.get("From", "(Unknown)"))
-                body = _extract_body(msg)
                 if not body or len(body.strip()) < 10:
                     mail.store(eid, "+FLAGS", "\\Seen")
                     continue
                 full_text = f"From: {sender}\nSubject: {subject}\n\n{body}"
+                message_id = (msg.get("Message-ID") or "").strip() or None
 
-                if db_email_body_exists(full_text):
+                if db_ticket_exists(full_text, message_id):
                     skipped_dupes += 1
                     mail.store(eid, "+FLAGS", "\\Seen")
                     continue
 
+                job = db_job_enqueue(full_text, subject, sender, message_id)
+                if job["state"] not in ("parsed", "analysed"):
+                    continue  # saved already, or failed too often
                 try:
-                    combined = analyze_and_draft(full_text)
-                    analysis = combined
-                    draft = combined.draft_response
+                    row = _run_job(job)
+                    if row:
+                        results.append(row)
                 except Exception as ai_err:
-                    err_str = str(ai_err)
-                    if "429" in err_str or "rate_limit" in err_str.lower() or "quota" in err_str.lower():
-                        mail.close(); mail.logout()
-                        return {
-                            "fetched": len(results), "errors": len(errors) + 1,
-                            "skipped_duplicates": skipped_dupes, "tickets": results,
-                            "error_details": ["Groq API rate limit reached. Wait 1-2 min."],
-                            "message": f"Processed {len(results)} before rate limit.", "quota_error": True,
-                        }
+                    if _is_rate_limit(ai_err):
+                        return _quota_response()
+                    db_job_fail(job, str(ai_err))
                     raise
-
-                tid = db_insert_ticket({
-                    "customer_name": analysis.entities.customer_name or sender.split("<")[0].strip() or "Unknown",
-                    "email_body": full_text,
-                    "status": "New",
-                    "priority": analysis.priority.value,
-                    "category": analysis.category.value,
-                    "sentiment": analysis.sentiment.value,
-                    "intent": analysis.intent,
-                    "summary": analysis.summary,
-                    "transaction_id": analysis.entities.transaction_id,
-                    "amount": analysis.entities.amount,
-                    "draft_response": draft,
-                })
                 mail.store(eid, "+FLAGS", "\\Seen")
-                results.append({
-                    "ticket_id": tid,
-                    "subject": subject,
-                    "sender": sender,
-                    "priority": analysis.priority.value,
-                    "category": analysis.category.value,
-                })
             except Exception as e:
                 errors.append(str(e))
                 continue